@@ -1,9 +1,17 @@
 import os
 import math
-import tempfile
+import json
+import base64
+import glob
+import hashlib
+import mimetypes
+from urllib.parse import quote
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, abort, Response
+from flask import make_response, session
+from werkzeug.security import safe_join
+from PIL import Image
 from flask_login import LoginManager, current_user, login_required, login_user, logout_user
 from werkzeug.security import generate_password_hash
 import secrets
@@ -11,26 +19,47 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-from db import init_db, get_conn
+from db import init_app, get_conn, geracao_atual
+from migrations import migrate, verificar_schema
+from cache import cache, cached, variantes, pdfs, usuarios
 from models import User, Manutencao
 from auth import auth_bp
 from services import (
     salvar_checklist,
     listar_historico,
     obter_registro,
-    gerar_pdf_registro,
+    obter_registros,
+    pdf_registro,
+    nome_pdf,
+    formatar_data,
+    gerar_variante,
+    filtro_veiculos,
+    resumo_dashboard,
+    status_oleo,
     ITENS_CARRO,
     ITENS_MOTO,
-    limpar_arquivos_orfaos
 )
-from config import ANEXOS_DIR, MAIL_SERVER, MAIL_PORT, MAIL_USERNAME, MAIL_PASSWORD, MAIL_DEFAULT_SENDER, SECRET_KEY
-
-# Inicializa DB (cria tabelas e índices)
-init_db()
+import gc_anexos
+import exportacao
+import importacao
+import eventos
+from config import ANEXOS_DIR, MAIL_SERVER, MAIL_PORT, MAIL_USERNAME, MAIL_PASSWORD, MAIL_DEFAULT_SENDER, SECRET_KEY, DASHBOARD_MESES, OLEO_INTERVALO_KM
+from config import UPLOADS_ACCEL, UPLOADS_ACCEL_PREFIX, UPLOADS_MAX_AGE
+from config import IMAGEM_LARGURAS_SOB_DEMANDA, VARIANTES_DIR, UPLOADS_ACCEL_VARIANTES_PREFIX
+
+# O schema é migrado uma única vez antes dos workers (gunicorn.conf.py) ou com
+# `python migrations.py`; aqui apenas conferimos a versão.
+if __name__ == "__main__":
+    # execução direta (desenvolvimento): aplica migrações pendentes
+    migrate()
+verificar_schema()
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.secret_key = os.environ.get("SECRET_KEY", "troque-esta-chave")
 
+# Conexão SQLite por requisição (devolvida ao pool no teardown)
+init_app(app)
+
 # Configuração do Flask-Login
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
@@ -68,7 +97,8 @@ def send_email(subject, recipient, html_content):
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.get(user_id)
+    # cache por worker, invalidado pelas escritas em User (ver cache.usuarios)
+    return User.get_cached(user_id)
 
 # Registrar Blueprint de autenticação
 app.register_blueprint(auth_bp, url_prefix='/')
@@ -82,55 +112,83 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Versão do código/templates: entra no ETag das páginas para que um deploy não
+# responda 304 com HTML antigo (igual em todos os workers)
+_VERSAO_CODIGO = max(
+    os.path.getmtime(arquivo)
+    for arquivo in glob.glob(os.path.join(app.root_path, "*.py"))
+    + glob.glob(os.path.join(app.root_path, app.template_folder, "**", "*.html"), recursive=True)
+)
+
+def condicional(f):
+    """
+    GET condicional para páginas e APIs que só dependem do banco: o ETag combina a
+    geração de escrita (meta.geracao), usuário, dia, rota e parâmetros. Se o
+    cliente já tem essa versão, responde 304 sem executar a view (e suas consultas).
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get("_flashes"):
+            # mensagens pendentes são consumidas pela renderização
+            return f(*args, **kwargs)
+        chave = json.dumps([
+            geracao_atual(), _VERSAO_CODIGO, current_user.get_id(), datetime.now().strftime("%Y-%m-%d"),
+            request.endpoint, kwargs, sorted(request.args.items(multi=True)),
+        ], default=str)
+        etag = hashlib.sha1(chave.encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            resp = make_response(f(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+        resp.set_etag(etag)
+        # o navegador guarda, mas sempre revalida (e só recebe o corpo se mudou)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+    return decorated_function
+
+# larguras aceitas por /uploads/<nome>?w= (usadas no srcset de fotos sem versões geradas)
+app.jinja_env.globals["larguras_sob_demanda"] = IMAGEM_LARGURAS_SOB_DEMANDA
+
 @app.context_processor
 def inject_year():
     return {"current_year": datetime.now().year}
 
+# Formatação de datas para exibição (o banco guarda ISO-8601)
+@app.template_filter("data_br")
+def data_br_filter(valor, fmt="%d/%m/%Y %H:%M"):
+    return formatar_data(valor, fmt)
+
+@app.template_filter("mes_br")
+def mes_br_filter(valor):
+    # 'aaaa-mm' -> 'mm/aaaa'
+    return f"{valor[5:7]}/{valor[:4]}" if valor else ""
+
 @app.route("/")
 def home():
     return redirect(url_for("dashboard"))
 
 @app.route("/dashboard")
 @login_required
+@condicional
 def dashboard():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM veiculos")
-    total_checklists = cur.fetchone()[0] or 0
-    cur.execute("SELECT COUNT(*) FROM veiculos WHERE tipo='Carro'")
-    total_carros = cur.fetchone()[0] or 0
-    cur.execute("SELECT COUNT(*) FROM veiculos WHERE tipo='Moto'")
-    total_motos = cur.fetchone()[0] or 0
-    cur.execute("""
-        SELECT COUNT(*) FROM itens_checklist
-        WHERE status='Danificado' OR status IN ('Desgastado','Calibrar','Baixo','Alto')
-    """)
-    total_criticos = cur.fetchone()[0] or 0
-
-    cur.execute("""
-        SELECT substr(data, 4, 2) || '/' || substr(data, 7, 4) as mes, COUNT(*) as qtd
-        FROM veiculos
-        WHERE data IS NOT NULL AND data <> ''
-        GROUP BY mes
-        ORDER BY substr(data, 7, 4) ASC, substr(data, 4, 2) ASC
-    """)
-    meses_rows = cur.fetchall()
-    meses_labels = [r[0] for r in meses_rows]
-    meses_data = [r[1] for r in meses_rows]
-
-    cur.execute("""
-        SELECT nome_item, COUNT(*) as qtd
-        FROM itens_checklist
-        WHERE status='Danificado' OR status IN ('Desgastado','Calibrar','Baixo','Alto')
-        GROUP BY nome_item
-        ORDER BY qtd DESC
-        LIMIT 5
-    """)
-    criticos_rows = cur.fetchall()
-    criticos_labels = [r[0] for r in criticos_rows]
-    criticos_data = [r[1] for r in criticos_rows]
-
-    conn.close()
+    # Últimos N meses do gráfico mensal
+    hoje = datetime.now()
+    inicio = datetime(hoje.year, hoje.month, 1)
+    for _ in range(DASHBOARD_MESES - 1):
+        inicio = (inicio - timedelta(days=1)).replace(day=1)
+    resumo = resumo_dashboard(inicio.strftime("%Y-%m"))
+
+    total_checklists = resumo["total_checklists"]
+    total_carros = resumo["total_carros"]
+    total_motos = resumo["total_motos"]
+    total_criticos = resumo["total_criticos"]
+    meses_labels = [m for m, _ in resumo["meses"]]
+    meses_data = [q for _, q in resumo["meses"]]
+    criticos_labels = [n for n, _ in resumo["top_criticos"]]
+    criticos_data = [q for _, q in resumo["top_criticos"]]
+
     return render_template("dashboard.html",
         total_checklists=total_checklists,
         total_carros=total_carros,
@@ -139,7 +197,9 @@ def dashboard():
         meses_labels=meses_labels,
         meses_data=meses_data,
         criticos_labels=criticos_labels,
-        criticos_data=criticos_data
+        criticos_data=criticos_data,
+        meses_janela=DASHBOARD_MESES,
+        ultimo_evento=resumo["ultimo_evento"]
     )
 
 @app.route("/index")
@@ -177,6 +237,7 @@ def historico():
 
 @app.route("/detalhes/<int:veiculo_id>")
 @login_required
+@condicional
 def detalhes(veiculo_id):
     reg = obter_registro(veiculo_id)
     if not reg:
@@ -187,219 +248,389 @@ def detalhes(veiculo_id):
 @app.route("/pdf/<int:veiculo_id>")
 @login_required
 def pdf(veiculo_id):
-    reg = obter_registro(veiculo_id)
+    caminho, reg, versao = pdf_registro(veiculo_id)
     if not reg:
         flash("Registro não encontrado.", "error")
         return redirect(url_for("historico"))
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    tmp.close()
-    gerar_pdf_registro(reg, tmp.name)
-    filename = f"checklist_{reg.get('placa','sem_placa')}_{(reg.get('data') or '').replace('/','-')}.pdf"
-    return send_file(tmp.name, as_attachment=True, download_name=filename)
+    return send_file(caminho, as_attachment=True, download_name=nome_pdf(reg), etag=versao, conditional=True)
+
+def _etag_anexo(filename):
+    """
+    ETag forte derivado do nome: no store endereçado por conteúdo o nome já é o
+    sha256 (derivadas: '<sha256>_<tamanho>'); nomes legados são únicos por upload.
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if "/" in filename and len(stem) >= 64:
+        return stem
+    return hashlib.sha1(filename.encode()).hexdigest()
+
+
+def _responder_arquivo(caminho, etag, accel_uri):
+    """Resposta de arquivo imutável; com UPLOADS_ACCEL o servidor web entrega os bytes."""
+    if UPLOADS_ACCEL in ("nginx", "sendfile"):
+        # o worker só monta os cabeçalhos (o servidor web trata Range)
+        resp = Response(mimetype=mimetypes.guess_type(caminho)[0] or "application/octet-stream")
+        resp.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            resp.status_code = 304
+        elif UPLOADS_ACCEL == "nginx":
+            resp.headers["X-Accel-Redirect"] = accel_uri
+        else:
+            resp.headers["X-Sendfile"] = caminho
+    else:
+        # conditional: 304 para If-None-Match/If-Modified-Since e respostas 206 para Range
+        resp = send_file(caminho, etag=etag, conditional=True, max_age=UPLOADS_MAX_AGE)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = UPLOADS_MAX_AGE
+    resp.cache_control.immutable = True
+    return resp
+
 
 @app.route("/uploads/<path:filename>")
 def uploads(filename):
-    return send_from_directory(ANEXOS_DIR, filename, as_attachment=False)
-
-# API com busca e paginação e contagem otimizada para críticos
-@app.route("/api/veiculos")
-@login_required
-def api_veiculos():
-    tipo = request.args.get("tipo")
-    criticos = request.args.get("criticos")
-    q = (request.args.get("q") or "").strip()
+    caminho = safe_join(ANEXOS_DIR, filename)
+    if caminho is None or filename.startswith("tmp/") or not os.path.isfile(caminho):
+        abort(404)
+    etag = _etag_anexo(filename)
+
+    # ?w=<px>&fmt=webp|jpeg: versão redimensionada sob demanda, guardada no cache LRU em disco
+    largura = request.args.get("w", type=int)
+    formato = request.args.get("fmt")
+    if largura is None and formato is None:
+        return _responder_arquivo(caminho, etag, UPLOADS_ACCEL_PREFIX + quote(filename))
+    formato = formato or "jpeg"
+    if largura not in IMAGEM_LARGURAS_SOB_DEMANDA or formato not in ("jpeg", "webp"):
+        abort(400)
+    ext = "jpg" if formato == "jpeg" else formato
     try:
-        page = max(1, int(request.args.get("page", 1)))
-    except ValueError:
-        page = 1
+        variante = variantes.obter(
+            f"{filename}:{largura}:{formato}",
+            lambda destino: gerar_variante(caminho, destino, largura, formato),
+            ext,
+        )
+    except (OSError, ValueError, Image.DecompressionBombError):
+        abort(415)
+    rel = os.path.relpath(variante, VARIANTES_DIR).replace(os.sep, "/")
+    return _responder_arquivo(variante, f"{etag}-{largura}-{ext}", UPLOADS_ACCEL_VARIANTES_PREFIX + rel)
+
+
+def _encode_cursor(pos):
+    raw = json.dumps(pos, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor):
+    """Decodifica o cursor opaco de /api/veiculos ('' = primeira página)."""
+    if not cursor:
+        return {}
     try:
-        per_page = max(5, min(100, int(request.args.get("per_page", 10))))
-    except ValueError:
-        per_page = 10
-
-    conn = get_conn()
-    cur = conn.cursor()
-
-    where_clauses = []
-    params = []
-
-    if tipo:
-        where_clauses.append("v.tipo = ?")
-        params.append(tipo)
-
-    if q:
-        where_clauses.append("(v.placa LIKE ? OR v.condutor LIKE ? OR v.modelo LIKE ?)")
-        like = f"%{q}%"
-        params.extend([like, like, like])
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        pos = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("cursor inválido") from e
+    if not isinstance(pos, dict):
+        raise ValueError("cursor inválido")
+    return pos
+
+@cached("api_veiculos_total")
+def _contar_veiculos(query, params):
+    cur = get_conn().cursor()
+    cur.execute(query, params)
+    return cur.fetchone()[0] or 0
+
+@cached("api_veiculos")
+def _consultar_veiculos(tipo=None, criticos=False, q="", page=1, per_page=10, cursor=None,
+                        with_total=False, data_ini=None, data_fim=None, oleo_alert=False):
+    """
+    Monta a resposta de /api/veiculos. `cursor` None usa o contrato page/per_page;
+    qualquer string (inclusive vazia) usa paginação keyset. ValueError = cursor inválido.
+    """
+    cur = get_conn().cursor()
+
+    from_sql, where_clauses, params, order_sql = filtro_veiculos(
+        tipo=tipo, criticos=criticos, q=q, data_ini=data_ini, data_fim=data_fim, oleo_alert=oleo_alert
+    )
 
     where_sql = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    count_query = f"SELECT COUNT(*) {from_sql} {where_sql}"
+    count_params = list(params)
 
-    # Conta total
-    if criticos == "1":
-        crit_query = f"""
-            SELECT COUNT(DISTINCT v.id) FROM veiculos v
-            {where_sql and 'WHERE ' + ' AND '.join(where_clauses) or ''}
-            AND EXISTS (
-                SELECT 1 FROM itens_checklist it
-                WHERE it.veiculo_id = v.id
-                AND (it.status = 'Danificado' OR it.status IN ('Desgastado','Calibrar','Baixo','Alto'))
-            )
-        """
-        # Ajuste: se where_sql vazio, crit_query terá 'AND EXISTS' sem WHERE; corrigimos montando condicionalmente
-        if where_clauses:
-            crit_query = f"""
-                SELECT COUNT(DISTINCT v.id) FROM veiculos v
-                WHERE {' AND '.join(where_clauses)}
-                AND EXISTS (
-                    SELECT 1 FROM itens_checklist it
-                    WHERE it.veiculo_id = v.id
-                    AND (it.status = 'Danificado' OR it.status IN ('Desgastado','Calibrar','Baixo','Alto'))
-                )
-            """
-            cur.execute(crit_query, params)
-        else:
-            crit_query = """
-                SELECT COUNT(DISTINCT v.id) FROM veiculos v
-                WHERE EXISTS (
-                    SELECT 1 FROM itens_checklist it
-                    WHERE it.veiculo_id = v.id
-                    AND (it.status = 'Danificado' OR it.status IN ('Desgastado','Calibrar','Baixo','Alto'))
-                )
-            """
-            cur.execute(crit_query)
-        total = cur.fetchone()[0] or 0
-
-        # Busca paginada veículos críticos
-        offset = (page - 1) * per_page
-        if where_clauses:
-            data_query = f"""
-                SELECT v.id, v.condutor, v.placa, v.modelo, v.data, v.quilometragem, v.tipo
-                FROM veiculos v
-                WHERE {' AND '.join(where_clauses)}
-                AND EXISTS (
-                    SELECT 1 FROM itens_checklist it
-                    WHERE it.veiculo_id = v.id
-                    AND (it.status = 'Danificado' OR it.status IN ('Desgastado','Calibrar','Baixo','Alto'))
-                )
-                ORDER BY v.id DESC
-                LIMIT ? OFFSET ?
-            """
-            cur.execute(data_query, params + [per_page, offset])
-        else:
-            data_query = """
-                SELECT v.id, v.condutor, v.placa, v.modelo, v.data, v.quilometragem, v.tipo
-                FROM veiculos v
-                WHERE EXISTS (
-                    SELECT 1 FROM itens_checklist it
-                    WHERE it.veiculo_id = v.id
-                    AND (it.status = 'Danificado' OR it.status IN ('Desgastado','Calibrar','Baixo','Alto'))
-                )
-                ORDER BY v.id DESC
-                LIMIT ? OFFSET ?
-            """
-            cur.execute(data_query, [per_page, offset])
-        rows = cur.fetchall()
-    else:
-        # total simples
-        count_query = f"SELECT COUNT(*) FROM veiculos {'WHERE ' + ' AND '.join(where_clauses) if where_clauses else ''}"
-        cur.execute(count_query, params)
-        total = cur.fetchone()[0] or 0
-        offset = (page - 1) * per_page
+    # Paginação: `cursor` (keyset, sem COUNT) ou o contrato antigo `page`/`per_page`
+    keyset = cursor is not None
+    ranked = order_sql.startswith("ORDER BY f.rank")
+    offset = (page - 1) * per_page
+
+    def _fetch(extra_clauses, extra_params, limit, offset=0):
+        clauses = where_clauses + extra_clauses
         data_query = f"""
-            SELECT id, condutor, placa, modelo, data, quilometragem, tipo
-            FROM veiculos
-            {where_sql}
-            ORDER BY id DESC
+            SELECT v.id, v.condutor, v.placa, v.modelo, v.criado_em, v.quilometragem, v.km, v.tipo,
+                   v.oleo_km, v.oleo_data, v.oleo_diff
+            {from_sql}
+            {("WHERE " + " AND ".join(clauses)) if clauses else ""}
+            {order_sql}
             LIMIT ? OFFSET ?
         """
-        cur.execute(data_query, params + [per_page, offset])
-        rows = cur.fetchall()
+        cur.execute(data_query, params + extra_params + [limit, offset])
+        return cur.fetchall()
+
+    # uma linha extra indica se existe próxima página
+    if keyset and not ranked:
+        last = _decode_cursor(cursor).get("k")
+        if last is not None and not (
+            isinstance(last, list) and len(last) == 2
+            and (last[0] is None or isinstance(last[0], str))
+            and isinstance(last[1], int) and not isinstance(last[1], bool)
+        ):
+            raise ValueError("cursor inválido")
+        rows = []
+        if last is None:
+            rows = _fetch(["v.criado_em IS NOT NULL"], [], per_page + 1)
+        elif last[0] is not None:
+            # seek em idx_veiculos_criado_em a partir da última linha vista
+            rows = _fetch(["(v.criado_em, v.id) < (?, ?)"], list(last), per_page + 1)
+        if len(rows) <= per_page:
+            # registros sem data vêm por último em ORDER BY ... DESC
+            if last is not None and last[0] is None:
+                rows += _fetch(["v.criado_em IS NULL", "v.id < ?"], [last[1]], per_page + 1)
+            else:
+                rows += _fetch(["v.criado_em IS NULL"], [], per_page + 1 - len(rows))
+    else:
+        if keyset:
+            # resultados ordenados por relevância: o cursor guarda o deslocamento
+            try:
+                offset = max(0, int(_decode_cursor(cursor).get("o", 0)))
+            except TypeError as e:
+                raise ValueError("cursor inválido") from e
+        rows = _fetch([], [], per_page + 1, offset)
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    next_cursor = None
+    if has_next:
+        if ranked:
+            next_cursor = _encode_cursor({"o": offset + per_page})
+        else:
+            next_cursor = _encode_cursor({"k": [rows[-1]["criado_em"], rows[-1]["id"]]})
 
-    items = []
-    # calcula indicador de troca de óleo por item (com base em quilometragem atual e oleo_km)
-    def _to_int(val):
-        try:
-            s = str(val or "")
-            nums = ''.join(ch for ch in s if ch.isdigit())
-            return int(nums) if nums else None
-        except Exception:
-            return None
+    total = None
+    if not keyset or with_total:
+        total = _contar_veiculos(count_query, count_params)
 
+    items = []
     for r in rows:
-        quil = _to_int(r['quilometragem']) if 'quilometragem' in r.keys() else None
-        oleo_km = _to_int(r['oleo_km']) if 'oleo_km' in r.keys() and r['oleo_km'] is not None else None
-        if quil is not None and oleo_km is not None:
-            diff = quil - oleo_km
-            oleo_alert = diff >= 6000
-            oleo_due_in = max(0, 6000 - diff)
-        else:
-            diff = None
-            oleo_alert = False
-            oleo_due_in = None
-
-        items.append({
+        item = {
             "id": r["id"],
             "condutor": r["condutor"],
             "placa": r["placa"],
             "modelo": r["modelo"],
-            "data": r["data"],
+            "criado_em": r["criado_em"],
             "quilometragem": r["quilometragem"],
+            "km": r["km"],
             "tipo": r["tipo"],
-            "oleo_km": (r["oleo_km"] if 'oleo_km' in r.keys() else None),
-            "oleo_data": (r["oleo_data"] if 'oleo_data' in r.keys() else None),
-            "oleo_alert": oleo_alert,
-            "oleo_diff": diff,
-            "oleo_due_in": oleo_due_in
-        })
-
-    conn.close()
+            "oleo_km": r["oleo_km"],
+            "oleo_data": r["oleo_data"],
+        }
+        item.update(status_oleo(r["oleo_diff"]))
+        items.append(item)
+
+    if keyset:
+        result = {"items": items, "per_page": per_page, "next_cursor": next_cursor}
+        if total is not None:
+            result["total"] = total
+        return result
+
     total_pages = max(1, math.ceil(total / per_page)) if total else 1
 
-    return jsonify({
+    return {
         "items": items,
         "page": page,
         "per_page": per_page,
         "total": total,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": next_cursor
+    }
+
+# API com busca e paginação e contagem otimizada para críticos
+@app.route("/api/veiculos")
+@login_required
+@condicional
+def api_veiculos():
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+    except ValueError:
+        page = 1
+    try:
+        per_page = max(5, min(100, int(request.args.get("per_page", 10))))
+    except ValueError:
+        per_page = 10
+    try:
+        result = _consultar_veiculos(
+            tipo=request.args.get("tipo") or None,
+            criticos=request.args.get("criticos") == "1",
+            q=(request.args.get("q") or "").strip(),
+            page=page,
+            per_page=per_page,
+            cursor=request.args.get("cursor"),
+            with_total=request.args.get("with_total") == "1",
+            data_ini=request.args.get("data_ini"),
+            data_fim=request.args.get("data_fim"),
+            oleo_alert=request.args.get("oleo_alert") == "1",
+        )
+    except ValueError:
+        return jsonify({"error": "cursor inválido"}), 400
+    return jsonify(result)
+
+
+@app.route("/api/eventos")
+@login_required
+def api_eventos():
+    """
+    Fluxo SSE do dashboard: resumo de cada checklist novo e variação dos KPIs.
+    ?desde=<id> vem da página renderizada; nas reconexões o navegador manda
+    Last-Event-ID. A conexão do banco da requisição volta ao pool no teardown:
+    o fluxo usa só a consulta compartilhada do processo (eventos.py).
+    """
+    if eventos.lotado():
+        return Response("Muitas conexões de eventos neste worker.", status=503, headers={"Retry-After": "30"})
+    desde = request.headers.get("Last-Event-ID") or request.args.get("desde")
+    try:
+        desde = int(desde) if desde else None
+    except ValueError:
+        desde = None
+    return Response(eventos.fluxo(desde), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # nginx: repassar cada evento sem bufferizar a resposta
+        "X-Accel-Buffering": "no",
     })
 
-# Rota administrativa para limpar uploads órfãos
+# Vários checklists por requisição: ?ids=1,2,3 (até 100); itens=0 devolve só o cabeçalho
+@app.route("/api/registros")
+@login_required
+@condicional
+def api_registros():
+    try:
+        ids = [int(i) for i in (request.args.get("ids") or "").split(",") if i.strip()]
+    except ValueError:
+        return jsonify({"error": "ids deve ser uma lista de inteiros separados por vírgula"}), 400
+    if not ids or len(ids) > 100:
+        return jsonify({"error": "informe de 1 a 100 ids"}), 400
+    registros = obter_registros(ids, itens=request.args.get("itens") != "0")
+    return jsonify({
+        "items": [registros[i] for i in dict.fromkeys(ids) if i in registros],
+        "missing": [i for i in dict.fromkeys(ids) if i not in registros],
+    })
+
+
+# Exportação em lote (ZIP de PDFs ou PDF único), com os mesmos filtros de /api/veiculos.
+# Gerada em segundo plano pela fila de tarefas; o cliente acompanha pelo GET.
+@app.route("/api/exportacoes", methods=["POST"])
+@login_required
+def api_exportacoes():
+    dados = request.get_json(silent=True) or request.form
+    formato = dados.get("formato", "zip")
+    if formato not in exportacao.FORMATOS:
+        return jsonify({"error": f"formato deve ser um de: {', '.join(exportacao.FORMATOS)}"}), 400
+    conn = get_conn()
+    try:
+        exportacao_id = exportacao.iniciar(conn, exportacao.normalizar_filtros(dados), formato, current_user.id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    url = url_for("api_exportacao", exportacao_id=exportacao_id)
+    return jsonify(exportacao.status(conn, exportacao_id)), 202, {"Location": url}
+
+def _exportacao_do_usuario(exportacao_id):
+    st = exportacao.status(get_conn(), exportacao_id)
+    if st is None or (st["usuario_id"] != current_user.id and not current_user.is_admin):
+        abort(404)
+    return st
+
+@app.route("/api/exportacoes/<int:exportacao_id>")
+@login_required
+def api_exportacao(exportacao_id):
+    st = _exportacao_do_usuario(exportacao_id)
+    if st["estado"] == "concluido":
+        st["download"] = url_for("api_exportacao_arquivo", exportacao_id=exportacao_id)
+    return jsonify(st)
+
+@app.route("/api/exportacoes/<int:exportacao_id>/arquivo")
+@login_required
+def api_exportacao_arquivo(exportacao_id):
+    st = _exportacao_do_usuario(exportacao_id)
+    caminho = exportacao.caminho_arquivo(st)
+    if caminho is None:
+        return jsonify({"error": "exportação não disponível", "estado": st["estado"]}), 409
+    nome = f"checklists_{formatar_data(st['criado_em'], '%d-%m-%Y_%H%M')}.{st['formato']}"
+    return send_file(caminho, as_attachment=True, download_name=nome, conditional=True)
+
+
+# Extratos para BI em fluxo (CSV/NDJSON, gzip=1 opcional), com os filtros de /api/veiculos.
+# Extratos muito grandes: prefira `python exportacao.py --formato csv ...` (sem timeout de worker).
+@app.route("/api/extratos/<extrato>.<formato>")
+@login_required
+def api_extrato(extrato, formato):
+    if extrato not in exportacao.EXTRATOS or formato not in exportacao.FORMATOS_EXTRATO:
+        abort(404)
+    gzip = request.args.get("gzip") == "1"
+    nome = f"{extrato}_{datetime.now():%Y-%m-%d_%H%M}.{formato}" + (".gz" if gzip else "")
+    tipo = "text/csv" if formato == "csv" else "application/x-ndjson"
+    fluxo = exportacao.gerar_extrato(extrato, formato, exportacao.normalizar_filtros(request.args), gzip=gzip)
+    return Response(fluxo, mimetype="application/gzip" if gzip else tipo, headers={
+        "Content-Disposition": f"attachment; filename={nome}",
+        "X-Accel-Buffering": "no",
+    })
+
+
+# Coleta de anexos órfãos: sem parâmetros mostra o progresso da última execução;
+# dry_run=1 ou confirm=1 inicia uma nova (em segundo plano, pela fila de tarefas)
 @app.route("/admin/cleanup-uploads", methods=["GET"])
 @admin_required
 def cleanup_uploads():
-    confirm = request.args.get("confirm") == "1"
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT foto_carro FROM veiculos
-        UNION
-        SELECT caminho_foto FROM itens_checklist
-        UNION
-        SELECT caminho_thumb FROM itens_checklist
-    """)
-    referenced = {row[0] for row in cur.fetchall() if row[0]}
-    conn.close()
-
-    all_files = set(os.listdir(ANEXOS_DIR))
-    orphans = sorted(list(all_files - referenced))
-
-    result = {"total_files": len(all_files), "referenced": len(referenced), "orphans_count": len(orphans), "orphans_sample": orphans[:200]}
-
-    if confirm and orphans:
-        removed = []
-        errors = []
-        for fname in orphans:
-            path = os.path.join(ANEXOS_DIR, fname)
-            try:
-                os.remove(path)
-                removed.append(fname)
-            except Exception as e:
-                errors.append({"file": fname, "error": str(e)})
-        result["removed_count"] = len(removed)
-        result["removed_sample"] = removed[:200]
-        result["errors"] = errors
+    if request.args.get("confirm") == "1" or request.args.get("dry_run") == "1":
+        execucao_id = gc_anexos.iniciar(conn, dry_run=request.args.get("confirm") != "1")
+        return jsonify(gc_anexos.status(conn, execucao_id)), 202
+    return jsonify(gc_anexos.status(conn) or {"estado": "nunca executado"})
+
+# Importação em lote de históricos (CSV/NDJSON): o arquivo é gravado e processado
+# em segundo plano pela fila de tarefas; o GET mostra o progresso e as linhas/s
+@app.route("/admin/importacoes", methods=["POST"])
+@admin_required
+def admin_importar():
+    arquivo = request.files.get("arquivo")
+    if not arquivo or not arquivo.filename:
+        return jsonify({"error": "envie o arquivo no campo 'arquivo'"}), 400
+    conn = get_conn()
+    try:
+        importacao_id = importacao.iniciar(conn, request.form.get("tipo"), arquivo,
+                                           request.form.get("formato"), current_user.id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    url = url_for("admin_importacao", importacao_id=importacao_id)
+    return jsonify(importacao.status(conn, importacao_id)), 202, {"Location": url}
+
+@app.route("/admin/importacoes/<int:importacao_id>")
+@admin_required
+def admin_importacao(importacao_id):
+    st = importacao.status(get_conn(), importacao_id)
+    if st is None:
+        abort(404)
+    return jsonify(st)
 
-    return jsonify(result)
+@app.route("/admin/importacoes/<int:importacao_id>/retomar", methods=["POST"])
+@admin_required
+def admin_importacao_retomar(importacao_id):
+    conn = get_conn()
+    importacao.retomar(conn, importacao_id)
+    st = importacao.status(conn, importacao_id)
+    if st is None:
+        abort(404)
+    return jsonify(st), 202
+
+# Contadores do cache compartilhado (hits/misses de todos os workers)
+@app.route("/admin/cache-stats", methods=["GET"])
+@admin_required
+def cache_stats():
+    return jsonify({**cache.stats(), "pdfs": pdfs.stats(), "variantes": variantes.stats(),
+                    "usuarios": usuarios.stats()})
 
 # Rotas para manutenção de veículos
 @app.route("/manutencao")
@@ -413,8 +644,7 @@ def manutencao():
 @login_required
 def nova_manutencao(veiculo_id):
     """Adiciona uma nova manutenção para um veículo"""
-    from services import obter_registro
-    veiculo = obter_registro(veiculo_id)
+    veiculo = obter_registro(veiculo_id, itens=False)
     
     if not veiculo:
         flash("Veículo não encontrado.", "error")
@@ -444,8 +674,7 @@ def nova_manutencao(veiculo_id):
 @login_required
 def manutencoes_veiculo(veiculo_id):
     """Lista todas as manutenções de um veículo específico"""
-    from services import obter_registro
-    veiculo = obter_registro(veiculo_id)
+    veiculo = obter_registro(veiculo_id, itens=False)
     
     if not veiculo:
         flash("Veículo não encontrado.", "error")
@@ -527,27 +756,8 @@ def create_admin_user():
         print("Usuário administrador 'vip' já existe no banco de dados.")
 
 if __name__ == "__main__":
-    # Criar tabelas e usuário admin padrão se não existirem
+    # Criar usuário admin padrão se não existir
     with app.app_context():
-        conn = get_conn()
-        cur = conn.cursor()
-        
-        # Criar tabela de usuários se não existir
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                email TEXT,
-                is_admin BOOLEAN DEFAULT 0,
-                reset_token TEXT,
-                reset_token_expiration TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        
-        # Criar usuário administrador padrão
         create_admin_user()
     
     # Iniciar o servidor
@@ -0,0 +1,442 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from config import CACHE_DB_FILE, CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_LOCAL_MAX_ENTRIES
+from config import VARIANTES_DIR, VARIANTES_MAX_BYTES, PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES
+from config import USER_CACHE_TTL, USER_CACHE_MAX_ENTRIES
+from db import geracao_atual, file_lock
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _rss_pico_kb():
+    """Pico de memória residente do processo até agora (ru_maxrss, KiB no Linux); 0 sem `resource`."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+
+
+class Cache:
+    """
+    Cache com TTL e despejo LRU em dois níveis:
+      - LRU em memória por processo (acesso sem I/O);
+      - tabela SQLite em arquivo próprio, compartilhada por todos os workers.
+    As chaves usadas por @cached incluem a geração de escrita do banco principal,
+    então um valor nunca é servido depois de uma gravação (invalidação exata).
+    """
+
+    # intervalo mínimo (s) para atualizar o "último acesso" de uma entrada compartilhada
+    TOUCH_INTERVAL = 5
+    # contadores de hit/miss são acumulados localmente e gravados em lote
+    FLUSH_INTERVAL = 5
+
+    def __init__(self, path, max_entries, local_max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.local_max_entries = local_max_entries
+        self._lock = threading.Lock()
+        self._tls = threading.local()
+        self._local = OrderedDict()  # chave -> (expira, valor)
+        self.hits = 0
+        self.misses = 0
+        self._pending = {"hits": 0, "misses": 0}
+        self._last_flush = time.monotonic()
+        self._init_schema()
+
+    def _conn(self):
+        conn = getattr(self._tls, "conn", None)
+        if conn is None or getattr(self._tls, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # conteúdo descartável: durabilidade não é necessária
+            conn.execute("PRAGMA synchronous=OFF")
+            self._tls.conn = conn
+            self._tls.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache (
+                chave TEXT PRIMARY KEY,
+                valor BLOB NOT NULL,
+                expira REAL NOT NULL,
+                acesso REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_acesso ON cache(acesso);
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                nome TEXT PRIMARY KEY,
+                valor INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+        """)
+        conn.commit()
+
+    def _count(self, nome):
+        with self._lock:
+            setattr(self, nome, getattr(self, nome) + 1)
+            self._pending[nome] += 1
+        if time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        with self._lock:
+            pending, self._pending = self._pending, {"hits": 0, "misses": 0}
+            self._last_flush = time.monotonic()
+        try:
+            conn = self._conn()
+            conn.executemany("""
+                INSERT INTO cache_stats(nome, valor) VALUES (?, ?)
+                ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor
+            """, list(pending.items()))
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def _store_local(self, key, expira, value):
+        with self._lock:
+            self._local[key] = (expira, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_max_entries:
+                self._local.popitem(last=False)
+
+    def get(self, key):
+        """Retorna (encontrado, valor)."""
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._local.move_to_end(key)
+                else:
+                    del self._local[key]
+                    entry = None
+        if entry is not None:
+            self._count("hits")
+            return True, entry[1]
+
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT valor, expira, acesso FROM cache WHERE chave = ?", (key,)).fetchone()
+            if row and row[1] > now:
+                value = pickle.loads(row[0])
+                if now - row[2] > self.TOUCH_INTERVAL:
+                    conn.execute("UPDATE cache SET acesso = ? WHERE chave = ?", (now, key))
+                    conn.commit()
+                self._store_local(key, row[1], value)
+                self._count("hits")
+                return True, value
+        except (sqlite3.Error, pickle.PickleError):
+            pass
+        self._count("misses")
+        return False, None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expira = now + (ttl or CACHE_TTL)
+        self._store_local(key, expira, value)
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache(chave, valor, expira, acesso) VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expira, now)
+            )
+            self._evict(conn, now)
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM cache WHERE expira <= ?", (now,))
+        excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute("""
+                DELETE FROM cache WHERE chave IN (
+                    SELECT chave FROM cache ORDER BY acesso ASC LIMIT ?
+                )
+            """, (excess,))
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        conn = self._conn()
+        conn.execute("DELETE FROM cache")
+        conn.commit()
+
+    def stats(self):
+        """Contadores deste processo e totais de todos os workers."""
+        self._flush_stats()
+        conn = self._conn()
+        shared = dict(conn.execute("SELECT nome, valor FROM cache_stats").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        hits, misses = shared.get("hits", 0), shared.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "entries": entries,
+            "local_entries": len(self._local),
+            "process": {"pid": os.getpid(), "hits": self.hits, "misses": self.misses},
+        }
+
+
+class DiskCache:
+    """
+    Cache LRU de arquivos em disco, limitado em bytes e compartilhado pelos workers.
+    O índice (tamanho e último acesso de cada arquivo) fica na tabela `arquivos`
+    do cache.db. Gerações concorrentes da mesma chave são coalescidas por um lock
+    de arquivo: só um processo gera, os demais esperam e reaproveitam o resultado.
+    Cada instância usa sua própria tabela de índice (`tabela`). Cada geração
+    soma em cache_stats quantidade, bytes e tempo, e guarda o maior arquivo e o
+    maior aumento do pico de memória (RSS) do processo durante uma geração.
+    """
+
+    TOUCH_INTERVAL = Cache.TOUCH_INTERVAL
+    # locks distribuídos em faixas fixas (não acumula um arquivo .lock por chave)
+    LOCK_STRIPES = 64
+
+    def __init__(self, diretorio, max_bytes, cache, tabela="arquivos"):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self.tabela = tabela
+        self._conn = cache._conn
+        os.makedirs(os.path.join(diretorio, "locks"), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {tabela} (
+                chave TEXT PRIMARY KEY,
+                caminho TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                acesso REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_{tabela}_acesso ON {tabela}(acesso);
+        """)
+        conn.commit()
+
+    def _caminho(self, chave, ext):
+        h = hashlib.sha1(chave.encode()).hexdigest()
+        return os.path.join(self.diretorio, h[:2], f"{h}.{ext}")
+
+    def _lock(self, chave):
+        faixa = int(hashlib.sha1(chave.encode()).hexdigest()[:8], 16) % self.LOCK_STRIPES
+        return file_lock(os.path.join(self.diretorio, "locks", f"{faixa}.lock"))
+
+    def _tocar(self, chave):
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(f"UPDATE {self.tabela} SET acesso = ? WHERE chave = ? AND acesso < ?",
+                         (now, chave, now - self.TOUCH_INTERVAL))
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def obter(self, chave, gerar, ext):
+        """
+        Caminho do arquivo da chave. Se ainda não existir, chama gerar(destino)
+        uma única vez (entre todos os processos) para criá-lo.
+        """
+        caminho = self._caminho(chave, ext)
+        if os.path.exists(caminho):
+            self._tocar(chave)
+            return caminho
+        with self._lock(chave):
+            if os.path.exists(caminho):
+                return caminho
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            tmp = f"{caminho}.{os.getpid()}.tmp"
+            inicio = time.monotonic()
+            rss_antes = _rss_pico_kb()
+            try:
+                gerar(tmp)
+                os.replace(tmp, caminho)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            tamanho = os.path.getsize(caminho)
+            conn = self._conn()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.tabela}(chave, caminho, bytes, acesso) VALUES (?, ?, ?, ?)",
+                (chave, caminho, tamanho, time.time())
+            )
+            self._registrar(conn, tamanho, time.monotonic() - inicio, _rss_pico_kb() - rss_antes)
+            self._evict(conn, chave)
+            conn.commit()
+        return caminho
+
+    def _registrar(self, conn, tamanho, segundos, rss_aumento):
+        t = self.tabela
+        conn.executemany("""
+            INSERT INTO cache_stats(nome, valor) VALUES (?, ?)
+            ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor
+        """, [(f"{t}:gerados", 1), (f"{t}:bytes_gerados", tamanho), (f"{t}:ms_gerando", round(segundos * 1000))])
+        # quanto a geração elevou o pico de memória do processo (0 se ficou abaixo
+        # de um pico anterior): só uma geração que decodifica algo grande aparece
+        conn.executemany("""
+            INSERT INTO cache_stats(nome, valor) VALUES (?, ?)
+            ON CONFLICT(nome) DO UPDATE SET valor = max(valor, excluded.valor)
+        """, [(f"{t}:bytes_max", tamanho), (f"{t}:rss_aumento_kb", rss_aumento)])
+
+    def _evict(self, conn, manter):
+        total = conn.execute(f"SELECT COALESCE(SUM(bytes), 0) FROM {self.tabela}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removidos = []
+        # `manter` é o arquivo recém-gerado, que ainda vai ser servido
+        for chave, caminho, tamanho in conn.execute(
+            f"SELECT chave, caminho, bytes FROM {self.tabela} WHERE chave <> ? ORDER BY acesso ASC", (manter,)
+        ).fetchall():
+            if total <= self.max_bytes * 0.9:  # folga para não despejar a cada inserção
+                break
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            removidos.append((chave,))
+            total -= tamanho
+        conn.executemany(f"DELETE FROM {self.tabela} WHERE chave = ?", removidos)
+
+    def stats(self):
+        conn = self._conn()
+        entradas, total = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM {self.tabela}").fetchone()
+        geracao = dict(conn.execute(
+            "SELECT substr(nome, ?), valor FROM cache_stats WHERE nome LIKE ?",
+            (len(self.tabela) + 2, f"{self.tabela}:%")
+        ).fetchall())
+        gerados = geracao.get("gerados", 0)
+        return {
+            "entries": entradas,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "generated": gerados,
+            "generated_bytes_avg": round(geracao.get("bytes_gerados", 0) / gerados) if gerados else None,
+            "generated_bytes_max": geracao.get("bytes_max"),
+            "generate_ms_avg": round(geracao.get("ms_gerando", 0) / gerados) if gerados else None,
+            "rss_growth_kb_max": geracao.get("rss_aumento_kb"),
+        }
+
+
+class LocalCache:
+    """
+    LRU com TTL só em memória, por processo, para valores pequenos lidos em
+    quase toda requisição (ex.: o usuário da sessão). Sem nível compartilhado:
+    invalidar() vale para este processo e os demais enxergam a mudança quando a
+    entrada expira. Hits e misses somam em cache_stats como `{nome}:hits` e
+    `{nome}:misses` (todos os workers), gravados em lote como em Cache.
+    """
+
+    FLUSH_INTERVAL = Cache.FLUSH_INTERVAL
+
+    def __init__(self, nome, ttl, max_entries, cache):
+        self.nome = nome
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conn = cache._conn
+        self._lock = threading.Lock()
+        self._itens = OrderedDict()  # chave -> (expira, valor)
+        self._invalidacoes = 0
+        self.hits = 0
+        self.misses = 0
+        self._pending = {"hits": 0, "misses": 0}
+        self._last_flush = time.monotonic()
+
+    def _count(self, nome):
+        with self._lock:
+            setattr(self, nome, getattr(self, nome) + 1)
+            self._pending[nome] += 1
+        if time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        with self._lock:
+            pending, self._pending = self._pending, {"hits": 0, "misses": 0}
+            self._last_flush = time.monotonic()
+        try:
+            conn = self._conn()
+            conn.executemany("""
+                INSERT INTO cache_stats(nome, valor) VALUES (?, ?)
+                ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor
+            """, [(f"{self.nome}:{k}", v) for k, v in pending.items()])
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def obter(self, chave, carregar):
+        """Valor da chave; no miss chama carregar() (o resultado, mesmo None, fica guardado)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._itens.get(chave)
+            if entry is not None and entry[0] > now:
+                self._itens.move_to_end(chave)
+            else:
+                entry = None
+            invalidacoes = self._invalidacoes
+        if entry is not None:
+            self._count("hits")
+            return entry[1]
+        self._count("misses")
+        valor = carregar()
+        with self._lock:
+            if invalidacoes != self._invalidacoes:
+                # invalidado durante a leitura: o valor pode ser anterior à escrita
+                return valor
+            self._itens[chave] = (now + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_entries:
+                self._itens.popitem(last=False)
+        return valor
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._invalidacoes += 1
+            self._itens.pop(chave, None)
+
+    def stats(self):
+        """Totais de todos os workers e contadores deste processo."""
+        self._flush_stats()
+        conn = self._conn()
+        shared = dict(conn.execute(
+            "SELECT substr(nome, ?), valor FROM cache_stats WHERE nome LIKE ?",
+            (len(self.nome) + 2, f"{self.nome}:%")
+        ).fetchall())
+        hits, misses = shared.get("hits", 0), shared.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "ttl": self.ttl,
+            "process": {"pid": os.getpid(), "hits": self.hits, "misses": self.misses,
+                        "entries": len(self._itens)},
+        }
+
+
+cache = Cache(CACHE_DB_FILE, CACHE_MAX_ENTRIES, CACHE_LOCAL_MAX_ENTRIES)
+variantes = DiskCache(VARIANTES_DIR, VARIANTES_MAX_BYTES, cache)
+pdfs = DiskCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES, cache, tabela="arquivos_pdf")
+usuarios = LocalCache("usuarios", USER_CACHE_TTL, USER_CACHE_MAX_ENTRIES, cache)
+
+
+def cached(namespace, ttl=None):
+    """
+    Decora uma função de leitura. A chave combina namespace, geração de escrita
+    e argumentos; os argumentos precisam ter repr estável. O valor retornado é
+    compartilhado entre chamadas e não deve ser alterado pelo chamador.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = f"{namespace}:{geracao_atual()}:{args!r}:{sorted(kwargs.items())!r}"
+            hit, value = cache.get(key)
+            if hit:
+                return value
+            value = fn(*args, **kwargs)
+            cache.set(key, value, ttl)
+            return value
+        return wrapper
+    return decorator
@@ -7,11 +7,97 @@ APP_ROOT = os.path.abspath(os.path.dirname(__file__))
 SECRET_KEY = os.environ.get('SECRET_KEY') or 'sua-chave-secreta-aqui'
 
 # Configurações do banco de dados
-DATA_DIR = os.path.join(APP_ROOT, "data")
+DATA_DIR = os.environ.get('DATA_DIR') or os.path.join(APP_ROOT, "data")  # testes usam um diretório temporário
 APP_DIR = os.path.join(DATA_DIR, "ChecklistVeicular")
 ANEXOS_DIR = os.path.join(APP_DIR, "anexos")
 DB_FILE = os.path.join(APP_DIR, "checklist.db")
 
+# Pool de conexões SQLite (por worker) e pragmas aplicados em cada conexão
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16 * 1024))
+
+# Status de item considerados críticos (filtro "críticos" e KPIs do dashboard)
+STATUS_CRITICOS = ("Danificado", "Desgastado", "Calibrar", "Baixo", "Alto")
+
+# Intervalo (km) entre trocas de óleo usado nos alertas
+OLEO_INTERVALO_KM = int(os.environ.get('OLEO_INTERVALO_KM', 6000))
+
+# Quantidade de meses exibidos no gráfico mensal do dashboard
+DASHBOARD_MESES = int(os.environ.get('DASHBOARD_MESES', 12))
+
+# Cache compartilhado entre workers (arquivo SQLite próprio, separado do banco principal)
+CACHE_DB_FILE = os.path.join(APP_DIR, "cache.db")
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))  # segundos
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 2000))
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', 200))  # LRU em memória por worker
+# Usuário da sessão (user_loader), só em memória por worker; outros workers veem
+# alterações de perfil/senha em até USER_CACHE_TTL segundos
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))  # segundos
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 1024))
+
+# Versões redimensionadas geradas para cada foto (maior lado, em px). JPEG sempre;
+# WebP adicional quando IMAGEM_WEBP estiver ligado
+IMAGEM_TAMANHOS = tuple(int(t) for t in os.environ.get('IMAGEM_TAMANHOS', '160,480,1200').split(','))
+IMAGEM_WEBP = os.environ.get('IMAGEM_WEBP', 'true').lower() in ['true', 'on', '1']
+IMAGEM_QUALIDADE = int(os.environ.get('IMAGEM_QUALIDADE', 80))
+# Densidade (px por ponto) usada para escolher a versão da foto embutida no PDF
+PDF_PX_POR_PONTO = float(os.environ.get('PDF_PX_POR_PONTO', 2))
+
+# Entrega de /uploads: '' = pelo próprio Flask; 'nginx' = X-Accel-Redirect; 'sendfile' = X-Sendfile
+# (Apache/lighttpd). Para o nginx, o prefixo precisa de uma location interna, ex.:
+#     location /_anexos/ { internal; alias /app/data/ChecklistVeicular/anexos/; }
+#     location /_variantes/ { internal; alias /app/data/ChecklistVeicular/variantes/; }
+UPLOADS_ACCEL = os.environ.get('UPLOADS_ACCEL', '').lower()
+UPLOADS_ACCEL_PREFIX = os.environ.get('UPLOADS_ACCEL_PREFIX', '/_anexos/')
+# Nomes de anexo nunca são reaproveitados para outro conteúdo: cache de 1 ano, imutável
+UPLOADS_MAX_AGE = int(os.environ.get('UPLOADS_MAX_AGE', 31536000))
+
+# Versões sob demanda de /uploads/<nome>?w=<px>&fmt=webp|jpeg: apenas estas larguras são aceitas,
+# para que a rota não possa ser usada para encher o cache. O cache em disco é LRU, limitado em bytes
+IMAGEM_LARGURAS_SOB_DEMANDA = tuple(
+    int(t) for t in os.environ.get('IMAGEM_LARGURAS_SOB_DEMANDA', '80,160,320,480,640,960,1200').split(',')
+)
+VARIANTES_DIR = os.path.join(APP_DIR, "variantes")
+VARIANTES_MAX_BYTES = int(os.environ.get('VARIANTES_MAX_BYTES', 256 * 1024 * 1024))
+# PDFs de checklist já gerados (cache LRU em disco, limitado em bytes)
+PDF_CACHE_DIR = os.path.join(APP_DIR, "pdfs")
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+UPLOADS_ACCEL_VARIANTES_PREFIX = os.environ.get('UPLOADS_ACCEL_VARIANTES_PREFIX', '/_variantes/')
+
+# Exportação em lote de checklists (exportacao.py): ZIP de PDFs ou PDF único com sumário
+EXPORT_DIR = os.path.join(APP_DIR, "exportacoes")
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', os.cpu_count() or 1))  # processos de renderização
+EXPORT_MAX_REGISTROS = int(os.environ.get('EXPORT_MAX_REGISTROS', 5000))
+EXPORT_TTL = int(os.environ.get('EXPORT_TTL', 24 * 3600))  # segundos até o arquivo exportado ser apagado
+
+# Importação em lote de históricos (importacao.py)
+IMPORT_DIR = os.path.join(APP_DIR, "importacoes")
+IMPORT_LOTE = int(os.environ.get('IMPORT_LOTE', 2000))  # registros por transação (e por checkpoint)
+IMPORT_FATIA = int(os.environ.get('IMPORT_FATIA', 20))  # segundos de trabalho por job da fila
+IMPORT_RETENCAO = int(os.environ.get('IMPORT_RETENCAO', 7 * 24 * 3600))  # segundos que uma importação parada pode ser retomada
+
+# Coleta de anexos órfãos (gc_anexos.py)
+GC_CARENCIA = int(os.environ.get('GC_CARENCIA', 3600))  # segundos: arquivos mais novos não são removidos
+GC_LOTE = int(os.environ.get('GC_LOTE', 500))  # arquivos conferidos por transação
+GC_FATIA = int(os.environ.get('GC_FATIA', 20))  # segundos de trabalho por job da fila
+
+# Atualizações ao vivo do dashboard (eventos.py, /api/eventos via SSE)
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 64))  # threads por worker do gunicorn (gthread)
+SSE_MAX_CLIENTES = int(os.environ.get('SSE_MAX_CLIENTES', 48))  # conexões SSE por worker; o resto fica para as páginas
+SSE_POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', 1.0))  # segundos entre consultas à tabela eventos
+SSE_HEARTBEAT = int(os.environ.get('SSE_HEARTBEAT', 15))  # segundos sem eventos até enviar um comentário
+SSE_DURACAO_MAX = int(os.environ.get('SSE_DURACAO_MAX', 1800))  # segundos até o cliente reconectar
+EVENTOS_RETENCAO = int(os.environ.get('EVENTOS_RETENCAO', 1000))  # eventos mantidos para reconexão (Last-Event-ID)
+
+# Fila de tarefas em segundo plano (jobs.py), ex.: geração de thumbnails
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', os.cpu_count() or 1))  # 0 = não iniciar pelo gunicorn
+JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 1.0))  # segundos
+JOBS_MAX_TENTATIVAS = int(os.environ.get('JOBS_MAX_TENTATIVAS', 3))
+JOBS_TIMEOUT = int(os.environ.get('JOBS_TIMEOUT', 300))  # segundos até um job "executando" ser retomado
+JOBS_RETENCAO = int(os.environ.get('JOBS_RETENCAO', 7 * 24 * 3600))  # segundos que jobs terminados ficam na tabela
+
 # Configurações de e-mail (para recuperação de senha)
 MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
 MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
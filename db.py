@@ -1,62 +1,157 @@
+import os
+import queue
 import sqlite3
-from config import DB_FILE
+import threading
+from contextlib import contextmanager
 
-def get_conn():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+from flask import g, has_app_context
+
+from config import DB_FILE, DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, DB_MMAP_SIZE, DB_CACHE_SIZE_KB
+
+
+def _connect():
+    """Abre uma conexão nova e aplica os pragmas de desempenho (uma vez por conexão)."""
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+    # valor negativo = tamanho em KiB
+    conn.execute(f"PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}")
     return conn
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS veiculos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        condutor TEXT,
-        placa TEXT,
-        modelo TEXT,
-        data TEXT,
-        quilometragem TEXT,
-        observacoes TEXT,
-        foto_carro TEXT,
-        tipo TEXT
-    )
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS itens_checklist (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        veiculo_id INTEGER,
-        nome_item TEXT,
-        status TEXT,
-        comentario TEXT,
-        caminho_foto TEXT,
-        caminho_thumb TEXT,
-        FOREIGN KEY (veiculo_id) REFERENCES veiculos(id)
-    )
-    """)
-    # Índices para acelerar buscas e joins
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_veiculos_placa ON veiculos(placa)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_veiculos_condutor ON veiculos(condutor)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_veiculos_modelo ON veiculos(modelo)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_itens_veiculo ON itens_checklist(veiculo_id)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_itens_status ON itens_checklist(status)")
-    conn.commit()
-    conn.close()
-
-    # Adiciona colunas para controle de troca de óleo caso não existam (migrations simples)
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(veiculos)")
-    cols = [row[1] for row in cur.fetchall()]
-    if 'oleo_data' not in cols:
+
+class ConnectionPool:
+    """
+    Pool de conexões SQLite por processo (worker do gunicorn).
+    Mantém no máximo `maxsize` conexões ociosas; conexões excedentes são fechadas
+    ao serem devolvidas. Após um fork o pool herdado é descartado.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue(self.maxsize)
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # conexões herdadas do processo pai não podem ser reutilizadas
+                    self._reset()
+
+    def acquire(self):
+        self._check_pid()
         try:
-            cur.execute("ALTER TABLE veiculos ADD COLUMN oleo_data TEXT")
-        except Exception:
-            pass
-    if 'oleo_km' not in cols:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _connect()
+
+    def release(self, conn):
+        if conn is None:
+            return
+        self._check_pid()
         try:
-            cur.execute("ALTER TABLE veiculos ADD COLUMN oleo_km TEXT")
-        except Exception:
-            pass
-    conn.commit()
-    conn.close()
\ No newline at end of file
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = ConnectionPool(DB_POOL_SIZE)
+_local = threading.local()
+
+
+def get_conn():
+    """
+    Retorna a conexão da requisição atual (guardada em flask.g) ou, fora de um
+    contexto Flask, a conexão da thread atual. Não feche a conexão retornada:
+    ela volta ao pool no teardown da requisição (ou em release_thread_conn()).
+    """
+    if has_app_context():
+        conn = g.get("_db_conn")
+        if conn is None:
+            conn = g._db_conn = _pool.acquire()
+        return conn
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        # após um fork a thread herda _local, mas não pode usar a conexão do pai
+        conn = _local.conn = _pool.acquire()
+        _local.pid = os.getpid()
+    return conn
+
+
+def close_conn(exc=None):
+    """Devolve a conexão da requisição ao pool (desfaz transação pendente)."""
+    conn = g.pop("_db_conn", None)
+    _pool.release(conn)
+
+
+def release_thread_conn():
+    """Devolve ao pool a conexão usada fora de contexto Flask pela thread atual."""
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    _pool.release(conn)
+
+
+@contextmanager
+def connection():
+    """Conexão avulsa do pool, devolvida ao sair do bloco."""
+    conn = _pool.acquire()
+    try:
+        yield conn
+    finally:
+        _pool.release(conn)
+
+
+@contextmanager
+def file_lock(path):
+    """Lock exclusivo entre processos (fcntl no Linux, msvcrt no Windows)."""
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    with open(path, "a+") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+        else:
+            import msvcrt
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def geracao_atual():
+    """Geração de escrita atual; muda a cada checklist/manutenção gravado."""
+    row = get_conn().execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()
+    return row[0] if row else 0
+
+
+def incrementar_geracao(cur):
+    """Deve ser chamado na mesma transação de toda escrita que afeta dados em cache."""
+    cur.execute("UPDATE meta SET valor = valor + 1 WHERE chave = 'geracao'")
+
+
+def init_app(app):
+    app.teardown_appcontext(close_conn)
@@ -0,0 +1,188 @@
+"""
+Eventos ao vivo do dashboard (Server-Sent Events em /api/eventos).
+
+Quem grava publica o evento na mesma transação (publicar(), como enfileirar()
+em jobs.py): a tabela `eventos` funciona como caixa de saída e só contém o que
+foi confirmado. Em cada processo do gunicorn uma única thread consulta a
+tabela a cada SSE_POLL_INTERVAL segundos e acorda os clientes conectados, que
+compartilham essa consulta e um buffer em memória dos eventos recentes.
+
+Os ids crescem sem reuso (AUTOINCREMENT), então um cliente que reconecta com
+Last-Event-ID recebe exatamente o que perdeu; se isso já saiu da retenção
+(EVENTOS_RETENCAO), recebe "recarregar" e busca a página de novo.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from config import (
+    EVENTOS_RETENCAO, SSE_POLL_INTERVAL, SSE_HEARTBEAT, SSE_DURACAO_MAX, SSE_MAX_CLIENTES,
+)
+from db import connection
+
+# intervalo (ms) de reconexão sugerido ao EventSource
+RETRY_MS = 3000
+
+
+def publicar(cur, tipo, dados):
+    """Registra um evento. Chamar dentro da transação da gravação que o originou."""
+    cur.execute("INSERT INTO eventos(tipo, dados) VALUES (?, ?)", (tipo, json.dumps(dados, ensure_ascii=False)))
+    # retenção pela chave primária: remove só o que saiu da janela
+    cur.execute("DELETE FROM eventos WHERE id <= ?", (cur.lastrowid - EVENTOS_RETENCAO,))
+
+
+def ultimo_id(conn):
+    """Id do último evento publicado (0 se nenhum)."""
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM eventos").fetchone()[0]
+
+
+def kpis(cur, stats, meses, criticos):
+    """
+    Variação dos KPIs do dashboard a partir dos contadores de incrementar_stats.
+    Os itens críticos vão com o total atual: o cliente só conhece o top 5 e
+    precisa do valor absoluto para reordenar o gráfico.
+    """
+    nomes = sorted(criticos)
+    totais = dict(cur.execute(
+        "SELECT nome_item, qtd FROM stats_itens_criticos WHERE nome_item IN (SELECT value FROM json_each(?))",
+        (json.dumps(nomes),)
+    ).fetchall()) if nomes else {}
+    return {
+        "total_checklists": stats["checklists"],
+        "total_carros": stats["tipo:Carro"],
+        "total_motos": stats["tipo:Moto"],
+        "total_criticos": stats["itens_criticos"],
+        "meses": dict(meses),
+        "itens_criticos": totais,
+    }
+
+
+def _formatar(evento):
+    id_, tipo, dados = evento
+    return f"id: {id_}\nevent: {tipo}\ndata: {dados}\n\n"
+
+
+class _Difusor:
+    """Consulta compartilhada da tabela `eventos` para os clientes SSE do processo."""
+
+    # eventos recentes mantidos em memória (clientes atrasados leem do banco)
+    BUFFER = 256
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pid = None
+        self._ultimo = 0
+        self._recentes = deque(maxlen=self.BUFFER)
+        self.clientes = 0
+
+    def _iniciar(self):
+        # chamado com o lock; após um fork a thread do pai não existe no filho
+        if self._pid == os.getpid():
+            return
+        with connection() as conn:
+            self._ultimo = ultimo_id(conn)
+        self._recentes.clear()
+        self.clientes = 0
+        self._pid = os.getpid()
+        threading.Thread(target=self._consultar, name="eventos-sse", daemon=True).start()
+
+    def _consultar(self):
+        pid = os.getpid()
+        with connection() as conn:
+            while self._pid == pid:
+                time.sleep(SSE_POLL_INTERVAL)
+                try:
+                    novos = [tuple(r) for r in conn.execute(
+                        "SELECT id, tipo, dados FROM eventos WHERE id > ? ORDER BY id", (self._ultimo,)
+                    )]
+                except sqlite3.Error:
+                    continue
+                if novos:
+                    with self._cond:
+                        self._recentes.extend(novos)
+                        self._ultimo = novos[-1][0]
+                        self._cond.notify_all()
+
+    def conectar(self):
+        with self._cond:
+            self._iniciar()
+            self.clientes += 1
+            return self._ultimo
+
+    def desconectar(self):
+        with self._cond:
+            self.clientes -= 1
+
+    def desde(self, ultimo):
+        """Eventos com id > ultimo; None se algum já não está disponível."""
+        with self._cond:
+            if ultimo >= self._ultimo:
+                return []
+            if self._recentes and self._recentes[0][0] <= ultimo + 1:
+                return [e for e in self._recentes if e[0] > ultimo]
+            limite = self._ultimo
+        # atrasado demais para o buffer: relê do banco
+        with connection() as conn:
+            eventos = [tuple(r) for r in conn.execute(
+                "SELECT id, tipo, dados FROM eventos WHERE id > ? AND id <= ? ORDER BY id", (ultimo, limite)
+            )]
+        if not eventos or eventos[0][0] != ultimo + 1:
+            return None
+        return eventos
+
+    def esperar(self, ultimo, timeout):
+        """Bloqueia até haver evento com id > ultimo ou o timeout expirar."""
+        with self._cond:
+            if self._ultimo <= ultimo:
+                self._cond.wait(timeout)
+        return self.desde(ultimo)
+
+
+_difusor = _Difusor()
+
+
+def lotado():
+    """True se este processo já atende SSE_MAX_CLIENTES conexões (verificação aproximada)."""
+    return _difusor._pid == os.getpid() and _difusor.clientes >= SSE_MAX_CLIENTES
+
+
+def fluxo(desde=None):
+    """
+    Corpo text/event-stream: eventos posteriores a `desde` (ou, sem ele, os que
+    chegarem a partir de agora) e um comentário a cada SSE_HEARTBEAT segundos
+    sem eventos, para proxies não derrubarem a conexão. Termina após
+    SSE_DURACAO_MAX segundos; o navegador reconecta com Last-Event-ID.
+    """
+    yield f"retry: {RETRY_MS}\n\n"
+    atual = _difusor.conectar()
+    try:
+        ultimo = atual if desde is None else desde
+        if ultimo > atual:
+            # a consulta deste processo fica até SSE_POLL_INTERVAL atrás do banco (o
+            # cliente pode ter visto o id por outro worker): só um id além do
+            # máximo real vem de outro banco (restaurado/recriado)
+            with connection() as conn:
+                maximo = ultimo_id(conn)
+            if ultimo > maximo:
+                yield "event: recarregar\ndata: {}\n\n"
+                return
+        fim = time.monotonic() + SSE_DURACAO_MAX
+        eventos = _difusor.desde(ultimo)
+        while True:
+            if eventos is None:
+                yield "event: recarregar\ndata: {}\n\n"
+                return
+            for evento in eventos:
+                yield _formatar(evento)
+                ultimo = evento[0]
+            restante = fim - time.monotonic()
+            if restante <= 0:
+                return
+            eventos = _difusor.esperar(ultimo, min(SSE_HEARTBEAT, restante))
+            if not eventos and eventos is not None:
+                yield ": ping\n\n"
+    finally:
+        _difusor.desconectar()
@@ -0,0 +1,439 @@
+"""
+Exportação em lote de checklists da frota.
+
+Os filtros são os mesmos da listagem (/api/veiculos, histórico; ver
+services.filtro_veiculos). Formatos:
+  - zip: um PDF por checklist, renderizados em paralelo por EXPORT_WORKERS
+    processos (reaproveitando o cache de PDFs em disco);
+  - pdf: um único PDF com sumário e marcadores, um por checklist.
+
+Pela API a exportação vira um job da fila e o progresso fica na tabela
+`exportacoes`. Pela linha de comando roda aqui mesmo:
+
+    python exportacao.py --formato zip --data-ini 01/10/2025 --criticos -o frota.zip
+
+Extratos de dados (veículos, itens, manutenções) em CSV ou NDJSON, para BI, são
+gerados em fluxo direto do cursor, sem job e com memória constante:
+
+    python exportacao.py --formato csv --extrato itens --gzip -o itens.csv.gz
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from config import EXPORT_DIR, EXPORT_WORKERS, EXPORT_MAX_REGISTROS, EXPORT_TTL, JOBS_TIMEOUT
+from db import connection
+from jobs import tarefa, enfileirar
+from services import (
+    ids_veiculos, obter_registros, pdf_registro, nome_pdf, desenhar_registro, formatar_data, filtro_veiculos,
+)
+
+FORMATOS = ("zip", "pdf")
+# parâmetros aceitos, com o mesmo significado de /api/veiculos
+FILTROS = ("tipo", "q", "placa", "data_ini", "data_fim", "criticos", "oleo_alert")
+# intervalo mínimo (s) entre gravações do progresso
+PROGRESSO_INTERVALO = 1.0
+# linhas por página do sumário do PDF único
+SUMARIO_LINHAS = 40
+# checklists carregados por consulta no PDF único (obter_registros)
+PDF_UNICO_LOTE = 100
+
+FORMATOS_EXTRATO = ("csv", "ndjson")
+# extrato -> (colunas, junção com veiculos v); uma linha por veículo, item ou manutenção
+EXTRATOS = {
+    "veiculos": (
+        "v.id, v.tipo, v.placa, v.modelo, v.condutor, v.quilometragem, v.km, v.oleo_km, v.oleo_data, "
+        "v.oleo_diff, v.itens_criticos, v.observacoes, v.criado_em",
+        "",
+    ),
+    "itens": (
+        "v.id AS veiculo_id, v.placa, v.tipo, v.criado_em, i.id AS item_id, i.nome_item, i.status, "
+        "i.comentario, i.caminho_foto",
+        "JOIN itens_checklist i ON i.veiculo_id = v.id",
+    ),
+    "manutencoes": (
+        "v.id AS veiculo_id, v.placa, v.modelo, m.id AS manutencao_id, m.nome_peca, m.data_manutencao, "
+        "m.quilometragem_atual, m.km, m.vida_util_km, m.proxima_manutencao_km, m.valor_peca, m.mao_de_obra, "
+        "m.observacoes, m.created_at",
+        "JOIN manutencao m ON m.veiculo_id = v.id",
+    ),
+}
+# bytes acumulados antes de entregar um pedaço do fluxo
+EXTRATO_BLOCO = 64 * 1024
+
+
+def normalizar_filtros(dados):
+    """Filtros conhecidos de um dict (JSON, form ou args); criticos/oleo_alert viram booleanos."""
+    filtros = {}
+    for chave in FILTROS:
+        valor = dados.get(chave)
+        if chave in ("criticos", "oleo_alert"):
+            if valor in (True, 1, "1", "true", "on"):
+                filtros[chave] = True
+        elif isinstance(valor, str) and valor.strip():
+            filtros[chave] = valor.strip()
+    return filtros
+
+
+def _renderizar(veiculo_id):
+    """Executado nos processos do pool: (nome do arquivo, bytes do PDF) ou (None, None)."""
+    caminho, registro, _ = pdf_registro(veiculo_id)
+    if caminho is None:
+        return None, None
+    with open(caminho, "rb") as fh:
+        return f"{veiculo_id}_{nome_pdf(registro)}", fh.read()
+
+
+def _renderizados(ids):
+    """Gera os PDFs em paralelo, com no máximo algumas renderizações por processo em memória."""
+    if EXPORT_WORKERS <= 1:
+        for veiculo_id in ids:
+            yield _renderizar(veiculo_id)
+        return
+    restantes = iter(ids)
+    janela = EXPORT_WORKERS * 2
+    with ProcessPoolExecutor(EXPORT_WORKERS) as pool:
+        pendentes = {pool.submit(_renderizar, v) for _, v in zip(range(janela), restantes)}
+        while pendentes:
+            prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                proximo = next(restantes, None)
+                if proximo is not None:
+                    pendentes.add(pool.submit(_renderizar, proximo))
+                yield futuro.result()
+
+
+def gerar_zip(ids, destino, progresso=None):
+    # PDFs já são comprimidos: ZIP_STORED evita gastar CPU à toa
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_STORED) as zf:
+        for feitos, (nome, dados) in enumerate(_renderizados(ids), 1):
+            if nome is not None:
+                zf.writestr(nome, dados)
+            if progresso:
+                progresso(feitos)
+
+
+def _registros_em_lotes(ids):
+    """(id, registro ou None) na ordem de `ids`, carregados PDF_UNICO_LOTE por vez."""
+    for inicio in range(0, len(ids), PDF_UNICO_LOTE):
+        lote = ids[inicio:inicio + PDF_UNICO_LOTE]
+        registros = obter_registros(lote)
+        for veiculo_id in lote:
+            yield veiculo_id, registros.get(veiculo_id)
+
+
+def gerar_pdf_unico(ids, destino, progresso=None):
+    """
+    Todos os checklists em um PDF, precedidos de um sumário com links. As páginas
+    do sumário são reservadas no início e preenchidas no fim (formulários do
+    reportlab podem ser usados antes de definidos), quando o número da página de
+    cada checklist já é conhecido. Desenho em um só canvas, portanto sequencial:
+    o reportlab não importa páginas de outros PDFs, e links, marcadores e
+    numeração dependem de um único documento. Os registros vêm em lotes.
+    """
+    width, height = A4
+    margin = 40
+    c = canvas.Canvas(destino, pagesize=A4, invariant=1)
+    c.setTitle("Checklists")
+    paginas_sumario = max(1, math.ceil(len(ids) / SUMARIO_LINHAS))
+
+    def linha_y(i):
+        return height - margin - 40 - (i % SUMARIO_LINHAS) * 18
+
+    for p in range(paginas_sumario):
+        c.doForm(f"sumario{p}")
+        for i in range(p * SUMARIO_LINHAS, min(len(ids), (p + 1) * SUMARIO_LINHAS)):
+            y = linha_y(i)
+            c.linkAbsolute("", f"checklist{ids[i]}", (margin, y - 4, width - margin, y + 12))
+        c.showPage()
+
+    entradas = []
+    for feitos, (veiculo_id, registro) in enumerate(_registros_em_lotes(ids), 1):
+        destino_link = f"checklist{veiculo_id}"
+        c.bookmarkPage(destino_link)
+        if registro:
+            titulo = f"{registro.get('placa') or '-'}  {formatar_data(registro.get('criado_em')) or ''}"
+            c.addOutlineEntry(titulo, destino_link, level=0)
+            entradas.append((titulo, registro.get("condutor") or "", c.getPageNumber()))
+            desenhar_registro(c, registro)
+        else:
+            # removido depois da consulta: o link do sumário aponta para o próximo
+            entradas.append((f"#{veiculo_id} (removido)", "", None))
+        if progresso:
+            progresso(feitos)
+    if entradas and entradas[-1][2] is None:
+        # o último foi removido: o link do sumário precisa de uma página de destino
+        c.showPage()
+
+    for p in range(paginas_sumario):
+        c.beginForm(f"sumario{p}")
+        c.setFont("Helvetica-Bold", 16)
+        c.drawString(margin, height - margin, "Sumário" if p == 0 else "Sumário (cont.)")
+        c.setFont("Helvetica", 10)
+        for i in range(p * SUMARIO_LINHAS, min(len(entradas), (p + 1) * SUMARIO_LINHAS)):
+            titulo, condutor, pagina = entradas[i]
+            y = linha_y(i)
+            c.drawString(margin, y, titulo)
+            c.drawString(margin + 200, y, condutor[:50])
+            if pagina is not None:
+                c.drawRightString(width - margin, y, str(pagina))
+        c.endForm()
+    c.save()
+
+
+def _linhas_extrato(extrato, filtros):
+    """Gera o cabeçalho e depois as linhas do extrato, lidas do cursor uma a uma."""
+    colunas, juncao = EXTRATOS[extrato]
+    from_sql, where_clauses, params, _ = filtro_veiculos(**filtros)
+    where_sql = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    # ordem pela chave (sem ordenar o resultado inteiro antes da primeira linha)
+    ordem = "v.id" + {"itens": ", i.id", "manutencoes": ", m.id"}.get(extrato, "")
+    with connection() as conn:
+        cur = conn.execute(f"SELECT {colunas} {from_sql} {juncao} {where_sql} ORDER BY {ordem}", params)
+        yield [d[0] for d in cur.description]
+        yield from cur
+
+
+def gerar_extrato(extrato, formato, filtros, gzip=False):
+    """
+    Extrato em CSV ou NDJSON como um gerador de blocos de bytes (para Response ou
+    arquivo). A conexão é própria e só é devolvida ao pool no fim do fluxo.
+    """
+    if extrato not in EXTRATOS or formato not in FORMATOS_EXTRATO:
+        raise ValueError(f"extrato/formato inválido: {extrato}.{formato}")
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None  # wbits=31: formato gzip
+    buf = io.StringIO()
+    escritor = csv.writer(buf, lineterminator="\n")
+    linhas = _linhas_extrato(extrato, filtros)
+    colunas = next(linhas)
+    if formato == "csv":
+        escritor.writerow(colunas)
+    for linha in linhas:
+        if formato == "csv":
+            escritor.writerow(linha)
+        else:
+            buf.write(json.dumps(dict(zip(colunas, linha)), ensure_ascii=False))
+            buf.write("\n")
+        if buf.tell() >= EXTRATO_BLOCO:
+            bloco = buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+            bloco = compressor.compress(bloco) if compressor else bloco
+            if bloco:
+                yield bloco
+    bloco = buf.getvalue().encode()
+    yield compressor.compress(bloco) + compressor.flush() if compressor else bloco
+
+
+def _exportacao(conn, exportacao_id):
+    row = conn.execute("SELECT * FROM exportacoes WHERE id = ?", (exportacao_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def _limpar_expiradas(conn):
+    """Apaga os arquivos de exportações mais antigas que EXPORT_TTL."""
+    rows = conn.execute("""
+        SELECT id, arquivo FROM exportacoes
+        WHERE arquivo IS NOT NULL AND criado_em < datetime('now', ?)
+    """, (f"-{EXPORT_TTL} seconds",)).fetchall()
+    for exportacao_id, arquivo in rows:
+        try:
+            os.remove(os.path.join(EXPORT_DIR, arquivo))
+        except FileNotFoundError:
+            pass
+        conn.execute("""
+            UPDATE exportacoes SET estado = 'expirado', arquivo = NULL, atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (exportacao_id,))
+    conn.commit()
+
+
+def _ids_exportacao(filtros):
+    """Ids a exportar; ValueError se passarem de EXPORT_MAX_REGISTROS (a exportação nunca é cortada)."""
+    ids = ids_veiculos(limite=EXPORT_MAX_REGISTROS + 1, **filtros)
+    if len(ids) > EXPORT_MAX_REGISTROS:
+        raise ValueError(f"a seleção passa de {EXPORT_MAX_REGISTROS} checklists; refine os filtros")
+    return ids
+
+
+def iniciar(conn, filtros, formato, usuario_id=None, fila=True):
+    """
+    Registra a exportação e (com `fila`) enfileira o job que a executa; retorna o id.
+    ValueError se o formato for inválido ou a seleção passar do limite.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"formato inválido: {formato}")
+    _ids_exportacao(filtros)
+    _limpar_expiradas(conn)
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(
+            "INSERT INTO exportacoes(usuario_id, formato, filtros) VALUES (?, ?, ?)",
+            (usuario_id, formato, json.dumps(filtros, sort_keys=True))
+        )
+        exportacao_id = cur.lastrowid
+        if fila:
+            enfileirar(cur, "exportacao", {"exportacao": exportacao_id})
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return exportacao_id
+
+
+def _assumir(conn, exportacao_id):
+    """
+    Passa a exportação para 'executando' se ninguém estiver com ela. Uma execução
+    ativa grava o progresso a cada PROGRESSO_INTERVALO; sem atualização há mais de
+    JOBS_TIMEOUT segundos, o processo que a executava é considerado morto.
+    """
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        row = cur.execute("""
+            UPDATE exportacoes SET estado = 'executando', feitos = 0, erro = NULL,
+                   atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND (estado IN ('pendente', 'erro')
+                              OR (estado = 'executando' AND atualizado_em < datetime('now', ?)))
+            RETURNING id
+        """, (exportacao_id, f"-{JOBS_TIMEOUT} seconds")).fetchone()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return row is not None
+
+
+def executar(conn, exportacao_id):
+    """
+    Gera o arquivo da exportação. Retorna False se ela já estiver em andamento
+    em outro processo (nada é feito).
+    """
+    if not _assumir(conn, exportacao_id):
+        return False
+    exportacao = _exportacao(conn, exportacao_id)
+    try:
+        ids = _ids_exportacao(json.loads(exportacao["filtros"]))
+    except ValueError as e:
+        # a seleção cresceu depois de iniciar(): erro definitivo, sem nova tentativa do job
+        conn.execute("""
+            UPDATE exportacoes SET estado = 'erro', erro = ?, atualizado_em = CURRENT_TIMESTAMP WHERE id = ?
+        """, (str(e), exportacao_id))
+        conn.commit()
+        return True
+    conn.execute("UPDATE exportacoes SET total = ? WHERE id = ?", (len(ids), exportacao_id))
+    conn.commit()
+
+    ultimo = [time.monotonic()]
+
+    def progresso(feitos):
+        if feitos < len(ids) and time.monotonic() - ultimo[0] < PROGRESSO_INTERVALO:
+            return
+        ultimo[0] = time.monotonic()
+        conn.execute("""
+            UPDATE exportacoes SET feitos = ?, atualizado_em = CURRENT_TIMESTAMP WHERE id = ?
+        """, (feitos, exportacao_id))
+        conn.commit()
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    arquivo = f"exportacao_{exportacao_id}.{exportacao['formato']}"
+    destino = os.path.join(EXPORT_DIR, arquivo)
+    tmp = f"{destino}.{os.getpid()}.tmp"
+    try:
+        if exportacao["formato"] == "zip":
+            gerar_zip(ids, tmp, progresso)
+        else:
+            gerar_pdf_unico(ids, tmp, progresso)
+        os.replace(tmp, destino)
+    except Exception as e:
+        conn.execute("""
+            UPDATE exportacoes SET estado = 'erro', erro = ?, atualizado_em = CURRENT_TIMESTAMP WHERE id = ?
+        """, (f"{type(e).__name__}: {e}", exportacao_id))
+        conn.commit()
+        raise
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    conn.execute("""
+        UPDATE exportacoes SET estado = 'concluido', feitos = ?, arquivo = ?, bytes = ?,
+               atualizado_em = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """, (len(ids), arquivo, os.path.getsize(destino), exportacao_id))
+    conn.commit()
+    return True
+
+
+def status(conn, exportacao_id):
+    """Progresso da exportação (None se não existir)."""
+    exportacao = _exportacao(conn, exportacao_id)
+    if exportacao:
+        exportacao["filtros"] = json.loads(exportacao["filtros"])
+        total = exportacao["total"]
+        exportacao["percentual"] = round(100 * exportacao["feitos"] / total, 1) if total else None
+    return exportacao
+
+
+def caminho_arquivo(exportacao):
+    """Caminho do arquivo de uma exportação concluída (ou None)."""
+    if exportacao["estado"] != "concluido" or not exportacao["arquivo"]:
+        return None
+    caminho = os.path.join(EXPORT_DIR, exportacao["arquivo"])
+    return caminho if os.path.exists(caminho) else None
+
+
+@tarefa("exportacao")
+def _tarefa_exportacao(conn, payload):
+    """Job da fila; se outra execução estiver ativa, confere de novo mais tarde."""
+    if not executar(conn, payload["exportacao"]):
+        exportacao = _exportacao(conn, payload["exportacao"])
+        if exportacao and exportacao["estado"] == "executando":
+            cur = conn.cursor()
+            enfileirar(cur, "exportacao", payload, atraso=JOBS_TIMEOUT)
+            conn.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exportação em lote de checklists (ZIP de PDFs ou PDF único)")
+    parser.add_argument("--formato", choices=FORMATOS + FORMATOS_EXTRATO, default="zip")
+    parser.add_argument("--extrato", choices=tuple(EXTRATOS), default="veiculos", help="para csv/ndjson")
+    parser.add_argument("--gzip", action="store_true", help="comprime o extrato csv/ndjson")
+    parser.add_argument("--tipo")
+    parser.add_argument("--q", help="busca em placa, condutor, modelo e observações")
+    parser.add_argument("--placa")
+    parser.add_argument("--data-ini", help="dd/mm/aaaa")
+    parser.add_argument("--data-fim", help="dd/mm/aaaa")
+    parser.add_argument("--criticos", action="store_true", help="só checklists com itens críticos")
+    parser.add_argument("--oleo-alert", action="store_true", help="só veículos com troca de óleo vencida")
+    parser.add_argument("-o", "--saida", required=True, help="arquivo de saída (- para stdout em csv/ndjson)")
+    args = parser.parse_args()
+    filtros = normalizar_filtros(vars(args))
+    if args.formato in FORMATOS_EXTRATO:
+        saida = sys.stdout.buffer if args.saida == "-" else open(args.saida, "wb")
+        with saida:
+            for bloco in gerar_extrato(args.extrato, args.formato, filtros, gzip=args.gzip):
+                saida.write(bloco)
+    else:
+        with connection() as conn:
+            try:
+                exportacao_id = iniciar(conn, filtros, args.formato, fila=False)
+            except ValueError as e:
+                parser.error(str(e))
+            executar(conn, exportacao_id)
+            st = status(conn, exportacao_id)
+            if st["estado"] != "concluido":
+                sys.exit(f"Exportação falhou: {st['erro']}")
+            shutil.copyfile(caminho_arquivo(st), args.saida)
+            print(f"{st['total']} checklist(s) exportado(s) para {args.saida} ({st['bytes']} bytes).")
@@ -0,0 +1,259 @@
+"""
+Coleta incremental de anexos órfãos (mark-and-sweep).
+
+Percorre ANEXOS_DIR em ordem lexicográfica com os.scandir, em lotes de GC_LOTE
+arquivos. Cada lote é conferido contra os índices das colunas que referenciam
+anexos (sem carregar todos os nomes em memória). O progresso fica em
+`gc_execucoes`, o que permite retomar uma execução interrompida. Arquivos
+modificados há menos de GC_CARENCIA segundos são ignorados, para não apagar
+uploads de um /salvar ainda não confirmado.
+
+Pela fila de tarefas, cada job processa uma fatia de GC_FATIA segundos e
+reenfileira a continuação. Pela linha de comando a execução vai até o fim:
+
+    python gc_anexos.py            # só contabiliza (dry-run)
+    python gc_anexos.py --confirm  # remove os órfãos
+"""
+import argparse
+import json
+import os
+import time
+
+from config import ANEXOS_DIR, GC_CARENCIA, GC_LOTE, GC_FATIA
+from db import connection
+from jobs import tarefa, enfileirar
+
+# quantidade máxima de nomes guardados em gc_execucoes.amostra
+AMOSTRA_MAX = 200
+
+
+def _percorrer(depois=None, base=ANEXOS_DIR, prefixo=""):
+    """
+    Gera (caminho_relativo, stat) de todos os arquivos em ordem lexicográfica do
+    caminho, pulando os que forem <= `depois` (retomada) e o diretório tmp/.
+    """
+    with os.scandir(base) as it:
+        # diretórios ordenados como "nome/" para que a ordem da travessia seja a
+        # mesma da comparação de strings usada na retomada
+        entradas = sorted(it, key=lambda e: e.name + "/" if e.is_dir(follow_symlinks=False) else e.name)
+    for entrada in entradas:
+        rel = prefixo + entrada.name
+        if entrada.is_dir(follow_symlinks=False):
+            if not prefixo and entrada.name == "tmp":
+                continue
+            dir_rel = rel + "/"
+            if depois is not None and depois > dir_rel and not depois.startswith(dir_rel):
+                continue  # tudo dentro deste diretório já foi visitado
+            yield from _percorrer(depois, entrada.path, dir_rel)
+        elif entrada.is_file(follow_symlinks=False):
+            if depois is None or rel > depois:
+                yield rel, entrada.stat(follow_symlinks=False)
+
+
+def _referenciados(cur, nomes):
+    """Subconjunto de `nomes` referenciado pelo banco (busca pelos índices de cada coluna)."""
+    if not nomes:
+        return set()
+    marcadores = ", ".join("?" * len(nomes))
+    cur.execute(f"""
+        SELECT foto_carro FROM veiculos WHERE foto_carro IN ({marcadores})
+        UNION
+        SELECT caminho_foto FROM itens_checklist WHERE caminho_foto IN ({marcadores})
+        UNION
+        SELECT caminho_thumb FROM itens_checklist WHERE caminho_thumb IN ({marcadores})
+        UNION
+        SELECT d.arquivo FROM derivadas d
+        WHERE d.arquivo IN ({marcadores})
+          AND (EXISTS (SELECT 1 FROM veiculos v WHERE v.foto_carro = d.original)
+               OR EXISTS (SELECT 1 FROM itens_checklist i WHERE i.caminho_foto = d.original))
+    """, list(nomes) * 4)
+    return {row[0] for row in cur.fetchall()}
+
+
+def _remover(cur, orfaos):
+    """
+    Apaga os órfãos (reconferidos sob o lock de escrita) e seus registros. Retorna (nomes, bytes).
+    Um upload repetido só renova o mtime do arquivo existente e soma em `anexos`
+    antes de gravar as referências; por isso, além das referências, o mtime e
+    `anexos.refs` são conferidos de novo aqui, depois do stat da varredura.
+    """
+    limite = time.time() - GC_CARENCIA
+    atuais = {}
+    for nome in orfaos:
+        try:
+            st = os.stat(os.path.join(ANEXOS_DIR, nome))
+        except FileNotFoundError:
+            continue
+        if st.st_mtime < limite:
+            atuais[nome] = st
+    if not atuais:
+        return [], 0
+    marcadores = ", ".join("?" * len(atuais))
+    em_uso = _referenciados(cur, list(atuais)) | {row[0] for row in cur.execute(
+        f"SELECT caminho FROM anexos WHERE caminho IN ({marcadores}) AND refs > 0", list(atuais)
+    )}
+    orfaos = {nome: st for nome, st in atuais.items() if nome not in em_uso}
+    if not orfaos:
+        return [], 0
+    marcadores = ", ".join("?" * len(orfaos))
+    nomes = list(orfaos)
+    cur.execute(f"DELETE FROM derivadas WHERE arquivo IN ({marcadores}) OR original IN ({marcadores})", nomes * 2)
+    cur.execute(f"DELETE FROM anexos WHERE caminho IN ({marcadores}) AND refs <= 0", nomes)
+    removidos, total = [], 0
+    for nome, st in orfaos.items():
+        try:
+            os.remove(os.path.join(ANEXOS_DIR, nome))
+        except FileNotFoundError:
+            continue
+        removidos.append(nome)
+        total += st.st_size
+    return removidos, total
+
+
+def _processar_lote(conn, execucao, lote):
+    """
+    Confere e grava o lote. Retorna False, sem alterar nada, se outro processo
+    (o job da fila e a linha de comando na mesma execução) já avançou o cursor ou
+    encerrou a execução desde que `execucao` foi lida.
+    """
+    limite = time.time() - GC_CARENCIA
+    cur = conn.cursor()
+    candidatos = {nome: st for nome, st in lote if st.st_mtime < limite}
+    ref = _referenciados(cur, list(candidatos))
+    orfaos = {nome: st for nome, st in candidatos.items() if nome not in ref}
+
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        atual = cur.execute("SELECT estado, cursor FROM gc_execucoes WHERE id = ?", (execucao["id"],)).fetchone()
+        if atual is None or tuple(atual) != ("executando", execucao["cursor"]):
+            conn.rollback()
+            return False
+        removidos, bytes_removidos = ([], 0)
+        if orfaos and not execucao["dry_run"]:
+            removidos, bytes_removidos = _remover(cur, orfaos)
+        amostra = json.loads(execucao["amostra"] or "[]")
+        amostra += (removidos if not execucao["dry_run"] else list(orfaos))[:AMOSTRA_MAX - len(amostra)]
+        cur.execute("""
+            UPDATE gc_execucoes
+            SET cursor = ?, verificados = verificados + ?, orfaos = orfaos + ?,
+                removidos = removidos + ?, bytes_removidos = bytes_removidos + ?,
+                amostra = ?, atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (lote[-1][0], len(lote), len(orfaos), len(removidos), bytes_removidos,
+              json.dumps(amostra), execucao["id"]))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return True
+
+
+def _concluir(conn, execucao):
+    """Encerra a execução se ela ainda estiver no cursor de `execucao`; retorna False se não estava."""
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("""
+            UPDATE gc_execucoes SET estado = 'concluido', atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND estado = 'executando' AND cursor IS ?
+        """, (execucao["id"], execucao["cursor"]))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return cur.rowcount == 1
+
+
+def _execucao(conn, execucao_id):
+    row = conn.execute("SELECT * FROM gc_execucoes WHERE id = ?", (execucao_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def executar(conn, execucao_id, segundos=None):
+    """
+    Continua a execução a partir do cursor salvo. Com `segundos`, para ao fim do
+    lote em que o tempo se esgotar. Retorna True quando a execução terminou.
+    Se outro processo avançar o cursor no meio do caminho, retoma do cursor gravado.
+    """
+    inicio = time.monotonic()
+    while True:
+        execucao = _execucao(conn, execucao_id)
+        if execucao is None or execucao["estado"] != "executando":
+            return True
+        lote = []
+        for item in _percorrer(execucao["cursor"]):
+            lote.append(item)
+            if len(lote) >= GC_LOTE:
+                if not _processar_lote(conn, execucao, lote):
+                    break
+                lote = []
+                execucao = _execucao(conn, execucao_id)
+                if segundos is not None and time.monotonic() - inicio >= segundos:
+                    return False
+        else:
+            if not lote or _processar_lote(conn, execucao, lote):
+                if _concluir(conn, _execucao(conn, execucao_id)):
+                    return True
+
+
+def iniciar(conn, dry_run=True, fila=True):
+    """
+    Cria uma execução (ou devolve a que já está em andamento) e (com `fila`)
+    enfileira o primeiro job.
+    """
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        row = cur.execute("SELECT id FROM gc_execucoes WHERE estado = 'executando' ORDER BY id LIMIT 1").fetchone()
+        if row:
+            conn.rollback()
+            return row[0]
+        cur.execute("INSERT INTO gc_execucoes(dry_run) VALUES (?)", (1 if dry_run else 0,))
+        execucao_id = cur.lastrowid
+        if fila:
+            enfileirar(cur, "gc_anexos", {"execucao": execucao_id})
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return execucao_id
+
+
+def status(conn, execucao_id=None):
+    """Progresso de uma execução (por padrão, a mais recente); None se nunca houve execução."""
+    if execucao_id is None:
+        row = conn.execute("SELECT id FROM gc_execucoes ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            return None
+        execucao_id = row[0]
+    execucao = _execucao(conn, execucao_id)
+    if execucao:
+        execucao["dry_run"] = bool(execucao["dry_run"])
+        execucao["amostra"] = json.loads(execucao["amostra"] or "[]")
+    return execucao
+
+
+@tarefa("gc_anexos")
+def _tarefa_gc(conn, payload):
+    """Job da fila: processa uma fatia da execução e reenfileira a continuação."""
+    if not executar(conn, payload["execucao"], segundos=GC_FATIA):
+        cur = conn.cursor()
+        enfileirar(cur, "gc_anexos", payload)
+        conn.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coleta de anexos órfãos")
+    parser.add_argument("--confirm", action="store_true", help="remove os arquivos (padrão: só contabiliza)")
+    args = parser.parse_args()
+    with connection() as conn:
+        # roda aqui mesmo, sem job; se já havia uma execução em andamento pela
+        # fila, os dois processos dividem os lotes pelo cursor
+        execucao_id = iniciar(conn, dry_run=not args.confirm, fila=False)
+        while not executar(conn, execucao_id, segundos=5):
+            st = status(conn, execucao_id)
+            print(f"  {st['verificados']} verificados, {st['orfaos']} órfãos, {st['removidos']} removidos "
+                  f"(até {st['cursor']})")
+        st = status(conn, execucao_id)
+        print(f"Concluído: {st['verificados']} arquivos verificados, {st['orfaos']} órfãos, "
+              f"{st['removidos']} removidos ({st['bytes_removidos']} bytes).")
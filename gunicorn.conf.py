@@ -0,0 +1,31 @@
+# Carregado automaticamente pelo gunicorn (arquivo ./gunicorn.conf.py)
+from config import WEB_THREADS
+
+# Workers com threads: as conexões SSE do dashboard (/api/eventos) ficam abertas
+# e quase sempre ociosas; com workers síncronos cada uma prenderia um processo.
+# Cada worker atende até WEB_THREADS requisições simultâneas (SSE_MAX_CLIENTES
+# delas podem ser fluxos de eventos).
+worker_class = "gthread"
+threads = WEB_THREADS
+
+
+def on_starting(server):
+    """Aplica as migrações pendentes no processo master, antes do fork dos workers."""
+    from migrations import migrate
+    migrate()
+
+
+def when_ready(server):
+    """Sobe o pool de workers da fila de tarefas (jobs.py) junto com o master."""
+    import subprocess
+    import sys
+    from config import JOBS_WORKERS
+    if JOBS_WORKERS > 0:
+        server._jobs_proc = subprocess.Popen([sys.executable, "jobs.py", "--workers", str(JOBS_WORKERS)])
+
+
+def on_exit(server):
+    proc = getattr(server, "_jobs_proc", None)
+    if proc is not None:
+        proc.terminate()
+        proc.wait(timeout=30)
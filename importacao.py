@@ -0,0 +1,555 @@
+"""
+Importação em lote de checklists e manutenções históricos (CSV ou NDJSON, opcionalmente .gz).
+
+O arquivo é lido em fluxo e validado registro a registro; os registros válidos
+são gravados em transações de IMPORT_LOTE. Dentro de cada transação os triggers
+por linha de itens_checklist (índice de busca e contador de críticos) ficam
+inativos (marca em `importando`, sem alterar o schema) e esse trabalho é refeito
+uma vez por lote, por conjunto; os agregados do dashboard também são somados
+uma vez por lote. O checkpoint
+(linhas do arquivo já processadas) é gravado na transação do lote, então uma
+importação interrompida continua exatamente de onde parou.
+
+Pela fila de tarefas, cada job processa uma fatia de IMPORT_FATIA segundos e
+reenfileira a continuação. Pela linha de comando a execução vai até o fim:
+
+    python importacao.py checklists historico.csv
+    python importacao.py manutencoes manutencoes.ndjson.gz
+    python importacao.py --retomar 3
+
+Formatos:
+  - checklists, CSV: uma linha por item. Linhas seguidas com a mesma `ref` (ou,
+    sem essa coluna, mesma placa e criado_em) formam um checklist. Colunas: ref,
+    tipo, placa, modelo, condutor, quilometragem, oleo_km, oleo_data,
+    observacoes, criado_em, nome_item, status, comentario.
+  - checklists, NDJSON: um checklist por linha, com a lista `itens`.
+  - manutencoes: uma por linha, com veiculo_id ou placa (o checklist mais
+    recente da placa), nome_peca, data_manutencao, quilometragem_atual e os
+    opcionais vida_util_km, proxima_manutencao_km, valor_peca, mao_de_obra e
+    observacoes.
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import re
+import secrets
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import IMPORT_DIR, IMPORT_LOTE, IMPORT_FATIA, IMPORT_RETENCAO, STATUS_CRITICOS
+from db import connection, incrementar_geracao
+from eventos import publicar, kpis
+from jobs import tarefa, enfileirar
+from services import ITENS_CARRO, ITENS_MOTO, km_para_int, incrementar_stats
+
+TIPOS = ("checklists", "manutencoes")
+FORMATOS = ("csv", "ndjson")
+# quantidade máxima de erros de validação guardados em importacoes.erros
+ERROS_MAX = 200
+# catálogo de itens, resolvido uma vez: nome sem maiúsculas/espaços -> nome oficial
+CATALOGO_ITENS = {nome.casefold(): nome for nome in ITENS_CARRO + ITENS_MOTO}
+COLUNAS_OBRIGATORIAS = {
+    "checklists": {"placa", "criado_em"},
+    "manutencoes": {"nome_peca", "data_manutencao", "quilometragem_atual"},
+}
+
+
+class RegistroInvalido(ValueError):
+    pass
+
+
+def formato_do_arquivo(nome):
+    """'csv' ou 'ndjson' pela extensão (ignorando .gz); None se não reconhecida."""
+    nome = nome.lower().removesuffix(".gz")
+    if nome.endswith(".csv"):
+        return "csv"
+    if nome.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Leitura e validação
+# ---------------------------------------------------------------------------
+
+def _abrir(caminho):
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, "rt", encoding="utf-8-sig", newline="")
+    return open(caminho, encoding="utf-8-sig", newline="")
+
+
+def _linhas_csv(fh, tipo):
+    """Gera (linha, dict) das linhas de dados; separador ',' ou ';' (Excel em português)."""
+    cabecalho = fh.readline()
+    separador = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+    colunas = [c.strip().lower() for c in next(csv.reader([cabecalho], delimiter=separador), [])]
+    faltando = COLUNAS_OBRIGATORIAS[tipo] - set(colunas)
+    if tipo == "manutencoes" and not {"veiculo_id", "placa"} & set(colunas):
+        faltando.add("veiculo_id ou placa")
+    if faltando:
+        raise ValueError(f"colunas obrigatórias ausentes: {', '.join(sorted(faltando))}")
+    for linha, valores in enumerate(csv.reader(fh, delimiter=separador), 1):
+        if any(v.strip() for v in valores):
+            yield linha, dict(zip(colunas, valores))
+
+
+def _registros(caminho, tipo, formato):
+    """
+    Gera (ultima_linha, registro_bruto | RegistroInvalido) na ordem do arquivo.
+    `ultima_linha` é o número da última linha de dados consumida: o checkpoint.
+    """
+    with _abrir(caminho) as fh:
+        if formato == "ndjson":
+            for linha, texto in enumerate(fh, 1):
+                if not texto.strip():
+                    continue
+                try:
+                    registro = json.loads(texto)
+                    if not isinstance(registro, dict):
+                        raise ValueError("esperado um objeto JSON")
+                except ValueError as e:
+                    yield linha, RegistroInvalido(f"JSON inválido ({e})")
+                else:
+                    yield linha, registro
+            return
+        if tipo == "manutencoes":
+            yield from _linhas_csv(fh, tipo)
+            return
+        # checklists: agrupa as linhas de itens consecutivas do mesmo checklist
+        grupo, chave_grupo, ultima = None, None, 0
+        for linha, row in _linhas_csv(fh, tipo):
+            chave = row.get("ref") or (row.get("placa"), row.get("criado_em"))
+            if grupo is not None and chave != chave_grupo:
+                yield ultima, grupo
+                grupo = None
+            if grupo is None:
+                grupo, chave_grupo = dict(row, itens=[]), chave
+            if (row.get("nome_item") or "").strip():
+                grupo["itens"].append(row)
+            ultima = linha
+        if grupo is not None:
+            yield ultima, grupo
+
+
+def _texto(registro, campo, obrigatorio=False):
+    valor = registro.get(campo)
+    valor = str(valor).strip() if valor is not None else ""
+    if obrigatorio and not valor:
+        raise RegistroInvalido(f"{campo} é obrigatório")
+    return valor or None
+
+
+def _data(valor, campo, com_hora):
+    """'aaaa-mm-dd[ hh:mm[:ss]]' ou 'dd/mm/aaaa[ hh:mm[:ss]]' -> ISO (com ou sem hora)."""
+    if valor is None:
+        return None
+    try:
+        d = datetime.fromisoformat(valor)
+    except ValueError:
+        for fmt in ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y"):
+            try:
+                d = datetime.strptime(valor, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise RegistroInvalido(f"{campo} inválida: {valor}")
+    return d.strftime("%Y-%m-%d %H:%M:%S" if com_hora else "%Y-%m-%d")
+
+
+def _numero(registro, campo, tipo=int):
+    """
+    Número do JSON ou texto no formato brasileiro ('10.000', '1.234,56').
+    Campos inteiros rejeitam casas decimais em vez de truncar.
+    """
+    bruto = registro.get(campo)
+    if isinstance(bruto, (int, float)) and not isinstance(bruto, bool):
+        if tipo is int and bruto != int(bruto):
+            raise RegistroInvalido(f"{campo} inválido: {bruto}")
+        return tipo(bruto)
+    valor = _texto(registro, campo)
+    if valor is None:
+        return None
+    if "," in valor or re.fullmatch(r"\d{1,3}(\.\d{3})+", valor):  # separador de milhar
+        valor = valor.replace(".", "").replace(",", ".")
+    if tipo is int:
+        if not re.fullmatch(r"[0-9]+", valor):
+            raise RegistroInvalido(f"{campo} inválido: {valor}")
+        return int(valor)
+    try:
+        return tipo(valor)
+    except ValueError:
+        raise RegistroInvalido(f"{campo} inválido: {valor}")
+
+
+def validar_checklist(registro):
+    """Registro bruto -> dict pronto para gravar; RegistroInvalido se não servir."""
+    tipo = (_texto(registro, "tipo") or "Carro").capitalize()
+    if tipo not in ("Carro", "Moto"):
+        raise RegistroInvalido(f"tipo inválido: {tipo}")
+    quilometragem = _texto(registro, "quilometragem")
+    km_oleo = km_para_int(_texto(registro, "oleo_km"))
+    brutos = registro.get("itens") or []
+    if not isinstance(brutos, list):
+        raise RegistroInvalido("itens: esperado uma lista")
+    itens = []
+    for i, item in enumerate(brutos, 1):
+        if not isinstance(item, dict):
+            raise RegistroInvalido(f"item {i}: esperado um objeto")
+        nome = _texto(item, "nome_item", obrigatorio=True)
+        itens.append((
+            CATALOGO_ITENS.get(nome.casefold(), nome),
+            _texto(item, "status", obrigatorio=True),
+            _texto(item, "comentario") or "",
+        ))
+    return {
+        "tipo": tipo,
+        "placa": _texto(registro, "placa", obrigatorio=True).upper(),
+        "modelo": _texto(registro, "modelo"),
+        "condutor": _texto(registro, "condutor"),
+        "quilometragem": quilometragem,
+        "km": km_para_int(quilometragem),
+        "oleo_km": str(km_oleo) if km_oleo is not None else None,
+        "km_oleo": km_oleo,
+        "oleo_data": _data(_texto(registro, "oleo_data"), "oleo_data", com_hora=False),
+        "observacoes": _texto(registro, "observacoes"),
+        "criado_em": _data(_texto(registro, "criado_em", obrigatorio=True), "criado_em", com_hora=True),
+        "itens": itens,
+    }
+
+
+def validar_manutencao(registro):
+    veiculo_id = _numero(registro, "veiculo_id")
+    placa = _texto(registro, "placa")
+    if veiculo_id is None and placa is None:
+        raise RegistroInvalido("veiculo_id ou placa é obrigatório")
+    quilometragem = _texto(registro, "quilometragem_atual", obrigatorio=True)
+    return {
+        "veiculo_id": veiculo_id,
+        "placa": placa.upper() if placa else None,
+        "nome_peca": _texto(registro, "nome_peca", obrigatorio=True),
+        "data_manutencao": _data(_texto(registro, "data_manutencao", obrigatorio=True), "data_manutencao",
+                                 com_hora=False),
+        "quilometragem_atual": quilometragem,
+        "km": km_para_int(quilometragem),
+        "vida_util_km": _numero(registro, "vida_util_km"),
+        "proxima_manutencao_km": _numero(registro, "proxima_manutencao_km"),
+        "valor_peca": _numero(registro, "valor_peca", float),
+        "mao_de_obra": _numero(registro, "mao_de_obra", float),
+        "observacoes": _texto(registro, "observacoes"),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Gravação por lote
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def _importando(cur):
+    """
+    Desativa os triggers por linha de itens_checklist (ver m016_importando) até o
+    fim do bloco. A marca é apagada na mesma transação, então as outras conexões
+    nunca a veem; numa falha, o rollback do lote a desfaz.
+    """
+    cur.execute("INSERT INTO importando DEFAULT VALUES")
+    yield
+    cur.execute("DELETE FROM importando")
+
+
+def _gravar_checklists(cur, lote):
+    criticos = ", ".join("?" * len(STATUS_CRITICOS))
+    ids = []
+    with _importando(cur):
+        for r in lote:
+            cur.execute("""
+                INSERT INTO veiculos (condutor, placa, modelo, criado_em, quilometragem, km, observacoes, tipo,
+                                      oleo_data, oleo_km, km_oleo)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (r["condutor"], r["placa"], r["modelo"], r["criado_em"], r["quilometragem"], r["km"],
+                  r["observacoes"], r["tipo"], r["oleo_data"], r["oleo_km"], r["km_oleo"]))
+            ids.append(cur.lastrowid)
+        cur.executemany("""
+            INSERT INTO itens_checklist (veiculo_id, nome_item, status, comentario) VALUES (?, ?, ?, ?)
+        """, [(veiculo_id,) + item for veiculo_id, r in zip(ids, lote) for item in r["itens"]])
+        # o que os triggers desativados fariam item a item, uma vez para o lote
+        lote_ids = json.dumps(ids)
+        cur.execute(f"""
+            UPDATE veiculos SET itens_criticos = (
+                SELECT COUNT(*) FROM itens_checklist it
+                WHERE it.veiculo_id = veiculos.id AND it.status IN ({criticos})
+            )
+            WHERE id IN (SELECT value FROM json_each(?))
+        """, STATUS_CRITICOS + (lote_ids,))
+        cur.execute("""
+            UPDATE busca_fts SET comentarios = (
+                SELECT group_concat(comentario, ' ') FROM itens_checklist
+                WHERE veiculo_id = busca_fts.rowid AND comentario IS NOT NULL AND comentario <> ''
+            )
+            WHERE rowid IN (SELECT value FROM json_each(?))
+        """, (lote_ids,))
+    deltas = incrementar_stats(cur, [
+        (r["tipo"], r["criado_em"], [(nome, status) for nome, status, _ in r["itens"]]) for r in lote
+    ])
+    # um evento por lote (sem o resumo de cada checklist) para os dashboards abertos
+    publicar(cur, "kpis", {"kpis": kpis(cur, *deltas)})
+    return len(lote), []
+
+
+def _gravar_manutencoes(cur, lote):
+    """Resolve os veículos do lote em duas consultas e insere as manutenções; retorna (inseridos, erros)."""
+    placas = json.dumps(sorted({r["placa"] for r in lote if r["veiculo_id"] is None}))
+    por_placa = dict(cur.execute("""
+        SELECT placa, MAX(id) FROM veiculos WHERE placa IN (SELECT value FROM json_each(?)) GROUP BY placa
+    """, (placas,)).fetchall())
+    existentes = {row[0] for row in cur.execute(
+        "SELECT id FROM veiculos WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted({r["veiculo_id"] for r in lote if r["veiculo_id"] is not None})),)
+    ).fetchall()}
+    linhas, erros = [], []
+    for r in lote:
+        veiculo_id = r["veiculo_id"] if r["veiculo_id"] is not None else por_placa.get(r["placa"])
+        if veiculo_id is None or (r["veiculo_id"] is not None and veiculo_id not in existentes):
+            erros.append((r["_linha"], f"veículo não encontrado: {r['veiculo_id'] or r['placa']}"))
+            continue
+        linhas.append((veiculo_id, r["nome_peca"], r["data_manutencao"], r["quilometragem_atual"], r["km"],
+                       r["vida_util_km"], r["proxima_manutencao_km"], r["valor_peca"], r["mao_de_obra"],
+                       r["observacoes"]))
+    cur.executemany("""
+        INSERT INTO manutencao
+        (veiculo_id, nome_peca, data_manutencao, quilometragem_atual, km,
+         vida_util_km, proxima_manutencao_km, valor_peca, mao_de_obra, observacoes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, linhas)
+    return len(linhas), erros
+
+
+def _gravar_lote(conn, importacao, lote, erros, linha_final, segundos):
+    """
+    Grava o lote e avança o checkpoint na mesma transação. Retorna False (nada
+    gravado) se o checkpoint mudou desde a leitura: outra execução está com ela.
+    """
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        gravar = _gravar_checklists if importacao["tipo"] == "checklists" else _gravar_manutencoes
+        inseridos, erros_lote = gravar(cur, lote) if lote else (0, [])
+        erros = erros + erros_lote
+        amostra = json.loads(importacao["erros"] or "[]")
+        amostra += [{"linha": linha, "erro": msg} for linha, msg in erros][:ERROS_MAX - len(amostra)]
+        cur.execute("""
+            UPDATE importacoes
+            SET linhas = ?, inseridos = inseridos + ?, rejeitados = rejeitados + ?, erros = ?,
+                segundos = segundos + ?, atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND linhas = ?
+        """, (linha_final, inseridos, len(erros), json.dumps(amostra, ensure_ascii=False), segundos,
+              importacao["id"], importacao["linhas"]))
+        if cur.rowcount == 0:
+            conn.rollback()
+            return False
+        if inseridos:
+            incrementar_geracao(cur)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Execução
+# ---------------------------------------------------------------------------
+
+def _importacao(conn, importacao_id):
+    row = conn.execute("SELECT * FROM importacoes WHERE id = ?", (importacao_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def _remover_arquivo(arquivo):
+    try:
+        os.remove(os.path.join(IMPORT_DIR, arquivo))
+    except FileNotFoundError:
+        pass
+
+
+def _limpar_abandonadas(conn):
+    """
+    Expira as importações paradas (com erro, ou cujo processo morreu) há mais de
+    IMPORT_RETENCAO segundos e apaga seus arquivos; depois disso não há retomada.
+    """
+    condicao = "estado IN ('erro', 'executando') AND COALESCE(atualizado_em, criado_em) < datetime('now', ?)"
+    limite = f"-{IMPORT_RETENCAO} seconds"
+    rows = conn.execute(f"SELECT id, arquivo FROM importacoes WHERE {condicao}", (limite,)).fetchall()
+    for importacao_id, arquivo in rows:
+        cur = conn.execute(f"""
+            UPDATE importacoes SET estado = 'expirado', atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND {condicao}
+        """, (importacao_id, limite))
+        conn.commit()
+        if cur.rowcount:
+            _remover_arquivo(arquivo)
+
+
+def executar(conn, importacao_id, segundos=None):
+    """
+    Continua a importação a partir do checkpoint. Com `segundos`, para ao fim do
+    lote em que o tempo se esgotar. Retorna True quando a importação terminou
+    (concluída, com erro fatal ou assumida por outra execução).
+    """
+    inicio = ultimo = time.monotonic()
+    importacao = _importacao(conn, importacao_id)
+    if importacao is None or importacao["estado"] != "executando":
+        return True
+    validar = validar_checklist if importacao["tipo"] == "checklists" else validar_manutencao
+    caminho = os.path.join(IMPORT_DIR, importacao["arquivo"])
+    lote, erros, linha_final = [], [], importacao["linhas"]
+    try:
+        for linha, bruto in _registros(caminho, importacao["tipo"], importacao["formato"]):
+            if linha <= importacao["linhas"]:
+                continue  # já gravado antes da interrupção
+            try:
+                if isinstance(bruto, RegistroInvalido):
+                    raise bruto
+                registro = validar(bruto)
+                registro["_linha"] = linha
+                lote.append(registro)
+            except RegistroInvalido as e:
+                erros.append((linha, str(e)))
+            linha_final = linha
+            if len(lote) + len(erros) >= IMPORT_LOTE:
+                agora = time.monotonic()
+                if not _gravar_lote(conn, importacao, lote, erros, linha_final, agora - ultimo):
+                    return True
+                ultimo = agora
+                lote, erros = [], []
+                importacao = _importacao(conn, importacao_id)
+                if segundos is not None and agora - inicio >= segundos:
+                    return False
+    except (OSError, ValueError) as e:
+        # arquivo ilegível ou sem as colunas obrigatórias: não adianta tentar de novo
+        conn.execute("""
+            UPDATE importacoes SET estado = 'erro', erro = ?, atualizado_em = CURRENT_TIMESTAMP WHERE id = ?
+        """, (f"{type(e).__name__}: {e}", importacao_id))
+        conn.commit()
+        return True
+    if (lote or erros) and not _gravar_lote(conn, importacao, lote, erros, linha_final,
+                                           time.monotonic() - ultimo):
+        return True
+    conn.execute("""
+        UPDATE importacoes SET estado = 'concluido', atualizado_em = CURRENT_TIMESTAMP WHERE id = ?
+    """, (importacao_id,))
+    conn.commit()
+    # concluída não se retoma: o arquivo enviado não serve mais
+    _remover_arquivo(importacao["arquivo"])
+    return True
+
+
+def iniciar(conn, tipo, origem, formato=None, usuario_id=None, fila=True):
+    """
+    Copia o arquivo (caminho ou objeto com .save(), como um upload do Flask) para
+    IMPORT_DIR, registra a importação e (com `fila`) enfileira o primeiro job.
+    O arquivo é apagado ao concluir, ou ao expirar (ver _limpar_abandonadas).
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f"tipo inválido: {tipo}")
+    _limpar_abandonadas(conn)
+    nome = origem if isinstance(origem, str) else (origem.filename or "")
+    formato = formato or formato_do_arquivo(nome)
+    if formato not in FORMATOS:
+        raise ValueError("formato não reconhecido: use .csv, .ndjson ou .jsonl (opcionalmente .gz)")
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    arquivo = f"{secrets.token_hex(8)}.{formato}" + (".gz" if nome.lower().endswith(".gz") else "")
+    destino = os.path.join(IMPORT_DIR, arquivo)
+    if isinstance(origem, str):
+        shutil.copyfile(origem, destino)
+    else:
+        origem.save(destino)
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(
+            "INSERT INTO importacoes(usuario_id, tipo, formato, arquivo) VALUES (?, ?, ?, ?)",
+            (usuario_id, tipo, formato, arquivo)
+        )
+        importacao_id = cur.lastrowid
+        if fila:
+            enfileirar(cur, "importacao", {"importacao": importacao_id})
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        os.remove(destino)
+        raise
+    return importacao_id
+
+
+def retomar(conn, importacao_id, fila=True):
+    """
+    Retoma uma importação interrompida (erro ou processo morto) a partir do
+    checkpoint. Uma execução ainda ativa não é afetada: o checkpoint só avança
+    para quem o leu primeiro (ver _gravar_lote).
+    """
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("""
+            UPDATE importacoes SET estado = 'executando', erro = NULL, atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND estado IN ('erro', 'executando')
+        """, (importacao_id,))
+        if cur.rowcount and fila:
+            enfileirar(cur, "importacao", {"importacao": importacao_id})
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def status(conn, importacao_id):
+    """Progresso da importação, com a taxa em linhas por segundo (None se não existir)."""
+    importacao = _importacao(conn, importacao_id)
+    if importacao:
+        importacao["erros"] = json.loads(importacao["erros"] or "[]")
+        segundos = importacao["segundos"]
+        importacao["linhas_por_segundo"] = round(importacao["linhas"] / segundos) if segundos else None
+    return importacao
+
+
+@tarefa("importacao")
+def _tarefa_importacao(conn, payload):
+    """Job da fila: processa uma fatia e reenfileira a continuação."""
+    if not executar(conn, payload["importacao"], segundos=IMPORT_FATIA):
+        cur = conn.cursor()
+        enfileirar(cur, "importacao", payload)
+        conn.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importação em lote de checklists e manutenções (CSV/NDJSON)")
+    parser.add_argument("tipo", nargs="?", choices=TIPOS)
+    parser.add_argument("arquivo", nargs="?")
+    parser.add_argument("--formato", choices=FORMATOS, help="padrão: pela extensão do arquivo")
+    parser.add_argument("--retomar", type=int, metavar="ID", help="continua uma importação a partir do checkpoint")
+    args = parser.parse_args()
+    if args.retomar is None and not (args.tipo and args.arquivo):
+        parser.error("informe tipo e arquivo, ou --retomar ID")
+    with connection() as conn:
+        if args.retomar is not None:
+            importacao_id = args.retomar
+            retomar(conn, importacao_id, fila=False)
+        else:
+            importacao_id = iniciar(conn, args.tipo, args.arquivo, args.formato, fila=False)
+        print(f"Importação {importacao_id}")
+        while not executar(conn, importacao_id, segundos=5):
+            st = status(conn, importacao_id)
+            print(f"  linha {st['linhas']}: {st['inseridos']} inseridos, {st['rejeitados']} rejeitados "
+                  f"({st['linhas_por_segundo']} linhas/s)")
+        st = status(conn, importacao_id)
+        if st["estado"] == "erro":
+            print(f"Erro: {st['erro']} (continue com --retomar {importacao_id})")
+        else:
+            print(f"Concluída: {st['linhas']} linhas, {st['inseridos']} inseridos, {st['rejeitados']} rejeitados "
+                  f"({st['linhas_por_segundo']} linhas/s).")
+        for erro in st["erros"][:20]:
+            print(f"  linha {erro['linha']}: {erro['erro']}")
@@ -0,0 +1,173 @@
+"""
+Fila durável de tarefas em segundo plano (tabela `jobs` do banco principal).
+
+As requisições só enfileiram (enfileirar(), na mesma transação da gravação) e
+respondem; um pool de processos consome a fila. Para iniciar os workers:
+
+    python jobs.py [--workers N]
+
+(o gunicorn.conf.py faz isso automaticamente, com JOBS_WORKERS processos).
+Tarefas são funções registradas com @tarefa("tipo") e devem ser idempotentes:
+um job interrompido é retomado após JOBS_TIMEOUT segundos. Jobs terminados
+(feito/erro) são apagados JOBS_RETENCAO segundos depois.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+
+from config import JOBS_WORKERS, JOBS_POLL_INTERVAL, JOBS_MAX_TENTATIVAS, JOBS_TIMEOUT, JOBS_RETENCAO
+from db import connection
+
+_tarefas = {}
+
+# intervalo (s) entre limpezas dos jobs terminados, por processo, e linhas por limpeza
+LIMPEZA_INTERVALO = 60
+LIMPEZA_LOTE = 1000
+_ultima_limpeza = [0.0]
+
+
+def tarefa(tipo):
+    """Registra `fn(conn, payload)` como executora dos jobs do tipo informado."""
+    def decorator(fn):
+        _tarefas[tipo] = fn
+        return fn
+    return decorator
+
+
+def enfileirar(cur, tipo, payload, atraso=0):
+    """Enfileira um job (disponível após `atraso` segundos). Chamar dentro da transação que o originou."""
+    cur.execute(
+        "INSERT INTO jobs(tipo, payload, disponivel_em) VALUES (?, ?, ?)",
+        (tipo, json.dumps(payload), time.time() + atraso if atraso else 0)
+    )
+
+
+def _limpar(cur, agora):
+    """Apaga (em lotes, pelo índice de finalizado_em) os jobs terminados há mais de JOBS_RETENCAO segundos."""
+    if time.monotonic() - _ultima_limpeza[0] < LIMPEZA_INTERVALO:
+        return
+    _ultima_limpeza[0] = time.monotonic()
+    cur.execute("""
+        DELETE FROM jobs WHERE id IN (
+            SELECT id FROM jobs WHERE finalizado_em < ? ORDER BY finalizado_em LIMIT ?
+        )
+    """, (agora - JOBS_RETENCAO, LIMPEZA_LOTE))
+
+
+def _reservar(conn):
+    """Marca o próximo job disponível como 'executando' e o retorna (ou None)."""
+    agora = time.time()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        _limpar(cur, agora)
+        # retoma jobs cujo worker morreu no meio da execução
+        cur.execute("""
+            UPDATE jobs SET estado = 'pendente'
+            WHERE estado = 'executando' AND iniciado_em < ?
+        """, (agora - JOBS_TIMEOUT,))
+        row = cur.execute("""
+            UPDATE jobs SET estado = 'executando', tentativas = tentativas + 1, iniciado_em = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE estado = 'pendente' AND disponivel_em <= ?
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id, tipo, payload, tentativas
+        """, (agora, agora)).fetchone()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return row
+
+
+def _finalizar(conn, job_id, erro=None, tentativas=0):
+    if erro is None:
+        conn.execute("UPDATE jobs SET estado = 'feito', erro = NULL, finalizado_em = ? WHERE id = ?",
+                     (time.time(), job_id))
+    elif tentativas >= JOBS_MAX_TENTATIVAS:
+        conn.execute("UPDATE jobs SET estado = 'erro', erro = ?, finalizado_em = ? WHERE id = ?",
+                     (erro, time.time(), job_id))
+    else:
+        # nova tentativa com espera crescente
+        conn.execute(
+            "UPDATE jobs SET estado = 'pendente', erro = ?, disponivel_em = ? WHERE id = ?",
+            (erro, time.time() + 5 * 2 ** tentativas, job_id)
+        )
+    conn.commit()
+
+
+def processar_um(conn):
+    """Executa um job da fila. Retorna False se não havia job disponível."""
+    job = _reservar(conn)
+    if job is None:
+        return False
+    job_id, tipo, payload, tentativas = job
+    try:
+        fn = _tarefas.get(tipo)
+        if fn is None:
+            raise LookupError(f"tipo de job desconhecido: {tipo}")
+        fn(conn, json.loads(payload))
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        _finalizar(conn, job_id, traceback.format_exc(limit=5), tentativas)
+    else:
+        _finalizar(conn, job_id)
+    return True
+
+
+def _worker(pai):
+    import services, gc_anexos, exportacao, importacao  # noqa: F401,E401  (registram as tarefas)
+    # SIGTERM (do processo pai ou do grupo todo) termina o job em curso antes de sair
+    parar = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: parar.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with connection() as conn:
+        while not parar and os.getppid() == pai:
+            if not processar_um(conn):
+                time.sleep(JOBS_POLL_INTERVAL)
+
+
+def main(workers=JOBS_WORKERS):
+    def iniciar():
+        # não-daemon: tarefas como a exportação abrem seus próprios processos;
+        # o encerramento é feito abaixo (terminate + join)
+        p = multiprocessing.Process(target=_worker, args=(os.getpid(),))
+        p.start()
+        return p
+
+    procs = [iniciar() for _ in range(max(1, workers))]
+    sinal = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: sinal.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: sinal.append(signum))
+    print(f"Fila de tarefas: {len(procs)} worker(s) em execução.")
+    try:
+        while not sinal:
+            time.sleep(1)
+            for i, p in enumerate(procs):
+                if not p.is_alive() and not sinal:
+                    procs[i] = iniciar()
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join(timeout=JOBS_TIMEOUT)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Workers da fila de tarefas em segundo plano")
+    parser.add_argument("--workers", type=int, default=JOBS_WORKERS)
+    args = parser.parse_args()
+    # usa o módulo importado (onde services registra as tarefas), não este __main__
+    import jobs
+    try:
+        jobs.main(args.workers)
+    except KeyboardInterrupt:
+        sys.exit(0)
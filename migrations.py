@@ -0,0 +1,683 @@
+"""
+Migrações versionadas do banco principal.
+
+Cada migração roda uma única vez, em transação própria, e é registrada em
+`schema_version`. O runner usa um lock de arquivo para que apenas um processo
+migre por vez. Execute antes de subir os workers:
+
+    python migrations.py
+
+(o gunicorn.conf.py faz isso no processo master). Na inicialização o app só
+confere a versão com verificar_schema().
+"""
+import os
+import sqlite3
+import sys
+
+from config import DB_FILE, STATUS_CRITICOS
+from db import _connect, file_lock
+
+LOCK_FILE = DB_FILE + ".migrate.lock"
+
+
+def status_criticos_sql():
+    """Lista STATUS_CRITICOS como literais SQL (para triggers, que não aceitam parâmetros)."""
+    return ", ".join("'" + s.replace("'", "''") + "'" for s in STATUS_CRITICOS)
+
+
+def _executar(cur, script):
+    """Executa várias instruções sem o COMMIT implícito de executescript()."""
+    stmt = ""
+    for line in script.splitlines(keepends=True):
+        stmt += line
+        if sqlite3.complete_statement(stmt):
+            cur.execute(stmt)
+            stmt = ""
+    if stmt.strip():
+        cur.execute(stmt)
+
+
+def _colunas(cur, tabela):
+    cur.execute(f"PRAGMA table_info({tabela})")
+    return {row[1] for row in cur.fetchall()}
+
+
+def _km_int(valor):
+    """'50.000 km' -> 50000 (apenas dígitos); None se não houver dígitos."""
+    nums = "".join(ch for ch in str(valor or "") if ch.isdigit())
+    return int(nums) if nums else None
+
+
+def _tabela_existe(cur, nome):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (nome,))
+    return cur.fetchone() is not None
+
+
+# ---------------------------------------------------------------------------
+# Migrações. Bancos anteriores ao controle de versão já podem ter parte do
+# schema, por isso as primeiras migrações são tolerantes (IF NOT EXISTS etc.).
+# ---------------------------------------------------------------------------
+
+def m001_schema_base(cur):
+    """Tabelas veiculos, itens_checklist, users e manutencao com seus índices."""
+    _executar(cur, """
+        CREATE TABLE IF NOT EXISTS veiculos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            condutor TEXT,
+            placa TEXT,
+            modelo TEXT,
+            data TEXT,
+            quilometragem TEXT,
+            observacoes TEXT,
+            foto_carro TEXT,
+            tipo TEXT
+        );
+        CREATE TABLE IF NOT EXISTS itens_checklist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            veiculo_id INTEGER,
+            nome_item TEXT,
+            status TEXT,
+            comentario TEXT,
+            caminho_foto TEXT,
+            caminho_thumb TEXT,
+            FOREIGN KEY (veiculo_id) REFERENCES veiculos(id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_veiculos_placa ON veiculos(placa);
+        CREATE INDEX IF NOT EXISTS idx_veiculos_condutor ON veiculos(condutor);
+        CREATE INDEX IF NOT EXISTS idx_veiculos_modelo ON veiculos(modelo);
+        CREATE INDEX IF NOT EXISTS idx_itens_veiculo ON itens_checklist(veiculo_id);
+        CREATE INDEX IF NOT EXISTS idx_itens_status ON itens_checklist(status);
+
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            email TEXT,
+            is_admin BOOLEAN DEFAULT 0,
+            reset_token TEXT,
+            reset_token_expiration TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS manutencao (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            veiculo_id INTEGER NOT NULL,
+            nome_peca TEXT NOT NULL,
+            data_manutencao TEXT NOT NULL,
+            quilometragem_atual TEXT NOT NULL,
+            vida_util_km INTEGER,
+            proxima_manutencao_km INTEGER,
+            valor_peca REAL,
+            mao_de_obra REAL,
+            observacoes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (veiculo_id) REFERENCES veiculos(id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_manutencao_veiculo ON manutencao(veiculo_id);
+        CREATE INDEX IF NOT EXISTS idx_manutencao_data ON manutencao(data_manutencao);
+        CREATE INDEX IF NOT EXISTS idx_manutencao_peca ON manutencao(nome_peca);
+    """)
+
+    # Colunas adicionadas depois da criação original das tabelas
+    cols = _colunas(cur, "veiculos")
+    for coluna in ("oleo_data", "oleo_km"):
+        if coluna not in cols:
+            cur.execute(f"ALTER TABLE veiculos ADD COLUMN {coluna} TEXT")
+    cols = _colunas(cur, "users")
+    for coluna, tipo in (("email", "TEXT"), ("reset_token", "TEXT"), ("reset_token_expiration", "TIMESTAMP")):
+        if coluna not in cols:
+            cur.execute(f"ALTER TABLE users ADD COLUMN {coluna} {tipo}")
+
+
+def m002_criado_em(cur):
+    """
+    Data/hora do checklist em ISO-8601 ('aaaa-mm-dd hh:mm:ss'), ordenável e indexada.
+    A coluna legada `data` ('dd/mm/aaaa hh:mm') é convertida.
+    """
+    if "criado_em" not in _colunas(cur, "veiculos"):
+        cur.execute("ALTER TABLE veiculos ADD COLUMN criado_em TEXT")
+    cur.execute("""
+        UPDATE veiculos
+        SET criado_em = substr(data,7,4)||'-'||substr(data,4,2)||'-'||substr(data,1,2)||' '||substr(data,12,5)||':00'
+        WHERE criado_em IS NULL
+          AND data GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9] [0-9][0-9]:[0-9][0-9]*'
+    """)
+    cur.execute("""
+        UPDATE veiculos
+        SET criado_em = substr(data,7,4)||'-'||substr(data,4,2)||'-'||substr(data,1,2)||' 00:00:00'
+        WHERE criado_em IS NULL
+          AND data GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_veiculos_criado_em ON veiculos(criado_em)")
+
+
+def m003_busca_fts(cur):
+    """
+    Índice FTS5 (tokenizer trigram, permite busca parcial de placa) com uma linha
+    por checklist: rowid = veiculos.id. Os comentários dos itens são concatenados
+    na coluna `comentarios`. Triggers mantêm o índice sincronizado.
+    """
+    existe = _tabela_existe(cur, "busca_fts")
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS busca_fts USING fts5(
+            placa, condutor, modelo, observacoes, comentarios,
+            tokenize = 'trigram'
+        )
+    """)
+    comentarios_sql = """(
+        SELECT group_concat(comentario, ' ') FROM itens_checklist
+        WHERE veiculo_id = {vid} AND comentario IS NOT NULL AND comentario <> ''
+    )"""
+    _executar(cur, f"""
+        CREATE TRIGGER IF NOT EXISTS trg_busca_veiculos_ai AFTER INSERT ON veiculos BEGIN
+            INSERT INTO busca_fts(rowid, placa, condutor, modelo, observacoes, comentarios)
+            VALUES (new.id, new.placa, new.condutor, new.modelo, new.observacoes, NULL);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_busca_veiculos_au
+        AFTER UPDATE OF placa, condutor, modelo, observacoes ON veiculos BEGIN
+            UPDATE busca_fts
+            SET placa = new.placa, condutor = new.condutor, modelo = new.modelo, observacoes = new.observacoes
+            WHERE rowid = new.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_busca_veiculos_ad AFTER DELETE ON veiculos BEGIN
+            DELETE FROM busca_fts WHERE rowid = old.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_busca_itens_ai AFTER INSERT ON itens_checklist
+        WHEN new.comentario IS NOT NULL AND new.comentario <> '' BEGIN
+            UPDATE busca_fts SET comentarios = {comentarios_sql.format(vid='new.veiculo_id')}
+            WHERE rowid = new.veiculo_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_busca_itens_au AFTER UPDATE OF comentario, veiculo_id ON itens_checklist BEGIN
+            UPDATE busca_fts SET comentarios = {comentarios_sql.format(vid='old.veiculo_id')}
+            WHERE rowid = old.veiculo_id;
+            UPDATE busca_fts SET comentarios = {comentarios_sql.format(vid='new.veiculo_id')}
+            WHERE rowid = new.veiculo_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_busca_itens_ad AFTER DELETE ON itens_checklist BEGIN
+            UPDATE busca_fts SET comentarios = {comentarios_sql.format(vid='old.veiculo_id')}
+            WHERE rowid = old.veiculo_id;
+        END;
+    """)
+    if not existe:
+        # Carga inicial a partir dos registros existentes
+        cur.execute(f"""
+            INSERT INTO busca_fts(rowid, placa, condutor, modelo, observacoes, comentarios)
+            SELECT v.id, v.placa, v.condutor, v.modelo, v.observacoes, {comentarios_sql.format(vid='v.id')}
+            FROM veiculos v
+        """)
+
+
+def m004_itens_criticos(cur):
+    """
+    Contador de itens críticos por checklist (veiculos.itens_criticos), mantido por
+    triggers em itens_checklist e coberto por um índice parcial. Assim o filtro
+    "críticos" e os KPIs não precisam de EXISTS/JOIN sobre todos os itens.
+    """
+    if "itens_criticos" not in _colunas(cur, "veiculos"):
+        cur.execute("ALTER TABLE veiculos ADD COLUMN itens_criticos INTEGER NOT NULL DEFAULT 0")
+    criticos = status_criticos_sql()
+    _executar(cur, f"""
+        CREATE TRIGGER IF NOT EXISTS trg_criticos_itens_ai AFTER INSERT ON itens_checklist
+        WHEN new.status IN ({criticos}) BEGIN
+            UPDATE veiculos SET itens_criticos = itens_criticos + 1 WHERE id = new.veiculo_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_criticos_itens_au AFTER UPDATE OF status, veiculo_id ON itens_checklist BEGIN
+            UPDATE veiculos SET itens_criticos = itens_criticos - (coalesce(old.status, '') IN ({criticos}))
+            WHERE id = old.veiculo_id;
+            UPDATE veiculos SET itens_criticos = itens_criticos + (coalesce(new.status, '') IN ({criticos}))
+            WHERE id = new.veiculo_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_criticos_itens_ad AFTER DELETE ON itens_checklist
+        WHEN old.status IN ({criticos}) BEGIN
+            UPDATE veiculos SET itens_criticos = itens_criticos - 1 WHERE id = old.veiculo_id;
+        END;
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_veiculos_criticos
+        ON veiculos(criado_em) WHERE itens_criticos > 0
+    """)
+    recalcular_criticos(cur)
+
+
+def m005_stats(cur):
+    """
+    Tabelas de agregados do dashboard. Inserções são contabilizadas por
+    services.salvar_checklist na mesma transação; exclusões e alterações por
+    triggers. rebuild_stats() recalcula tudo a partir das tabelas base.
+    """
+    criticos = status_criticos_sql()
+    inc = "INSERT INTO {tabela}({chave}, {valor}) VALUES ({k}, {d}) ON CONFLICT({chave}) DO UPDATE SET {valor} = {valor} + excluded.{valor};"
+
+    def stats(k, d):
+        return inc.format(tabela="stats", chave="chave", valor="valor", k=k, d=d)
+
+    def mes(k, d):
+        return inc.format(tabela="stats_mes", chave="mes", valor="qtd", k=k, d=d)
+
+    def item(k, d):
+        return inc.format(tabela="stats_itens_criticos", chave="nome_item", valor="qtd", k=k, d=d)
+
+    _executar(cur, f"""
+        CREATE TABLE IF NOT EXISTS stats (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS stats_mes (
+            mes TEXT PRIMARY KEY,
+            qtd INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS stats_itens_criticos (
+            nome_item TEXT PRIMARY KEY,
+            qtd INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_stats_veiculos_ad AFTER DELETE ON veiculos BEGIN
+            {stats("'checklists'", -1)}
+            {stats("'tipo:' || coalesce(old.tipo, '')", -1)}
+            {mes("coalesce(substr(old.criado_em, 1, 7), '')", -1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_stats_veiculos_au AFTER UPDATE OF tipo, criado_em ON veiculos BEGIN
+            {stats("'tipo:' || coalesce(old.tipo, '')", -1)}
+            {stats("'tipo:' || coalesce(new.tipo, '')", 1)}
+            {mes("coalesce(substr(old.criado_em, 1, 7), '')", -1)}
+            {mes("coalesce(substr(new.criado_em, 1, 7), '')", 1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_stats_itens_ad AFTER DELETE ON itens_checklist
+        WHEN old.status IN ({criticos}) BEGIN
+            {stats("'itens_criticos'", -1)}
+            {item("coalesce(old.nome_item, '')", -1)}
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_stats_itens_au AFTER UPDATE OF status, nome_item ON itens_checklist BEGIN
+            {stats("'itens_criticos'", f"-(coalesce(old.status, '') IN ({criticos})) + (coalesce(new.status, '') IN ({criticos}))")}
+            {item("coalesce(old.nome_item, '')", f"-(coalesce(old.status, '') IN ({criticos}))")}
+            {item("coalesce(new.nome_item, '')", f"(coalesce(new.status, '') IN ({criticos}))")}
+        END;
+    """)
+    rebuild_stats(cur)
+
+
+def m006_meta(cur):
+    """Metadados (ex.: geração de escrita usada para invalidar caches)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    cur.execute("INSERT OR IGNORE INTO meta(chave, valor) VALUES ('geracao', 0)")
+
+
+def m007_km_numerico(cur):
+    """
+    Quilometragens como INTEGER (preenchidas a partir das colunas de texto) e a
+    distância desde a última troca de óleo como coluna gerada indexada, para que
+    "veículos com óleo vencido" seja uma busca por intervalo no índice.
+    """
+    cur.connection.create_function("km_int", 1, _km_int, deterministic=True)
+    cols = _colunas(cur, "veiculos")
+    if "km" not in cols:
+        cur.execute("ALTER TABLE veiculos ADD COLUMN km INTEGER")
+    if "km_oleo" not in cols:
+        cur.execute("ALTER TABLE veiculos ADD COLUMN km_oleo INTEGER")
+    if "oleo_diff" not in cols:
+        cur.execute("ALTER TABLE veiculos ADD COLUMN oleo_diff INTEGER GENERATED ALWAYS AS (km - km_oleo) VIRTUAL")
+    cur.execute("UPDATE veiculos SET km = km_int(quilometragem), km_oleo = km_int(oleo_km)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_veiculos_oleo_diff ON veiculos(oleo_diff)")
+
+    if "km" not in _colunas(cur, "manutencao"):
+        cur.execute("ALTER TABLE manutencao ADD COLUMN km INTEGER")
+    cur.execute("UPDATE manutencao SET km = km_int(quilometragem_atual)")
+
+
+def m008_jobs(cur):
+    """Fila durável de tarefas em segundo plano consumida por jobs.py."""
+    _executar(cur, """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendente',
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            erro TEXT,
+            disponivel_em REAL NOT NULL DEFAULT 0,
+            iniciado_em REAL,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_estado ON jobs(estado, disponivel_em, id);
+    """)
+
+
+def m009_derivadas(cur):
+    """
+    Versões redimensionadas (tamanho x formato) de cada foto, geradas pela fila de
+    tarefas. Fotos já existentes são enfileiradas para processamento.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS derivadas (
+            original TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            formato TEXT NOT NULL,
+            arquivo TEXT NOT NULL,
+            largura INTEGER NOT NULL,
+            altura INTEGER NOT NULL,
+            PRIMARY KEY (original, tamanho, formato)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        INSERT INTO jobs(tipo, payload)
+        SELECT 'derivadas', json_object('arquivo', arquivo) FROM (
+            SELECT foto_carro AS arquivo FROM veiculos WHERE foto_carro IS NOT NULL AND foto_carro <> ''
+            UNION
+            SELECT caminho_foto FROM itens_checklist WHERE caminho_foto IS NOT NULL AND caminho_foto <> ''
+        )
+    """)
+
+
+def m010_anexos(cur):
+    """
+    Store de anexos endereçado por conteúdo (ANEXOS_DIR/ab/cd/<sha256>.<ext>).
+    `refs` conta as linhas de veiculos/itens_checklist que apontam para o arquivo
+    e é mantido por triggers. Arquivos com nome plano (anteriores ao store)
+    continuam servidos como estão e não entram na tabela.
+    """
+    _executar(cur, """
+        CREATE TABLE IF NOT EXISTS anexos (
+            hash TEXT PRIMARY KEY,
+            caminho TEXT NOT NULL UNIQUE,
+            tamanho INTEGER NOT NULL,
+            largura INTEGER,
+            altura INTEGER,
+            refs INTEGER NOT NULL DEFAULT 0,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_anexos_veiculos_ai
+        AFTER INSERT ON veiculos WHEN new.foto_carro IS NOT NULL BEGIN
+            UPDATE anexos SET refs = refs + 1 WHERE caminho = new.foto_carro;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_anexos_veiculos_au
+        AFTER UPDATE OF foto_carro ON veiculos WHEN old.foto_carro IS NOT new.foto_carro BEGIN
+            UPDATE anexos SET refs = refs - 1 WHERE caminho = old.foto_carro;
+            UPDATE anexos SET refs = refs + 1 WHERE caminho = new.foto_carro;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_anexos_veiculos_ad
+        AFTER DELETE ON veiculos WHEN old.foto_carro IS NOT NULL BEGIN
+            UPDATE anexos SET refs = refs - 1 WHERE caminho = old.foto_carro;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_anexos_itens_ai
+        AFTER INSERT ON itens_checklist WHEN new.caminho_foto IS NOT NULL BEGIN
+            UPDATE anexos SET refs = refs + 1 WHERE caminho = new.caminho_foto;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_anexos_itens_au
+        AFTER UPDATE OF caminho_foto ON itens_checklist WHEN old.caminho_foto IS NOT new.caminho_foto BEGIN
+            UPDATE anexos SET refs = refs - 1 WHERE caminho = old.caminho_foto;
+            UPDATE anexos SET refs = refs + 1 WHERE caminho = new.caminho_foto;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_anexos_itens_ad
+        AFTER DELETE ON itens_checklist WHEN old.caminho_foto IS NOT NULL BEGIN
+            UPDATE anexos SET refs = refs - 1 WHERE caminho = old.caminho_foto;
+        END;
+    """)
+
+
+def m011_gc_anexos(cur):
+    """Índices para conferir referências a anexos por nome e progresso da coleta de órfãos."""
+    _executar(cur, """
+        CREATE INDEX IF NOT EXISTS idx_veiculos_foto_carro ON veiculos(foto_carro);
+        CREATE INDEX IF NOT EXISTS idx_itens_caminho_foto ON itens_checklist(caminho_foto);
+        CREATE INDEX IF NOT EXISTS idx_itens_caminho_thumb ON itens_checklist(caminho_thumb);
+        CREATE INDEX IF NOT EXISTS idx_derivadas_arquivo ON derivadas(arquivo);
+
+        CREATE TABLE IF NOT EXISTS gc_execucoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dry_run INTEGER NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'executando',
+            cursor TEXT,
+            verificados INTEGER NOT NULL DEFAULT 0,
+            orfaos INTEGER NOT NULL DEFAULT 0,
+            removidos INTEGER NOT NULL DEFAULT 0,
+            bytes_removidos INTEGER NOT NULL DEFAULT 0,
+            amostra TEXT,
+            iniciado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            atualizado_em TIMESTAMP
+        );
+    """)
+
+
+def m012_exportacoes(cur):
+    """Exportações em lote (ZIP/PDF) e seu progresso."""
+    _executar(cur, """
+        CREATE TABLE IF NOT EXISTS exportacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER,
+            formato TEXT NOT NULL,
+            filtros TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendente',
+            total INTEGER,
+            feitos INTEGER NOT NULL DEFAULT 0,
+            arquivo TEXT,
+            bytes INTEGER,
+            erro TEXT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            atualizado_em TIMESTAMP
+        );
+    """)
+
+
+def m013_importacoes(cur):
+    """Importações em lote de históricos, com checkpoint para retomada."""
+    _executar(cur, """
+        CREATE TABLE IF NOT EXISTS importacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER,
+            tipo TEXT NOT NULL,
+            formato TEXT NOT NULL,
+            arquivo TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'executando',
+            linhas INTEGER NOT NULL DEFAULT 0,
+            inseridos INTEGER NOT NULL DEFAULT 0,
+            rejeitados INTEGER NOT NULL DEFAULT 0,
+            erros TEXT,
+            segundos REAL NOT NULL DEFAULT 0,
+            erro TEXT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            atualizado_em TIMESTAMP
+        );
+    """)
+
+
+def m014_eventos(cur):
+    """Eventos publicados ao dashboard (SSE); ids crescentes sem reuso para o Last-Event-ID."""
+    _executar(cur, """
+        CREATE TABLE IF NOT EXISTS eventos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            dados TEXT NOT NULL,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def m015_jobs_retencao(cur):
+    """Momento em que o job terminou, base da retenção em jobs.py."""
+    if "finalizado_em" not in _colunas(cur, "jobs"):
+        cur.execute("ALTER TABLE jobs ADD COLUMN finalizado_em REAL")
+    # jobs já terminados entram na retenção pela data de criação
+    cur.execute("""
+        UPDATE jobs SET finalizado_em = CAST(strftime('%s', criado_em) AS REAL)
+        WHERE estado IN ('feito', 'erro') AND finalizado_em IS NULL
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finalizado ON jobs(finalizado_em) WHERE finalizado_em IS NOT NULL")
+
+
+def m016_importando(cur):
+    """
+    Marca de importação em andamento: enquanto a tabela `importando` tem uma
+    linha, os triggers por linha de itens_checklist (índice de busca e contador
+    de críticos) não fazem nada e importacao.py refaz esse trabalho por lote.
+    A linha é inserida e apagada dentro da transação do lote, então as outras
+    conexões nunca a veem; assim o schema não muda a cada lote.
+    """
+    criticos = status_criticos_sql()
+    _executar(cur, f"""
+        CREATE TABLE IF NOT EXISTS importando (
+            id INTEGER PRIMARY KEY
+        );
+        DROP TRIGGER IF EXISTS trg_busca_itens_ai;
+        CREATE TRIGGER trg_busca_itens_ai AFTER INSERT ON itens_checklist
+        WHEN new.comentario IS NOT NULL AND new.comentario <> ''
+          AND NOT EXISTS (SELECT 1 FROM importando) BEGIN
+            UPDATE busca_fts SET comentarios = (
+                SELECT group_concat(comentario, ' ') FROM itens_checklist
+                WHERE veiculo_id = new.veiculo_id AND comentario IS NOT NULL AND comentario <> ''
+            )
+            WHERE rowid = new.veiculo_id;
+        END;
+        DROP TRIGGER IF EXISTS trg_criticos_itens_ai;
+        CREATE TRIGGER trg_criticos_itens_ai AFTER INSERT ON itens_checklist
+        WHEN new.status IN ({criticos}) AND NOT EXISTS (SELECT 1 FROM importando) BEGIN
+            UPDATE veiculos SET itens_criticos = itens_criticos + 1 WHERE id = new.veiculo_id;
+        END;
+    """)
+
+
+MIGRATIONS = [
+    (1, m001_schema_base),
+    (2, m002_criado_em),
+    (3, m003_busca_fts),
+    (4, m004_itens_criticos),
+    (5, m005_stats),
+    (6, m006_meta),
+    (7, m007_km_numerico),
+    (8, m008_jobs),
+    (9, m009_derivadas),
+    (10, m010_anexos),
+    (11, m011_gc_anexos),
+    (12, m012_exportacoes),
+    (13, m013_importacoes),
+    (14, m014_eventos),
+    (15, m015_jobs_retencao),
+    (16, m016_importando),
+]
+
+VERSAO_ATUAL = MIGRATIONS[-1][0]
+
+
+# ---------------------------------------------------------------------------
+# Rotinas de manutenção reutilizadas pelas migrações e por rebuild_stats.py
+# ---------------------------------------------------------------------------
+
+def recalcular_criticos(cur):
+    """Recalcula veiculos.itens_criticos a partir dos itens (ex.: após mudar STATUS_CRITICOS)."""
+    cur.execute(f"""
+        UPDATE veiculos SET itens_criticos = (
+            SELECT COUNT(*) FROM itens_checklist it
+            WHERE it.veiculo_id = veiculos.id AND it.status IN ({status_criticos_sql()})
+        )
+    """)
+
+
+def rebuild_stats(cur):
+    """Recalcula as tabelas de agregados do dashboard a partir de veiculos/itens_checklist."""
+    criticos = status_criticos_sql()
+    cur.execute("DELETE FROM stats")
+    cur.execute("DELETE FROM stats_mes")
+    cur.execute("DELETE FROM stats_itens_criticos")
+    cur.execute("INSERT INTO stats(chave, valor) SELECT 'checklists', COUNT(*) FROM veiculos")
+    cur.execute("""
+        INSERT INTO stats(chave, valor)
+        SELECT 'tipo:' || coalesce(tipo, ''), COUNT(*) FROM veiculos GROUP BY 1
+    """)
+    cur.execute(f"""
+        INSERT INTO stats(chave, valor)
+        SELECT 'itens_criticos', COUNT(*) FROM itens_checklist WHERE status IN ({criticos})
+    """)
+    cur.execute("""
+        INSERT INTO stats_mes(mes, qtd)
+        SELECT coalesce(substr(criado_em, 1, 7), ''), COUNT(*) FROM veiculos GROUP BY 1
+    """)
+    cur.execute(f"""
+        INSERT INTO stats_itens_criticos(nome_item, qtd)
+        SELECT coalesce(nome_item, ''), COUNT(*) FROM itens_checklist
+        WHERE status IN ({criticos}) GROUP BY 1
+    """)
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def _versao(cur):
+    if not _tabela_existe(cur, "schema_version"):
+        return 0
+    cur.execute("SELECT MAX(version) FROM schema_version")
+    return cur.fetchone()[0] or 0
+
+
+def versao_schema():
+    """Versão do schema gravada no banco (0 = nunca migrado)."""
+    conn = _connect()
+    try:
+        return _versao(conn.cursor())
+    finally:
+        conn.close()
+
+
+def migrate(verbose=True):
+    """Aplica as migrações pendentes. Seguro para chamar de vários processos ao mesmo tempo."""
+    log = print if verbose else (lambda *a, **k: None)
+    os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+    with file_lock(LOCK_FILE):
+        conn = _connect()
+        conn.isolation_level = None  # transações explícitas (DDL incluída)
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    descricao TEXT,
+                    aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            atual = _versao(cur)
+            pendentes = [(v, fn) for v, fn in MIGRATIONS if v > atual]
+            if not pendentes:
+                log(f"Banco de dados já está na versão {atual}.")
+                return atual
+            for versao, fn in pendentes:
+                log(f"Aplicando migração {versao:03d}: {fn.__name__}...")
+                cur.execute("BEGIN IMMEDIATE")
+                try:
+                    fn(cur)
+                    cur.execute(
+                        "INSERT INTO schema_version(version, descricao) VALUES (?, ?)",
+                        (versao, fn.__name__)
+                    )
+                    cur.execute("COMMIT")
+                except Exception:
+                    cur.execute("ROLLBACK")
+                    raise
+            log(f"Migração concluída: versão {VERSAO_ATUAL}.")
+            return VERSAO_ATUAL
+        finally:
+            conn.close()
+
+
+def verificar_schema():
+    """Usado na inicialização do app: só confere se o banco está na versão esperada."""
+    versao = versao_schema()
+    if versao < VERSAO_ATUAL:
+        raise RuntimeError(
+            f"Schema do banco na versão {versao}, esperado {VERSAO_ATUAL}. "
+            "Execute `python migrations.py` antes de iniciar o app."
+        )
+    return versao
+
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"Erro na migração: {e}")
+        sys.exit(1)
@@ -1,6 +1,10 @@
+import copy
+
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from db import get_conn
+from db import get_conn, incrementar_geracao
+from services import km_para_int
+from cache import cached, usuarios
 
 class User(UserMixin):
     def __init__(self, id, username, password_hash, email=None, is_admin=False, reset_token=None, reset_token_expiration=None):
@@ -34,6 +38,20 @@ class User(UserMixin):
             reset_token_expiration=user_data[6]
         )
 
+    @staticmethod
+    def get_cached(user_id):
+        """
+        User.get com cache em memória por worker (usado pelo user_loader em toda
+        requisição autenticada). Cada requisição recebe uma cópia do objeto
+        guardado, para não compartilhar a instância entre threads.
+        """
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        user = usuarios.obter(user_id, lambda: User.get(user_id))
+        return copy.copy(user) if user else None
+
     @staticmethod
     def find_by_username(username):
         conn = get_conn()
@@ -94,6 +112,7 @@ class User(UserMixin):
         """, (self.username, self.password_hash, self.email, self.id))
         
         conn.commit()
+        usuarios.invalidar(int(self.id))
         return True
         
     def set_reset_token(self, token, expiration):
@@ -109,6 +128,7 @@ class User(UserMixin):
         """, (token, expiration, self.id))
         
         conn.commit()
+        usuarios.invalidar(int(self.id))
         
     @staticmethod
     def verify_reset_token(token):
@@ -147,6 +167,7 @@ class User(UserMixin):
         """, (self.password_hash, self.id))
         
         conn.commit()
+        usuarios.invalidar(int(self.id))
         return True
 
 
@@ -175,11 +196,12 @@ class Manutencao:
         
         cur.execute("""
             INSERT INTO manutencao 
-            (veiculo_id, nome_peca, data_manutencao, quilometragem_atual, 
+            (veiculo_id, nome_peca, data_manutencao, quilometragem_atual, km,
              vida_util_km, proxima_manutencao_km, valor_peca, mao_de_obra, observacoes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (veiculo_id, nome_peca, data_manutencao, quilometragem_atual, 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (veiculo_id, nome_peca, data_manutencao, quilometragem_atual, km_para_int(quilometragem_atual),
               vida_util_km, proxima_manutencao_km, valor_peca, mao_de_obra, observacoes))
+        incrementar_geracao(cur)
         
         conn.commit()
         return Manutencao(cur.lastrowid, veiculo_id, nome_peca, data_manutencao, 
@@ -229,13 +251,14 @@ class Manutencao:
         
         cur.execute("""
             UPDATE manutencao 
-            SET nome_peca = ?, data_manutencao = ?, quilometragem_atual = ?,
+            SET nome_peca = ?, data_manutencao = ?, quilometragem_atual = ?, km = ?,
                 vida_util_km = ?, proxima_manutencao_km = ?, valor_peca = ?,
                 mao_de_obra = ?, observacoes = ?
             WHERE id = ?
-        """, (self.nome_peca, self.data_manutencao, self.quilometragem_atual,
+        """, (self.nome_peca, self.data_manutencao, self.quilometragem_atual, km_para_int(self.quilometragem_atual),
               self.vida_util_km, self.proxima_manutencao_km, self.valor_peca,
               self.mao_de_obra, self.observacoes, self.id))
+        incrementar_geracao(cur)
         
         conn.commit()
         return True
@@ -245,10 +268,12 @@ class Manutencao:
         cur = conn.cursor()
         
         cur.execute("DELETE FROM manutencao WHERE id = ?", (self.id,))
+        incrementar_geracao(cur)
         conn.commit()
         return True
 
     @staticmethod
+    @cached("manutencoes")
     def get_all():
         conn = get_conn()
         cur = conn.cursor()
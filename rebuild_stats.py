@@ -0,0 +1,22 @@
+from db import connection, incrementar_geracao
+from migrations import verificar_schema, rebuild_stats, recalcular_criticos
+
+def rebuild():
+    """Recalcula os agregados do dashboard (stats*) e o contador de itens críticos."""
+    verificar_schema()
+    with connection() as conn:
+        cur = conn.cursor()
+        print("Recalculando contador de itens críticos por checklist...")
+        recalcular_criticos(cur)
+        print("Recalculando tabelas de agregados do dashboard...")
+        rebuild_stats(cur)
+        # invalida resultados em cache calculados com os agregados antigos
+        incrementar_geracao(cur)
+        conn.commit()
+        cur.execute("SELECT chave, valor FROM stats ORDER BY chave")
+        for chave, valor in cur.fetchall():
+            print(f"  {chave}: {valor}")
+    print("Agregados recalculados com sucesso!")
+
+if __name__ == "__main__":
+    rebuild()
@@ -1,13 +1,23 @@
+import hashlib
+import json
+import math
 import os
-from datetime import datetime
-from PIL import Image
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+from PIL import Image, ImageOps, UnidentifiedImageError
 from werkzeug.utils import secure_filename
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
 
-from db import get_conn
-from config import ANEXOS_DIR
+from db import get_conn, incrementar_geracao
+from cache import cached, pdfs, variantes
+from jobs import tarefa, enfileirar
+from eventos import publicar, kpis, ultimo_id
+from config import (
+    ANEXOS_DIR, STATUS_CRITICOS, OLEO_INTERVALO_KM,
+    IMAGEM_TAMANHOS, IMAGEM_WEBP, IMAGEM_QUALIDADE, PDF_PX_POR_PONTO, IMAGEM_LARGURAS_SOB_DEMANDA,
+)
 
 # Itens padrão (ajuste conforme necessário)
 ITENS_CARRO = [
@@ -26,6 +36,10 @@ ITENS_MOTO = [
 ]
 
 ALLOWED_EXT = {"png", "jpg", "jpeg", "gif", "webp"}
+# extensão gravada no store conforme o formato real detectado pelo Pillow
+_EXT_FORMATO = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+# uploads em andamento (fora do store; descartáveis)
+ANEXOS_TMP_DIR = os.path.join(ANEXOS_DIR, "tmp")
 
 
 def _is_allowed(filename: str) -> bool:
@@ -33,45 +47,267 @@ def _is_allowed(filename: str) -> bool:
     return ext in ALLOWED_EXT
 
 
-def _save_file_storage(file_storage, prefix="file"):
+def formatar_data(valor, fmt="%d/%m/%Y %H:%M"):
+    """Formata um timestamp ISO ('aaaa-mm-dd hh:mm:ss') para exibição."""
+    if not valor:
+        return ""
+    try:
+        return datetime.fromisoformat(str(valor)).strftime(fmt)
+    except ValueError:
+        return str(valor)
+
+
+def _limite_data(valor, fim=False):
+    """
+    Converte 'dd/mm/aaaa' (ou 'aaaa-mm-dd') no limite ISO usado em criado_em.
+    Para o fim do período retorna o dia seguinte (comparação com '<').
+    Retorna None se a data for inválida.
+    """
+    if not valor:
+        return None
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            d = datetime.strptime(valor.strip(), fmt)
+            break
+        except ValueError:
+            continue
+    else:
+        return None
+    if fim:
+        d += timedelta(days=1)
+    return d.strftime("%Y-%m-%d")
+
+
+def filtro_periodo(data_ini=None, data_fim=None, coluna="criado_em"):
+    """Retorna (cláusulas, params) com predicados de intervalo sobre o índice de data."""
+    clauses, params = [], []
+    ini = _limite_data(data_ini)
+    if ini:
+        clauses.append(f"{coluna} >= ?")
+        params.append(ini)
+    fim = _limite_data(data_fim, fim=True)
+    if fim:
+        clauses.append(f"{coluna} < ?")
+        params.append(fim)
+    return clauses, params
+
+
+def km_para_int(valor):
+    """Extrai a quilometragem como inteiro ('50.000 km' -> 50000); None se não houver dígitos."""
+    nums = "".join(ch for ch in str(valor or "") if ch.isdigit())
+    return int(nums) if nums else None
+
+
+def status_oleo(oleo_diff):
+    """Campos de alerta de troca de óleo a partir de veiculos.oleo_diff (km - km_oleo)."""
+    if oleo_diff is None:
+        return {"oleo_diff": None, "oleo_due_in": None, "oleo_alert": False}
+    return {
+        "oleo_diff": oleo_diff,
+        "oleo_due_in": max(0, OLEO_INTERVALO_KM - oleo_diff),
+        "oleo_alert": oleo_diff >= OLEO_INTERVALO_KM,
+    }
+
+
+def termo_fts(q, coluna=None):
+    """
+    Monta a expressão MATCH para o índice busca_fts (tokenizer trigram).
+    Cada palavra vira uma frase entre aspas (busca por substring); palavras com
+    menos de 3 caracteres são ignoradas. Retorna None se nada puder ser buscado
+    no índice (o chamador deve usar LIKE nesse caso).
+    """
+    termos = [t for t in (q or "").split() if len(t) >= 3]
+    if not termos:
+        return None
+    frases = " AND ".join('"' + t.replace('"', '""') + '"' for t in termos)
+    if coluna:
+        return f"{{{coluna}}} : ({frases})"
+    return frases
+
+
+def caminho_anexo(sha256, ext):
+    """Caminho relativo no store endereçado por conteúdo: 'ab/cd/<sha256>.<ext>'."""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+
+
+def _save_file_storage(file_storage):
     """
-    Salva arquivo em ANEXOS_DIR com nome sanitizado e timestamp.
-    Retorna (filename, thumb_filename) — nomes relativos (não caminhos absolutos).
+    Grava um upload no store endereçado por conteúdo (ANEXOS_DIR/ab/cd/<sha256>.<ext>).
+    O arquivo é escrito num temporário enquanto o hash é calculado e depois movido
+    para o lugar definitivo; conteúdo já existente não é gravado de novo.
+    Retorna dict com caminho, hash, tamanho, largura, altura e `novo` (arquivo
+    criado agora), ou None se não houver arquivo ou ele não for uma imagem aceita;
+    falhas de gravação (OSError) são propagadas.
+    As versões redimensionadas são geradas depois, pela fila de tarefas (ver gerar_derivadas).
     """
     if not file_storage:
-        return None, None
+        return None
     filename = getattr(file_storage, "filename", None)
     if not filename:
-        return None, None
+        return None
 
     filename_secure = secure_filename(filename)
     if not _is_allowed(filename_secure):
-        return None, None
-
-    ts = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-    base, ext = os.path.splitext(filename_secure)
-    safe_name = f"{prefix}_{ts}_{base}{ext}"
-    dest_path = os.path.join(ANEXOS_DIR, safe_name)
+        return None
 
-    # salva arquivo
+    os.makedirs(ANEXOS_TMP_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=ANEXOS_TMP_DIR)
     try:
-        file_storage.save(dest_path)
-    except Exception:
-        return None, None
+        sha = hashlib.sha256()
+        tamanho = 0
+        with os.fdopen(fd, "wb") as out:
+            for bloco in iter(lambda: file_storage.stream.read(64 * 1024), b""):
+                sha.update(bloco)
+                out.write(bloco)
+                tamanho += len(bloco)
+        # só o que não é imagem é descartado; erro de disco não pode sumir com a foto
+        try:
+            with Image.open(tmp_path) as img:
+                ext = _EXT_FORMATO.get(img.format)
+                largura, altura = img.size
+        except (UnidentifiedImageError, Image.DecompressionBombError):
+            ext = None
+        if ext is None:
+            return None
 
-    # gera thumbnail otimizada
-    thumb_name = None
+        hash_hex = sha.hexdigest()
+        caminho = caminho_anexo(hash_hex, ext)
+        destino = os.path.join(ANEXOS_DIR, caminho)
+        novo = not os.path.exists(destino)
+        if novo:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(tmp_path, destino)
+        else:
+            # conteúdo repetido: renova o mtime para a carência do GC proteger o arquivo
+            os.utime(destino)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {"caminho": caminho, "hash": hash_hex, "tamanho": tamanho,
+            "largura": largura, "altura": altura, "novo": novo}
+
+
+def gerar_derivadas(nome):
+    """
+    Gera as versões redimensionadas de um anexo (IMAGEM_TAMANHOS, em JPEG e WebP).
+    Retorna [(tamanho, formato, arquivo, largura, altura)] ou [] se não for imagem.
+    Tamanhos que resultariam na mesma largura de um maior (foto pequena) são omitidos.
+    """
     try:
-        img = Image.open(dest_path)
-        img.thumbnail((1200, 1200))
-        thumb_base = f"thumb_{safe_name}"
-        thumb_path = os.path.join(ANEXOS_DIR, thumb_base)
-        img.save(thumb_path, optimize=True, quality=85)
-        thumb_name = thumb_base
+        img = ImageOps.exif_transpose(Image.open(os.path.join(ANEXOS_DIR, nome)))
+        img.load()
+    except FileNotFoundError:
+        raise
     except Exception:
-        thumb_name = None
+        return []
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+
+    base = os.path.splitext(nome)[0]
+    formatos = [("jpeg", "jpg")] + ([("webp", "webp")] if IMAGEM_WEBP else [])
+    geradas = []
+    anterior = None
+    # do maior para o menor: cada versão parte da anterior (menos pixels para reamostrar)
+    for tamanho in sorted(set(IMAGEM_TAMANHOS), reverse=True):
+        atual = img.copy()
+        atual.thumbnail((tamanho, tamanho), Image.LANCZOS)
+        if anterior is not None and atual.size == anterior.size:
+            continue
+        for formato, ext in formatos:
+            arquivo = f"{base}_{tamanho}.{ext}"
+            saida = atual
+            if formato == "jpeg" and atual.mode == "RGBA":
+                saida = Image.new("RGB", atual.size, (255, 255, 255))
+                saida.paste(atual, mask=atual.getchannel("A"))
+            saida.save(os.path.join(ANEXOS_DIR, arquivo), formato.upper(), quality=IMAGEM_QUALIDADE, optimize=True)
+            geradas.append((tamanho, formato, arquivo) + atual.size)
+        anterior = img = atual
+    return geradas
+
+
+def gerar_variante(origem, destino, largura, formato):
+    """
+    Gera em `destino` uma versão de `origem` com no máximo `largura` px de largura
+    (não amplia). Em JPEG, draft() faz o decodificador já reduzir a imagem por
+    1/2, 1/4 ou 1/8, o que evita decodificar a foto inteira.
+    """
+    with Image.open(origem) as img:
+        if img.format == "JPEG":
+            # (largura, largura): os dois lados continuam >= largura mesmo após a rotação EXIF
+            img.draft("RGB", (largura, largura))
+        img = ImageOps.exif_transpose(img)
+        if img.width > largura:
+            img = img.resize((largura, max(1, round(img.height * largura / img.width))), Image.LANCZOS)
+        if formato == "jpeg" and img.mode != "RGB":
+            fundo = Image.new("RGB", img.size, (255, 255, 255))
+            fundo.paste(img, mask=img.convert("RGBA").getchannel("A"))
+            img = fundo
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+        img.save(destino, formato.upper(), quality=IMAGEM_QUALIDADE, optimize=True)
+
+
+@tarefa("derivadas")
+@tarefa("thumbnail")  # jobs enfileirados antes da migração 9
+def _tarefa_derivadas(conn, payload):
+    """
+    Job da fila: gera as versões de um anexo e as registra em `derivadas`. Para
+    fotos de item, a maior versão JPEG também vai para caminho_thumb.
+    """
+    nome = payload["arquivo"]
+    geradas = gerar_derivadas(nome)
+    if not geradas:
+        return
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    cur.execute("""
+        SELECT 1 FROM veiculos WHERE foto_carro = ?
+        UNION ALL
+        SELECT 1 FROM itens_checklist WHERE caminho_foto = ?
+        LIMIT 1
+    """, (nome, nome))
+    if cur.fetchone() is None:
+        # checklist removido ou gravação desfeita: as versões não têm dono
+        conn.rollback()
+        _remover_anexos([g[2] for g in geradas])
+        return
+    cur.executemany("""
+        INSERT OR REPLACE INTO derivadas(original, tamanho, formato, arquivo, largura, altura)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(nome,) + g for g in geradas])
+    maior_jpeg = next(g[2] for g in geradas if g[1] == "jpeg")
+    cur.execute("UPDATE itens_checklist SET caminho_thumb = ? WHERE caminho_foto = ?", (maior_jpeg, nome))
+    incrementar_geracao(cur)
+    conn.commit()
 
-    return safe_name, thumb_name
+
+def derivadas_de(cur, nomes):
+    """
+    Versões registradas de cada anexo: {original: {"jpeg": [(largura, arquivo), ...], "webp": [...]}},
+    cada lista em ordem crescente de largura.
+    """
+    nomes = [n for n in set(nomes) if n]
+    if not nomes:
+        return {}
+    marcadores = ", ".join("?" * len(nomes))
+    cur.execute(f"""
+        SELECT original, formato, largura, arquivo FROM derivadas
+        WHERE original IN ({marcadores})
+        ORDER BY original, formato, largura
+    """, nomes)
+    resultado = {}
+    for original, formato, largura, arquivo in cur.fetchall():
+        resultado.setdefault(original, {}).setdefault(formato, []).append((largura, arquivo))
+    return resultado
+
+
+def escolher_derivada(derivadas, largura_min, formato="jpeg"):
+    """Menor versão com pelo menos `largura_min` px (ou a maior disponível); None se não houver."""
+    versoes = (derivadas or {}).get(formato) or []
+    for largura, arquivo in versoes:
+        if largura >= largura_min:
+            return arquivo
+    return versoes[-1][1] if versoes else None
 
 
 def salvar_checklist(form, files):
@@ -80,10 +316,15 @@ def salvar_checklist(form, files):
       - tipo, condutor, placa, modelo, quilometragem, observacoes, foto_carro
       - status_<idx>, coment_<idx>, foto_<idx>, itemname_<idx>
     Retorna id do veículo salvo.
-    """
-    conn = get_conn()
-    cur = conn.cursor()
 
+    As fotos são gravadas no store (deduplicadas por hash) antes de abrir a
+    transação, para que o lock de escrita do SQLite fique aberto só durante os
+    INSERTs; as versões redimensionadas de conteúdo novo são enfileiradas para a
+    fila de tarefas. Se a gravação no banco falhar, a transação é desfeita e os
+    arquivos gravados ficam para o gc_anexos: um upload concorrente do mesmo
+    conteúdo pode estar prestes a referenciá-los, e só a coleta (carência
+    GC_CARENCIA, mtime e refs reconferidos) apaga com segurança.
+    """
     tipo = form.get("tipo") or "Carro"
     condutor = form.get("condutor")
     placa = form.get("placa")
@@ -91,115 +332,376 @@ def salvar_checklist(form, files):
     quilometragem = form.get("quilometragem")
     # campos novos para troca de óleo
     oleo_data = form.get("oleo_data")
-    oleo_km = form.get("oleo_km")
-    # Sanitiza oleo_km para armazenar apenas dígitos (evita letras e formatações)
-    def _digits_only(v):
-        try:
-            s = str(v or "").strip()
-            nums = ''.join(ch for ch in s if ch.isdigit())
-            return nums if nums else None
-        except Exception:
-            return None
-    oleo_km = _digits_only(oleo_km)
+    # Quilometragens numéricas (colunas km/km_oleo); oleo_km guarda apenas dígitos
+    km = km_para_int(quilometragem)
+    km_oleo = km_para_int(form.get("oleo_km"))
+    oleo_km = str(km_oleo) if km_oleo is not None else None
     observacoes = form.get("observacoes")
-    data = datetime.now().strftime("%d/%m/%Y %H:%M")
-
-    foto_carro_file = files.get("foto_carro")
-    foto_carro_name, foto_thumb = _save_file_storage(foto_carro_file, prefix="veic")
+    criado_em = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    cur.execute("""
-        INSERT INTO veiculos (condutor, placa, modelo, data, quilometragem, observacoes, foto_carro, tipo, oleo_data, oleo_km)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (condutor, placa, modelo, data, quilometragem, observacoes, foto_carro_name, tipo, oleo_data, oleo_km))
-    veic_id = cur.lastrowid
+    anexos = []
+    foto_carro = _save_file_storage(files.get("foto_carro"))
+    anexos.append(foto_carro)
 
     # percorre status_*
+    itens = []
     for key in list(form.keys()):
         if key.startswith("status_"):
             idx = key.split("_", 1)[1]
             status = form.get(key)
             comentario = form.get(f"coment_{idx}") or ""
             nome_item = form.get(f"itemname_{idx}") or f"Item {idx}"
-            file_field = files.get(f"foto_{idx}")
-            caminho_foto, caminho_thumb = _save_file_storage(file_field, prefix=f"item_{idx}")
-            cur.execute("""
-                INSERT INTO itens_checklist (veiculo_id, nome_item, status, comentario, caminho_foto, caminho_thumb)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (veic_id, nome_item, status, comentario, caminho_foto, caminho_thumb))
+            foto = _save_file_storage(files.get(f"foto_{idx}"))
+            anexos.append(foto)
+            itens.append((nome_item, status, comentario, foto["caminho"] if foto else None))
+    anexos = list({a["hash"]: a for a in anexos if a}.values())
+    foto_carro_name = foto_carro["caminho"] if foto_carro else None
 
-    conn.commit()
-    conn.close()
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        # pega o lock de escrita já no início: falha rápido (busy_timeout) em vez de no meio
+        cur.execute("BEGIN IMMEDIATE")
+        # registra o conteúdo novo antes das referências (triggers mantêm anexos.refs)
+        novos = []
+        for a in anexos:
+            cur.execute("""
+                INSERT INTO anexos(hash, caminho, tamanho, largura, altura) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(hash) DO NOTHING
+            """, (a["hash"], a["caminho"], a["tamanho"], a["largura"], a["altura"]))
+            if cur.rowcount:
+                novos.append(a["caminho"])
+        cur.execute("""
+            INSERT INTO veiculos (condutor, placa, modelo, criado_em, quilometragem, km, observacoes, foto_carro, tipo,
+                                  oleo_data, oleo_km, km_oleo)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (condutor, placa, modelo, criado_em, quilometragem, km, observacoes, foto_carro_name, tipo,
+              oleo_data, oleo_km, km_oleo))
+        veic_id = cur.lastrowid
+        cur.executemany("""
+            INSERT INTO itens_checklist (veiculo_id, nome_item, status, comentario, caminho_foto)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(veic_id,) + item for item in itens])
+        # foto repetida: as versões já existem; senão o job preenche caminho_thumb depois
+        cur.execute("""
+            UPDATE itens_checklist SET caminho_thumb = (
+                SELECT arquivo FROM derivadas
+                WHERE original = itens_checklist.caminho_foto AND formato = 'jpeg'
+                ORDER BY largura DESC LIMIT 1
+            )
+            WHERE veiculo_id = ? AND caminho_foto IS NOT NULL
+        """, (veic_id,))
+        for caminho in novos:
+            enfileirar(cur, "derivadas", {"arquivo": caminho})
+        # PDF pré-gerado em segundo plano (depois das versões das fotos, ver _tarefa_pdf)
+        enfileirar(cur, "pdf", {"veiculo_id": veic_id}, atraso=5)
+        deltas = incrementar_stats(cur, [(tipo, criado_em, [(nome, status) for nome, status, *_ in itens])])
+        # resumo + variação dos KPIs para os dashboards abertos (/api/eventos)
+        publicar(cur, "checklist", {
+            "checklist": {
+                "id": veic_id, "tipo": tipo, "placa": placa, "condutor": condutor, "modelo": modelo,
+                "quilometragem": quilometragem, "criado_em": criado_em,
+                "itens_criticos": sum(deltas[2].values()),
+            },
+            "kpis": kpis(cur, *deltas),
+        })
+        incrementar_geracao(cur)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
     return veic_id
 
 
-def listar_historico(placa=None, data_ini=None, data_fim=None):
+def _remover_anexos(nomes):
+    """Apaga de ANEXOS_DIR arquivos gravados por uma operação que não foi concluída."""
+    for nome in nomes:
+        if not nome:
+            continue
+        try:
+            os.remove(os.path.join(ANEXOS_DIR, nome))
+        except OSError:
+            pass
+
+
+def incrementar_stats(cur, checklists):
+    """
+    Contabiliza checklists novos nas tabelas de agregados (mesma transação do
+    INSERT). `checklists`: lista de (tipo, criado_em, [(nome_item, status), ...]).
+    Retorna os contadores somados (stats, meses, criticos), base de eventos.kpis().
+    """
+    stats, meses, criticos = Counter(), Counter(), Counter()
+    for tipo, criado_em, itens in checklists:
+        stats["checklists"] += 1
+        stats[f"tipo:{tipo or ''}"] += 1
+        meses[(criado_em or "")[:7]] += 1
+        criticos.update(nome or "" for nome, status in itens if status in STATUS_CRITICOS)
+    stats["itens_criticos"] += sum(criticos.values())
+    cur.executemany("""
+        INSERT INTO stats(chave, valor) VALUES (?, ?)
+        ON CONFLICT(chave) DO UPDATE SET valor = valor + excluded.valor
+    """, list(stats.items()))
+    cur.executemany("""
+        INSERT INTO stats_mes(mes, qtd) VALUES (?, ?)
+        ON CONFLICT(mes) DO UPDATE SET qtd = qtd + excluded.qtd
+    """, list(meses.items()))
+    cur.executemany("""
+        INSERT INTO stats_itens_criticos(nome_item, qtd) VALUES (?, ?)
+        ON CONFLICT(nome_item) DO UPDATE SET qtd = qtd + excluded.qtd
+    """, list(criticos.items()))
+    return stats, meses, criticos
+
+
+@cached("dashboard")
+def resumo_dashboard(mes_inicio):
+    """
+    Lê os agregados do dashboard das tabelas stats* (O(1) em relação ao histórico).
+    mes_inicio: 'aaaa-mm' do primeiro mês exibido no gráfico mensal.
+    As leituras usam um único snapshot, para que `ultimo_evento` corresponda
+    exatamente aos totais (o dashboard aplica só os eventos posteriores).
+    """
     conn = get_conn()
     cur = conn.cursor()
-    query = "SELECT id, condutor, placa, modelo, data, quilometragem, tipo FROM veiculos WHERE 1=1"
+    cur.execute("BEGIN")
+    try:
+        ultimo_evento = ultimo_id(cur)
+        cur.execute("SELECT chave, valor FROM stats")
+        stats = {r["chave"]: r["valor"] for r in cur.fetchall()}
+        cur.execute("SELECT mes, qtd FROM stats_mes WHERE mes >= ? AND qtd > 0 ORDER BY mes ASC", (mes_inicio,))
+        meses = [(r["mes"], r["qtd"]) for r in cur.fetchall()]
+        cur.execute("SELECT nome_item, qtd FROM stats_itens_criticos WHERE qtd > 0 ORDER BY qtd DESC LIMIT 5")
+        top_criticos = [(r["nome_item"], r["qtd"]) for r in cur.fetchall()]
+    finally:
+        conn.rollback()
+    return {
+        "ultimo_evento": ultimo_evento,
+        "total_checklists": stats.get("checklists", 0),
+        "total_carros": stats.get("tipo:Carro", 0),
+        "total_motos": stats.get("tipo:Moto", 0),
+        "total_criticos": stats.get("itens_criticos", 0),
+        "meses": meses,
+        "top_criticos": top_criticos,
+    }
+
+
+def filtro_veiculos(tipo=None, criticos=False, q="", data_ini=None, data_fim=None, oleo_alert=False, placa=None):
+    """
+    Filtros comuns de listagem/exportação de checklists (tabela `veiculos v`).
+    `q` busca em placa, condutor, modelo, observações e comentários; `placa` só na placa.
+    Retorna (from_sql, where_clauses, params, order_sql).
+    """
+    from_sql = "FROM veiculos v"
+    order_sql = "ORDER BY v.criado_em DESC, v.id DESC"
+    where_clauses = []
     params = []
-    if placa:
-        query += " AND placa LIKE ?"
-        params.append(f"%{placa}%")
-    if data_ini:
-        try:
-            d = datetime.strptime(data_ini, "%d/%m/%Y").strftime("%Y-%m-%d")
-            query += " AND date(substr(data,7,4)||'-'||substr(data,4,2)||'-'||substr(data,1,2)) >= date(?)"
-            params.append(d)
-        except Exception:
-            pass
-    if data_fim:
-        try:
-            d = datetime.strptime(data_fim, "%d/%m/%Y").strftime("%Y-%m-%d")
-            query += " AND date(substr(data,7,4)||'-'||substr(data,4,2)||'-'||substr(data,1,2)) <= date(?)"
-            params.append(d)
-        except Exception:
-            pass
-    query += " ORDER BY id DESC"
-    cur.execute(query, params)
+
+    if tipo:
+        where_clauses.append("v.tipo = ?")
+        params.append(tipo)
+
+    termo = q or placa
+    if termo:
+        match = termo_fts(termo, coluna=None if q else "placa")
+        if match:
+            # Busca no índice FTS5, ordenada por relevância
+            from_sql += " JOIN busca_fts f ON f.rowid = v.id"
+            where_clauses.append("f.busca_fts MATCH ?")
+            params.append(match)
+            order_sql = "ORDER BY f.rank, v.criado_em DESC, v.id DESC"
+        elif q:
+            # termos com menos de 3 caracteres não cabem no índice trigram
+            where_clauses.append("(v.placa LIKE ? OR v.condutor LIKE ? OR v.modelo LIKE ?)")
+            like = f"%{q}%"
+            params.extend([like, like, like])
+        else:
+            where_clauses.append("v.placa LIKE ?")
+            params.append(f"%{placa}%")
+
+    periodo_clauses, periodo_params = filtro_periodo(data_ini, data_fim, coluna="v.criado_em")
+    where_clauses.extend(periodo_clauses)
+    params.extend(periodo_params)
+
+    if criticos:
+        # coberto pelo índice parcial idx_veiculos_criticos
+        where_clauses.append("v.itens_criticos > 0")
+
+    if oleo_alert:
+        # intervalo em idx_veiculos_oleo_diff (coluna gerada km - km_oleo)
+        where_clauses.append("v.oleo_diff >= ?")
+        params.append(OLEO_INTERVALO_KM)
+
+    return from_sql, where_clauses, params, order_sql
+
+
+def listar_historico(placa=None, data_ini=None, data_fim=None):
+    conn = get_conn()
+    cur = conn.cursor()
+    from_sql, where_clauses, params, order_sql = filtro_veiculos(placa=placa, data_ini=data_ini, data_fim=data_fim)
+    where_sql = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    cur.execute(f"""
+        SELECT v.id, v.condutor, v.placa, v.modelo, v.criado_em, v.quilometragem, v.tipo
+        {from_sql} {where_sql} {order_sql}
+    """, params)
     rows = cur.fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 
-def obter_registro(veiculo_id):
-    conn = get_conn()
+def ids_veiculos(limite=None, **filtros):
+    """Ids dos checklists que atendem aos filtros de filtro_veiculos(), na ordem da listagem."""
+    from_sql, where_clauses, params, order_sql = filtro_veiculos(**filtros)
+    where_sql = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    limit_sql = ""
+    if limite:
+        limit_sql = "LIMIT ?"
+        params = params + [limite]
+    cur = get_conn().cursor()
+    cur.execute(f"SELECT v.id {from_sql} {where_sql} {order_sql} {limit_sql}", params)
+    return [row[0] for row in cur.fetchall()]
+
+
+# colunas da projeção só-cabeçalho (páginas que não mostram os itens)
+CAMPOS_CABECALHO = (
+    "id", "tipo", "condutor", "placa", "modelo", "quilometragem", "km",
+    "oleo_km", "oleo_data", "oleo_diff", "itens_criticos", "foto_carro", "criado_em",
+)
+
+
+def obter_registros(ids, itens=True):
+    """
+    Vários checklists de uma vez: {id: registro}, sem os ids inexistentes. São
+    consultas por conjunto (veículos, itens e versões das fotos), qualquer que
+    seja a quantidade de ids. Com itens=False devolve só o cabeçalho
+    (CAMPOS_CABECALHO e o alerta de óleo).
+    """
+    ids = json.dumps(sorted({int(i) for i in ids}))
+    cur = get_conn().cursor()
+    # json_each: um único parâmetro, sem o limite de variáveis do SQLite
+    colunas = "*" if itens else ", ".join(CAMPOS_CABECALHO)
+    cur.execute(f"SELECT {colunas} FROM veiculos WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+    registros = {}
+    for row in cur.fetchall():
+        reg = dict(row)
+        # Alerta de troca de óleo a partir da coluna gerada oleo_diff
+        reg.update(status_oleo(reg.get("oleo_diff")))
+        registros[reg["id"]] = reg
+    if not itens or not registros:
+        return registros
+
+    for reg in registros.values():
+        reg["itens"] = []
+    cur.execute("""
+        SELECT * FROM itens_checklist
+        WHERE veiculo_id IN (SELECT value FROM json_each(?))
+        ORDER BY veiculo_id, id
+    """, (ids,))
+    for row in cur.fetchall():
+        registros[row["veiculo_id"]]["itens"].append(dict(row))
+
+    derivadas = derivadas_de(cur, [
+        nome for reg in registros.values()
+        for nome in [reg.get("foto_carro")] + [i["caminho_foto"] for i in reg["itens"]]
+    ])
+    for reg in registros.values():
+        reg["foto_carro_derivadas"] = derivadas.get(reg.get("foto_carro"))
+        for item in reg["itens"]:
+            item["derivadas"] = derivadas.get(item["caminho_foto"])
+    return registros
+
+
+def obter_registro(veiculo_id, itens=True):
+    return obter_registros([veiculo_id], itens=itens).get(veiculo_id)
+
+
+# incrementar ao mudar o layout de gerar_pdf_registro (invalida os PDFs em cache)
+PDF_LAYOUT_VERSAO = 2
+
+
+def versao_pdf(registro):
+    """Hash do conteúdo do registro (inclui as versões das fotos) e da versão do layout."""
+    dados = json.dumps(registro, sort_keys=True, default=str)
+    return hashlib.sha256(f"{PDF_LAYOUT_VERSAO}:{dados}".encode()).hexdigest()[:32]
+
+
+def pdf_registro(veiculo_id):
+    """
+    PDF do checklist a partir do cache em disco: (caminho, registro, versao), ou
+    (None, None, None) se o registro não existir. Cada versão é gerada uma única
+    vez, mesmo com pedidos simultâneos.
+    """
+    registro = obter_registro(veiculo_id)
+    if not registro:
+        return None, None, None
+    versao = versao_pdf(registro)
+    caminho = pdfs.obter(
+        f"pdf:{veiculo_id}:{versao}",
+        lambda destino: gerar_pdf_registro(registro, destino),
+        "pdf",
+    )
+    return caminho, registro, versao
+
+
+def nome_pdf(registro):
+    """Nome de download do PDF de um checklist."""
+    return f"checklist_{registro.get('placa','sem_placa')}_{formatar_data(registro.get('criado_em'), '%d-%m-%Y_%H%M')}.pdf"
+
+
+@tarefa("pdf")
+def _tarefa_pdf(conn, payload):
+    """Job da fila: pré-gera o PDF de um checklist recém-salvo, depois que as fotos tiverem suas versões."""
+    veiculo_id = payload["veiculo_id"]
     cur = conn.cursor()
-    cur.execute("SELECT * FROM veiculos WHERE id = ?", (veiculo_id,))
-    v = cur.fetchone()
-    if not v:
-        conn.close()
+    cur.execute("""
+        SELECT 1 FROM jobs j
+        WHERE j.tipo = 'derivadas' AND j.estado IN ('pendente', 'executando')
+          AND json_extract(j.payload, '$.arquivo') IN (
+              SELECT foto_carro FROM veiculos WHERE id = ?
+              UNION SELECT caminho_foto FROM itens_checklist WHERE veiculo_id = ?
+          )
+        LIMIT 1
+    """, (veiculo_id, veiculo_id))
+    if cur.fetchone():
+        enfileirar(cur, "pdf", payload, atraso=10)
+        conn.commit()
+        return
+    pdf_registro(veiculo_id)
+
+
+def _imagem_pdf(nome, max_w, max_h):
+    """
+    (caminho, largura, altura) para desenhar o anexo `nome` numa caixa de
+    max_w x max_h pontos, ou None se não houver imagem utilizável. Só o cabeçalho
+    do arquivo é lido. Um JPEG que já tem no máximo ~PDF_PX_POR_PONTO px por ponto
+    é embutido como está (o reportlab copia os bytes, sem decodificar); os demais
+    passam por uma versão reduzida do cache de variantes (a mesma de /uploads?w=).
+    Como o reportlab reaproveita o XObject de um caminho já desenhado, imagens
+    repetidas entram uma única vez no PDF.
+    """
+    origem = os.path.join(ANEXOS_DIR, nome)
+    try:
+        with Image.open(origem) as img:
+            formato = img.format
+            img_w, img_h = img.size
+            orientacao = img.getexif().get(0x0112, 1)
+    except Exception:
         return None
-    cur.execute("SELECT * FROM itens_checklist WHERE veiculo_id = ?", (veiculo_id,))
-    itens = cur.fetchall()
-    conn.close()
-    reg = dict(v)
-    reg["itens"] = [dict(i) for i in itens]
-    # Cálculo simples para alerta de troca de óleo (6.000 km)
-    def _to_int(val):
-        try:
-            s = str(val or "")
-            nums = ''.join(ch for ch in s if ch.isdigit())
-            return int(nums) if nums else None
-        except Exception:
-            return None
-
+    if orientacao in (5, 6, 7, 8):  # girada 90°: exif_transpose troca os lados
+        img_w, img_h = img_h, img_w
+    ratio = min(max_w / img_w, max_h / img_h, 1)
+    draw_w, draw_h = img_w * ratio, img_h * ratio
+    largura_px = math.ceil(draw_w * PDF_PX_POR_PONTO)
+    if formato == "JPEG" and orientacao == 1 and img_w <= largura_px * 1.25:
+        return origem, draw_w, draw_h
+    # menor largura pré-definida que atende; fora da lista, a largura exata
+    largura = min((l for l in IMAGEM_LARGURAS_SOB_DEMANDA if l >= largura_px), default=largura_px)
     try:
-        km_atual = _to_int(reg.get('quilometragem'))
-        km_oleo = _to_int(reg.get('oleo_km'))
-        if km_atual is not None and km_oleo is not None:
-            diff = km_atual - km_oleo
-            reg['oleo_diff'] = diff
-            reg['oleo_due_in'] = max(0, 6000 - diff)
-            reg['oleo_alert'] = diff >= 6000
-        else:
-            reg['oleo_diff'] = None
-            reg['oleo_due_in'] = None
-            reg['oleo_alert'] = False
+        caminho = variantes.obter(
+            f"{nome}:{largura}:jpeg",
+            lambda destino: gerar_variante(origem, destino, largura, "jpeg"),
+            "jpg",
+        )
     except Exception:
-        reg['oleo_diff'] = None
-        reg['oleo_due_in'] = None
-        reg['oleo_alert'] = False
-    return reg
+        return None
+    return caminho, draw_w, draw_h
 
 
 def gerar_pdf_registro(registro, caminho_saida):
@@ -211,20 +713,26 @@ def gerar_pdf_registro(registro, caminho_saida):
       - Duas linhas de assinatura ao final: quem realizou o checklist e quem estava com o veículo
     Projetado para visualização em celular: imagens otimizadas e layout vertical.
     """
+    # invariant: sem data de criação/ID aleatório, o mesmo registro gera sempre os mesmos bytes
+    c = canvas.Canvas(caminho_saida, pagesize=A4, invariant=1)
+    c.setTitle(f"Checklist_{registro.get('placa','sem_placa')}")
+    desenhar_registro(c, registro)
+    c.save()
+
+
+def desenhar_registro(c, registro):
+    """Desenha o checklist no canvas a partir de uma página nova e a encerra (showPage)."""
     width, height = A4
     margin = 40
     y = height - margin
 
-    c = canvas.Canvas(caminho_saida, pagesize=A4)
-    c.setTitle(f"Checklist_{registro.get('placa','sem_placa')}")
-
     # Cabeçalho
     c.setFont("Helvetica-Bold", 16)
     c.drawString(margin, y, "Checklist Veicular")
     c.setFont("Helvetica", 10)
     y -= 22
     c.drawString(margin, y, f"ID: {registro.get('id')}")
-    c.drawString(margin + 200, y, f"Data: {registro.get('data') or '-'}")
+    c.drawString(margin + 200, y, f"Data: {formatar_data(registro.get('criado_em')) or '-'}")
     y -= 16
     c.drawString(margin, y, f"Placa: {registro.get('placa') or '-'}")
     c.drawString(margin + 200, y, f"Condutor: {registro.get('condutor') or '-'}")
@@ -235,22 +743,15 @@ def gerar_pdf_registro(registro, caminho_saida):
 
     # Foto principal do veículo (se existir) - otimizada para celular (não ocupa página inteira)
     foto_carro = registro.get("foto_carro")
+    max_width = width - 2 * margin
+    foto_carro = escolher_derivada(registro.get("foto_carro_derivadas"), max_width * PDF_PX_POR_PONTO) or foto_carro
     if foto_carro:
-        foto_path = os.path.join(ANEXOS_DIR, foto_carro)
-        if os.path.exists(foto_path):
-            try:
-                max_width = width - 2 * margin
-                max_height = 200  # mantém razoável para leitura em celular
-                img = Image.open(foto_path)
-                img_w, img_h = img.size
-                ratio = min(max_width / img_w, max_height / img_h, 1)
-                draw_w = img_w * ratio
-                draw_h = img_h * ratio
-                img_reader = ImageReader(foto_path)
-                c.drawImage(img_reader, margin, y - draw_h, width=draw_w, height=draw_h, preserveAspectRatio=True, mask='auto')
-                y -= (draw_h + 12)
-            except Exception:
-                y -= 12
+        # altura máxima de 200 mantém razoável para leitura em celular
+        imagem = _imagem_pdf(foto_carro, max_width, 200)
+        if imagem:
+            caminho, draw_w, draw_h = imagem
+            c.drawImage(caminho, margin, y - draw_h, width=draw_w, height=draw_h)
+            y -= (draw_h + 12)
         else:
             y -= 12
     else:
@@ -280,7 +781,9 @@ def gerar_pdf_registro(registro, caminho_saida):
         nome = item.get("nome_item") or "-"
         status = item.get("status") or "-"
         comentario = item.get("comentario") or ""
-        thumb = item.get("caminho_thumb") or item.get("caminho_foto")
+        # menor versão que ainda fica nítida na miniatura
+        thumb = (escolher_derivada(item.get("derivadas"), thumb_size * PDF_PX_POR_PONTO)
+                 or item.get("caminho_thumb") or item.get("caminho_foto"))
 
         # calcula espaço necessário
         needed_height = max(thumb_size, 36) + 12
@@ -292,19 +795,10 @@ def gerar_pdf_registro(registro, caminho_saida):
 
         # desenha miniatura (se existir)
         draw_w = draw_h = 0
-        if thumb:
-            thumb_path = os.path.join(ANEXOS_DIR, thumb)
-            if os.path.exists(thumb_path):
-                try:
-                    img = Image.open(thumb_path)
-                    img_w, img_h = img.size
-                    ratio = min(thumb_size / img_w, thumb_size / img_h, 1)
-                    draw_w = img_w * ratio
-                    draw_h = img_h * ratio
-                    img_reader = ImageReader(thumb_path)
-                    c.drawImage(img_reader, margin, y - draw_h, width=draw_w, height=draw_h, preserveAspectRatio=True, mask='auto')
-                except Exception:
-                    draw_w = draw_h = 0
+        imagem = _imagem_pdf(thumb, thumb_size, thumb_size) if thumb else None
+        if imagem:
+            caminho, draw_w, draw_h = imagem
+            c.drawImage(caminho, margin, y - draw_h, width=draw_w, height=draw_h)
 
         # texto do item ao lado da miniatura
         text_x = margin + (draw_w + gap if draw_w else 0)
@@ -373,40 +867,3 @@ def gerar_pdf_registro(registro, caminho_saida):
     y = line_y - 40
 
     c.showPage()
-    c.save()
-
-
-def limpar_arquivos_orfaos(dry_run=True, limit=None):
-    """
-    Retorna lista de arquivos órfãos. Se dry_run=False, remove os arquivos.
-    limit opcional limita quantos arquivos remover/listar.
-    """
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT foto_carro FROM veiculos
-        UNION
-        SELECT caminho_foto FROM itens_checklist
-        UNION
-        SELECT caminho_thumb FROM itens_checklist
-    """)
-    referenced = {row[0] for row in cur.fetchall() if row[0]}
-    conn.close()
-
-    all_files = sorted(os.listdir(ANEXOS_DIR))
-    orphans = [f for f in all_files if f not in referenced]
-    if limit:
-        orphans = orphans[:limit]
-
-    if dry_run:
-        return {"orphans": orphans, "count": len(orphans)}
-    removed = []
-    errors = []
-    for fname in orphans:
-        path = os.path.join(ANEXOS_DIR, fname)
-        try:
-            os.remove(path)
-            removed.append(fname)
-        except Exception as e:
-            errors.append({"file": fname, "error": str(e)})
-    return {"removed": removed, "errors": errors, "removed_count": len(removed)}
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Os testes usam um banco e um store de anexos temporários (DATA_DIR), migrados
+uma vez antes de importar o app; data/ do repositório não é tocado.
+"""
+import os
+import sys
+import tempfile
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="checklist-testes-")
+os.environ.setdefault("JOBS_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from migrations import migrate  # noqa: E402
+
+migrate(verbose=False)
+
+from db import connection  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    import app as app_module
+    app_module.app.config["TESTING"] = True
+    return app_module.app
+
+
+@pytest.fixture(scope="session")
+def usuario(app):
+    from models import User
+    with app.app_context():
+        return User.find_by_username("teste") or User.create("teste", "senha", "teste@example.com", True)
+
+
+@pytest.fixture
+def client(app, usuario):
+    c = app.test_client()
+    resp = c.post("/login", data={"username": "teste", "password": "senha"})
+    assert resp.status_code == 302
+    return c
+
+
+@pytest.fixture
+def conn():
+    with connection() as c:
+        yield c
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Banco vazio só deste teste (o da sessão já está migrado): db._connect e o runner usam este arquivo."""
+    import db
+    import migrations
+    arquivo = str(tmp_path / "checklist.db")
+    monkeypatch.setattr(db, "DB_FILE", arquivo)
+    monkeypatch.setattr(migrations, "DB_FILE", arquivo)
+    monkeypatch.setattr(migrations, "LOCK_FILE", arquivo + ".migrate.lock")
+    return arquivo
@@ -0,0 +1,81 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import services
+from config import ANEXOS_DIR
+
+
+def _foto(cor):
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 30), cor).save(buf, "JPEG")
+    buf.seek(0)
+    return FileStorage(stream=buf, filename="foto.jpg")
+
+
+def _salvar(app, placa, cor):
+    with app.test_request_context():
+        return services.salvar_checklist({"tipo": "Carro", "placa": placa}, {"foto_carro": _foto(cor)})
+
+
+def _refs(conn, veiculo_id):
+    return conn.execute("""
+        SELECT a.caminho, a.refs FROM anexos a JOIN veiculos v ON v.foto_carro = a.caminho WHERE v.id = ?
+    """, (veiculo_id,)).fetchone()
+
+
+def test_conteudo_repetido_e_gravado_uma_vez_e_contado(app, conn):
+    primeiro = _salvar(app, "REF1", (10, 20, 30))
+    segundo = _salvar(app, "REF2", (10, 20, 30))
+
+    caminho, refs = _refs(conn, primeiro)
+    assert _refs(conn, segundo)[0] == caminho
+    assert refs == 2
+    assert os.path.isfile(os.path.join(ANEXOS_DIR, caminho))
+
+    conn.execute("DELETE FROM veiculos WHERE id = ?", (segundo,))
+    conn.commit()
+    assert _refs(conn, primeiro)[1] == 1
+
+
+def test_salvamento_com_falha_deixa_o_arquivo_para_o_gc(app, conn, monkeypatch):
+    def falhar(*args, **kwargs):
+        raise RuntimeError("falha simulada")
+
+    with monkeypatch.context() as m:
+        m.setattr(services, "incrementar_stats", falhar)
+        with pytest.raises(RuntimeError):
+            _salvar(app, "FAL1", (200, 100, 50))
+    assert conn.execute("SELECT COUNT(*) FROM veiculos WHERE placa = 'FAL1'").fetchone()[0] == 0
+
+    # um upload concorrente do mesmo conteúdo ainda encontra o arquivo
+    veiculo_id = _salvar(app, "FAL2", (200, 100, 50))
+    caminho, refs = _refs(conn, veiculo_id)
+    assert refs == 1
+    assert os.path.isfile(os.path.join(ANEXOS_DIR, caminho))
+
+
+def test_arquivo_que_nao_e_imagem_e_ignorado(app, conn):
+    falso = FileStorage(stream=io.BytesIO(b"nao sou uma imagem"), filename="foto.jpg")
+    with app.test_request_context():
+        veiculo_id = services.salvar_checklist({"tipo": "Carro", "placa": "REF4"}, {"foto_carro": falso})
+
+    assert conn.execute("SELECT foto_carro FROM veiculos WHERE id = ?", (veiculo_id,)).fetchone()[0] is None
+
+
+def test_erro_de_disco_nao_descarta_a_foto_em_silencio(app, client, conn, monkeypatch):
+    def disco_cheio(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(services.os, "replace", disco_cheio)
+    with app.test_request_context():
+        with pytest.raises(OSError):
+            services.salvar_checklist({"tipo": "Carro", "placa": "REF5"}, {"foto_carro": _foto((1, 2, 3))})
+
+    resp = client.post("/salvar", data={"tipo": "Carro", "placa": "REF6", "foto_carro": (_foto((4, 5, 6)).stream, "foto.jpg")})
+    assert resp.status_code == 302
+    assert "/index" in resp.headers["Location"]
+    assert conn.execute("SELECT COUNT(*) FROM veiculos WHERE placa IN ('REF5', 'REF6')").fetchone()[0] == 0
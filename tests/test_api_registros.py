@@ -0,0 +1,60 @@
+import pytest
+
+import services
+
+
+@pytest.fixture
+def dois_registros(app):
+    with app.test_request_context():
+        return [
+            services.salvar_checklist({
+                "tipo": "Carro", "placa": f"REG000{n}", "status_1": "OK", "itemname_1": "Vidros",
+                "status_2": "Desgastado", "itemname_2": "Pneus Dianteiros",
+            }, {})
+            for n in range(2)
+        ]
+
+
+def test_varios_registros_na_ordem_pedida(client, dois_registros):
+    a, b = dois_registros
+    resp = client.get(f"/api/registros?ids={b},{a},999999,{b}")
+
+    assert resp.status_code == 200
+    dados = resp.get_json()
+    assert [r["id"] for r in dados["items"]] == [b, a]
+    assert dados["missing"] == [999999]
+    assert [i["nome_item"] for i in dados["items"][0]["itens"]] == ["Vidros", "Pneus Dianteiros"]
+    assert dados["items"][0]["itens_criticos"] == 1
+
+
+def test_so_cabecalho_com_itens_0(client, dois_registros):
+    a, _ = dois_registros
+    item = client.get(f"/api/registros?ids={a}&itens=0").get_json()["items"][0]
+
+    assert "itens" not in item
+    assert item["placa"] == "REG0000"
+    assert "oleo_alert" in item
+
+
+def test_consultas_nao_crescem_com_a_quantidade_de_ids(app, dois_registros):
+    def consultas(ids):
+        feitas = []
+        with app.app_context():
+            conn = services.get_conn()
+            conn.set_trace_callback(feitas.append)
+            try:
+                services.obter_registros(ids)
+            finally:
+                conn.set_trace_callback(None)
+        return len(feitas)
+
+    assert consultas(dois_registros[:1]) == consultas(dois_registros)
+
+
+@pytest.mark.parametrize("ids", ["", "1,x", ",".join(str(i) for i in range(1, 102))])
+def test_ids_invalidos(client, ids):
+    assert client.get(f"/api/registros?ids={ids}").status_code == 400
+
+
+def test_exige_login(app):
+    assert app.test_client().get("/api/registros?ids=1").status_code in (302, 401)
@@ -0,0 +1,36 @@
+import base64
+import json
+
+import pytest
+
+
+def _cursor(pos):
+    return base64.urlsafe_b64encode(json.dumps(pos).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "%%%",
+    _cursor([1, 2]),
+    _cursor({"k": [1]}),
+    _cursor({"k": [{"a": 1}, 2]}),
+    _cursor({"k": ["2024-01-01 00:00:00", "2"]}),
+    _cursor({"k": ["2024-01-01 00:00:00", True]}),
+])
+def test_cursor_invalido_responde_400(client, cursor):
+    resp = client.get(f"/api/veiculos?cursor={cursor}")
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "cursor inválido"}
+
+
+def test_cursor_percorre_todas_as_paginas(client, app):
+    from services import salvar_checklist
+    with app.test_request_context():
+        for n in range(5):
+            salvar_checklist({"tipo": "Carro", "placa": f"CUR{n}", "quilometragem": "1"}, {})
+    vistos, cursor = [], ""
+    while cursor is not None:
+        dados = client.get(f"/api/veiculos?per_page=2&cursor={cursor}").get_json()
+        vistos += [(item["criado_em"], item["id"]) for item in dados["items"]]
+        cursor = dados["next_cursor"]
+    assert len(vistos) == len(set(vistos)) >= 5
+    assert vistos == sorted(vistos, reverse=True)
@@ -0,0 +1,55 @@
+import services
+
+
+def _salvar(app, **campos):
+    form = {"tipo": "Carro", "placa": "BUS0A00", "condutor": "Fulano", "modelo": "Uno"}
+    form.update(campos)
+    with app.test_request_context():
+        return services.salvar_checklist(form, {})
+
+
+def _buscar(app, **filtros):
+    with app.app_context():
+        return services.ids_veiculos(**filtros)
+
+
+def test_busca_encontra_campos_e_comentarios_gravados(app):
+    veiculo_id = _salvar(app, placa="FTS1A23", condutor="Genoveva", observacoes="para-choque amassado",
+                         status_1="OK", itemname_1="Pneu", coment_1="sulco quase no limite")
+
+    assert _buscar(app, q="Genoveva") == [veiculo_id]
+    assert _buscar(app, q="amassado") == [veiculo_id]
+    assert _buscar(app, q="quase no") == [veiculo_id]
+    # trigram: substring da placa
+    assert _buscar(app, placa="S1A2") == [veiculo_id]
+
+
+def test_busca_acompanha_edicao_e_exclusao(app, conn):
+    veiculo_id = _salvar(app, placa="FTS2B34", condutor="Anastacio",
+                         status_1="OK", itemname_1="Farol", coment_1="lente trincada")
+
+    conn.execute("UPDATE veiculos SET condutor = 'Bartolomeu' WHERE id = ?", (veiculo_id,))
+    conn.execute("UPDATE itens_checklist SET comentario = 'lente opaca' WHERE veiculo_id = ?", (veiculo_id,))
+    conn.commit()
+    assert _buscar(app, q="Anastacio") == []
+    assert _buscar(app, q="Bartolomeu") == [veiculo_id]
+    assert _buscar(app, q="trincada") == []
+    assert _buscar(app, q="opaca") == [veiculo_id]
+
+    conn.execute("DELETE FROM itens_checklist WHERE veiculo_id = ?", (veiculo_id,))
+    conn.commit()
+    assert _buscar(app, q="opaca") == []
+
+    conn.execute("DELETE FROM veiculos WHERE id = ?", (veiculo_id,))
+    conn.commit()
+    assert _buscar(app, q="Bartolomeu") == []
+    assert conn.execute("SELECT COUNT(*) FROM busca_fts WHERE rowid = ?", (veiculo_id,)).fetchone()[0] == 0
+
+
+def test_termo_curto_usa_like(app):
+    # menos de 3 caracteres não cabe no índice trigram
+    veiculo_id = _salvar(app, placa="QZ9C45", condutor="Quitéria")
+
+    assert services.termo_fts("QZ") is None
+    assert veiculo_id in _buscar(app, q="QZ")
+    assert veiculo_id in _buscar(app, placa="QZ")
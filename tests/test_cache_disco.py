@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cache
+import services
+from cache import DiskCache
+
+
+def _disco(tmp_path, tabela):
+    return DiskCache(str(tmp_path / tabela), 10 * 1024 * 1024, cache.cache, tabela=tabela)
+
+
+def _gerar(conteudo):
+    def gerar(destino):
+        with open(destino, "wb") as fh:
+            fh.write(conteudo)
+    return gerar
+
+
+def test_registra_o_aumento_do_pico_de_memoria_por_geracao(tmp_path, monkeypatch):
+    disco = _disco(tmp_path, "teste_rss")
+    # pico do processo antes/depois de cada geração: só a primeira o eleva (em 500 KiB)
+    picos = iter([1000, 1500, 1500, 1500, 1500, 1500])
+    monkeypatch.setattr(cache, "_rss_pico_kb", lambda: next(picos))
+
+    disco.obter("a", _gerar(b"x" * 10), "bin")
+    disco.obter("b", _gerar(b"y" * 20), "bin")
+    disco.obter("c", _gerar(b"z" * 5), "bin")
+
+    st = disco.stats()
+    assert st["generated"] == 3
+    assert st["rss_growth_kb_max"] == 500
+    assert st["generated_bytes_max"] == 20
+
+
+def test_geracoes_simultaneas_da_mesma_chave_geram_uma_vez(tmp_path):
+    disco = _disco(tmp_path, "teste_single_flight")
+    chamadas, inicio = [], threading.Barrier(8)
+
+    def lento(destino):
+        chamadas.append(1)
+        time.sleep(0.2)
+        _gerar(b"pdf")(destino)
+
+    def pedir():
+        inicio.wait()
+        return disco.obter("mesma", lento, "pdf")
+
+    with ThreadPoolExecutor(8) as pool:
+        caminhos = set(pool.map(lambda _: pedir(), range(8)))
+
+    assert len(chamadas) == 1
+    assert len(caminhos) == 1
+    assert open(caminhos.pop(), "rb").read() == b"pdf"
+
+
+def test_geracao_com_erro_nao_deixa_arquivo(tmp_path):
+    disco = _disco(tmp_path, "teste_falha")
+
+    def falhar(destino):
+        _gerar(b"pela metade")(destino)
+        raise RuntimeError("falha simulada")
+
+    with pytest.raises(RuntimeError):
+        disco.obter("quebrada", falhar, "pdf")
+    arquivos = [os.path.join(d, f) for d, _, fs in os.walk(tmp_path / "teste_falha") for f in fs
+                if not f.endswith(".lock")]
+    assert arquivos == []
+    # a próxima tentativa gera de novo
+    assert open(disco.obter("quebrada", _gerar(b"ok"), "pdf"), "rb").read() == b"ok"
+
+
+def test_pdf_do_checklist_reaproveitado_ate_o_registro_mudar(app, client, conn, monkeypatch):
+    gerar, geracoes = services.gerar_pdf_registro, []
+
+    def contar(registro, destino):
+        geracoes.append(registro["id"])
+        return gerar(registro, destino)
+
+    monkeypatch.setattr(services, "gerar_pdf_registro", contar)
+    with app.test_request_context():
+        veiculo_id = services.salvar_checklist({"tipo": "Carro", "placa": "PDF0001"}, {})
+
+    primeira = client.get(f"/pdf/{veiculo_id}")
+    assert primeira.status_code == 200
+    assert primeira.data.startswith(b"%PDF")
+    assert client.get(f"/pdf/{veiculo_id}", headers={"If-None-Match": primeira.headers["ETag"]}).status_code == 304
+    assert client.get(f"/pdf/{veiculo_id}").data == primeira.data
+    assert geracoes == [veiculo_id]
+
+    conn.execute("UPDATE veiculos SET condutor = 'Outro' WHERE id = ?", (veiculo_id,))
+    conn.commit()
+    segunda = client.get(f"/pdf/{veiculo_id}")
+    assert segunda.headers["ETag"] != primeira.headers["ETag"]
+    assert geracoes == [veiculo_id, veiculo_id]
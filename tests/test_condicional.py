@@ -0,0 +1,54 @@
+import services
+from cache import cached
+from db import incrementar_geracao
+
+
+def _gravar(app, placa):
+    with app.test_request_context():
+        services.salvar_checklist({"tipo": "Carro", "placa": placa}, {})
+
+
+def test_dashboard_responde_304_ate_a_proxima_escrita(app, client):
+    client.get("/index")  # consome mensagens pendentes do login (desligam o ETag)
+    primeira = client.get("/dashboard")
+    etag = primeira.headers["ETag"]
+    assert primeira.status_code == 200
+    assert primeira.headers["Cache-Control"] == "private, no-cache"
+
+    repetida = client.get("/dashboard", headers={"If-None-Match": etag})
+    assert repetida.status_code == 304
+    assert repetida.data == b""
+
+    _gravar(app, "ETAG1")
+    depois = client.get("/dashboard", headers={"If-None-Match": etag})
+    assert depois.status_code == 200
+    assert depois.headers["ETag"] != etag
+
+
+def test_etag_depende_dos_parametros(client):
+    client.get("/index")
+    a = client.get("/api/veiculos?per_page=5").headers["ETag"]
+    b = client.get("/api/veiculos?per_page=10").headers["ETag"]
+    assert a != b
+
+
+def test_cached_e_invalidado_pela_geracao(app, conn):
+    chamadas = []
+
+    @cached("teste_geracao")
+    def contar(x):
+        chamadas.append(x)
+        return x * 2
+
+    with app.app_context():
+        assert contar(21) == 42
+        assert contar(21) == 42
+        assert len(chamadas) == 1
+
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        incrementar_geracao(cur)
+        conn.commit()
+
+        assert contar(21) == 42
+        assert len(chamadas) == 2
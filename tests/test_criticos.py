@@ -0,0 +1,75 @@
+import services
+from config import STATUS_CRITICOS
+from migrations import recalcular_criticos, status_criticos_sql
+
+CRITICO = STATUS_CRITICOS[0]
+
+
+def _divergentes(conn):
+    """Checklists cujo contador difere da contagem a partir dos itens."""
+    return [tuple(r) for r in conn.execute(f"""
+        SELECT v.id, v.itens_criticos, (
+            SELECT COUNT(*) FROM itens_checklist i
+            WHERE i.veiculo_id = v.id AND i.status IN ({status_criticos_sql()})
+        ) AS contagem
+        FROM veiculos v WHERE v.itens_criticos <> contagem
+    """)]
+
+
+def _contador(conn, veiculo_id):
+    return conn.execute("SELECT itens_criticos FROM veiculos WHERE id = ?", (veiculo_id,)).fetchone()[0]
+
+
+def _salvar(app, placa, *status):
+    form = {"tipo": "Carro", "placa": placa}
+    for i, st in enumerate(status, 1):
+        form[f"status_{i}"] = st
+        form[f"itemname_{i}"] = f"Item {i}"
+    with app.test_request_context():
+        return services.salvar_checklist(form, {})
+
+
+def test_contador_acompanha_cada_tipo_de_escrita(app, conn):
+    a = _salvar(app, "CRI1A11", CRITICO, "OK", CRITICO)
+    b = _salvar(app, "CRI2B22", "OK")
+    assert (_contador(conn, a), _contador(conn, b)) == (2, 0)
+    assert _divergentes(conn) == []
+
+    # status entrando e saindo de STATUS_CRITICOS
+    conn.execute("UPDATE itens_checklist SET status = ? WHERE veiculo_id = ? AND status = 'OK'", (CRITICO, b))
+    conn.execute("UPDATE itens_checklist SET status = 'OK' WHERE veiculo_id = ? AND nome_item = 'Item 1'", (a,))
+    conn.commit()
+    assert (_contador(conn, a), _contador(conn, b)) == (1, 1)
+    assert _divergentes(conn) == []
+
+    # item movido para outro checklist
+    conn.execute("UPDATE itens_checklist SET veiculo_id = ? WHERE veiculo_id = ? AND nome_item = 'Item 3'", (b, a))
+    conn.commit()
+    assert (_contador(conn, a), _contador(conn, b)) == (0, 2)
+    assert _divergentes(conn) == []
+
+    # exclusão de itens
+    conn.execute("DELETE FROM itens_checklist WHERE veiculo_id = ? AND nome_item = 'Item 1'", (b,))
+    conn.commit()
+    assert _contador(conn, b) == 1
+    assert _divergentes(conn) == []
+
+    # exclusão do checklist e, depois, dos itens que sobraram dele
+    conn.execute("DELETE FROM veiculos WHERE id = ?", (a,))
+    conn.execute("DELETE FROM itens_checklist WHERE veiculo_id = ?", (a,))
+    conn.commit()
+    assert _contador(conn, b) == 1
+    assert _divergentes(conn) == []
+
+
+def test_recalcular_corrige_contador_divergente(app, conn):
+    veiculo_id = _salvar(app, "CRI3C33", CRITICO)
+    conn.execute("UPDATE veiculos SET itens_criticos = 7 WHERE id = ?", (veiculo_id,))
+    conn.commit()
+    assert _divergentes(conn) != []
+
+    recalcular_criticos(conn.cursor())
+    conn.commit()
+
+    assert _contador(conn, veiculo_id) == 1
+    assert _divergentes(conn) == []
@@ -0,0 +1,49 @@
+import db
+import migrations
+import services
+
+
+def test_migracao_converte_a_data_legada_para_iso(banco, monkeypatch):
+    todas = migrations.MIGRATIONS
+    monkeypatch.setattr(migrations, "MIGRATIONS", todas[:1])
+    migrations.migrate(verbose=False)
+    conn = db._connect()
+    try:
+        conn.executemany("INSERT INTO veiculos(placa, data) VALUES (?, ?)", [
+            ("DTA0001", "05/03/2024 14:30"), ("DTA0002", "07/03/2024"), ("DTA0003", "ontem"),
+        ])
+        conn.commit()
+
+        monkeypatch.setattr(migrations, "MIGRATIONS", todas)
+        migrations.migrate(verbose=False)
+
+        assert [tuple(r) for r in conn.execute("SELECT placa, criado_em FROM veiculos ORDER BY placa")] == [
+            ("DTA0001", "2024-03-05 14:30:00"), ("DTA0002", "2024-03-07 00:00:00"), ("DTA0003", None),
+        ]
+    finally:
+        conn.close()
+
+
+def test_checklist_novo_grava_iso_e_periodo_inclui_o_dia_final(app, conn):
+    with app.test_request_context():
+        a = services.salvar_checklist({"tipo": "Carro", "placa": "DTB0001"}, {})
+        b = services.salvar_checklist({"tipo": "Carro", "placa": "DTB0002"}, {})
+    criado_em = conn.execute("SELECT criado_em FROM veiculos WHERE id = ?", (a,)).fetchone()[0]
+    assert services.formatar_data(criado_em, "%Y-%m-%d %H:%M:%S") == criado_em
+
+    conn.execute("UPDATE veiculos SET criado_em = '2019-02-10 23:59:00' WHERE id = ?", (a,))
+    conn.execute("UPDATE veiculos SET criado_em = '2019-02-11 00:00:00' WHERE id = ?", (b,))
+    conn.commit()
+    with app.app_context():
+        assert services.ids_veiculos(placa="DTB", data_ini="10/02/2019", data_fim="10/02/2019") == [a]
+        assert services.ids_veiculos(placa="DTB", data_ini="2019-02-10", data_fim="2019-02-11") == [b, a]
+        # data inválida não filtra
+        assert set(services.ids_veiculos(placa="DTB", data_ini="31/31/2019")) == {a, b}
+
+
+def test_filtro_de_periodo_usa_o_indice(conn):
+    clauses, params = services.filtro_periodo("01/01/2024", "31/01/2024", coluna="criado_em")
+    plano = " ".join(r[3] for r in conn.execute(
+        f"EXPLAIN QUERY PLAN SELECT id FROM veiculos WHERE {' AND '.join(clauses)}", params))
+    assert params == ["2024-01-01", "2024-02-01"]
+    assert "idx_veiculos_criado_em" in plano
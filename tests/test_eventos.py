@@ -0,0 +1,58 @@
+import pytest
+
+import eventos
+
+
+@pytest.fixture
+def difusor_atrasado(monkeypatch):
+    """Difusor cuja consulta periódica ainda não viu os eventos publicados no teste."""
+    monkeypatch.setattr(eventos, "SSE_POLL_INTERVAL", 3600)
+    monkeypatch.setattr(eventos, "SSE_HEARTBEAT", 0.05)
+    monkeypatch.setattr(eventos, "SSE_DURACAO_MAX", 0.2)
+    difusor = eventos._Difusor()
+    difusor.conectar()
+    difusor.desconectar()
+    monkeypatch.setattr(eventos, "_difusor", difusor)
+    return difusor
+
+
+def _publicar(conn, tipo="teste"):
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    eventos.publicar(cur, tipo, {})
+    conn.commit()
+    return eventos.ultimo_id(conn)
+
+
+def test_id_visto_por_outro_worker_nao_manda_recarregar(conn, difusor_atrasado):
+    novo = _publicar(conn)
+    assert novo > difusor_atrasado._ultimo
+
+    corpo = "".join(eventos.fluxo(novo))
+
+    assert "recarregar" not in corpo
+    assert ": ping" in corpo
+
+
+def test_id_alem_do_banco_manda_recarregar(conn, difusor_atrasado):
+    corpo = "".join(eventos.fluxo(eventos.ultimo_id(conn) + 100))
+
+    assert "event: recarregar" in corpo
+
+
+def test_reconexao_recebe_o_que_perdeu(conn, monkeypatch):
+    monkeypatch.setattr(eventos, "SSE_DURACAO_MAX", 0)
+    anterior = eventos.ultimo_id(conn)
+    novo = _publicar(conn, "perdido")
+
+    corpo = "".join(eventos.fluxo(anterior))
+
+    assert f"id: {novo}\nevent: perdido\n" in corpo
+
+
+def test_retencao(conn, monkeypatch):
+    monkeypatch.setattr(eventos, "EVENTOS_RETENCAO", 3)
+    for _ in range(5):
+        ultimo = _publicar(conn)
+    ids = [r[0] for r in conn.execute("SELECT id FROM eventos ORDER BY id")]
+    assert ids == [ultimo - 2, ultimo - 1, ultimo]
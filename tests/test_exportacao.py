@@ -0,0 +1,56 @@
+import pytest
+
+import exportacao
+import services
+
+
+@pytest.fixture
+def tres_checklists(app):
+    with app.test_request_context():
+        for n in range(3):
+            services.salvar_checklist({"tipo": "Moto", "placa": f"EXPLIM{n}"}, {})
+    return {"placa": "EXPLIM"}
+
+
+def test_selecao_acima_do_limite_e_recusada(client, conn, tres_checklists, monkeypatch):
+    monkeypatch.setattr(exportacao, "EXPORT_MAX_REGISTROS", 2)
+    antes = conn.execute("SELECT COUNT(*) FROM exportacoes").fetchone()[0]
+
+    resp = client.post("/api/exportacoes", json={"formato": "zip", **tres_checklists})
+
+    assert resp.status_code == 400
+    assert "2 checklists" in resp.get_json()["error"]
+    assert conn.execute("SELECT COUNT(*) FROM exportacoes").fetchone()[0] == antes
+
+
+def test_selecao_que_cresce_depois_de_iniciar_falha_sem_cortar(app, conn, tres_checklists, monkeypatch):
+    with app.app_context():
+        exportacao_id = exportacao.iniciar(conn, tres_checklists, "zip", fila=False)
+        monkeypatch.setattr(exportacao, "EXPORT_MAX_REGISTROS", 2)
+        assert exportacao.executar(conn, exportacao_id)
+
+    st = exportacao.status(conn, exportacao_id)
+    assert st["estado"] == "erro"
+    assert st["arquivo"] is None
+    assert "refine os filtros" in st["erro"]
+
+
+def test_pdf_unico_carrega_registros_em_lotes(app, conn, tres_checklists, monkeypatch, tmp_path):
+    consultas = []
+    obter = exportacao.obter_registros
+
+    def contar(ids, **kwargs):
+        consultas.append(list(ids))
+        return obter(ids, **kwargs)
+
+    monkeypatch.setattr(exportacao, "PDF_UNICO_LOTE", 2)
+    monkeypatch.setattr(exportacao, "obter_registros", contar)
+    progresso = []
+    with app.app_context():
+        # um id removido depois da consulta, no fim da lista
+        ids = services.ids_veiculos(**tres_checklists) + [999999]
+        exportacao.gerar_pdf_unico(ids, str(tmp_path / "frota.pdf"), progresso.append)
+
+    assert consultas == [ids[i:i + 2] for i in range(0, len(ids), 2)]
+    assert progresso == list(range(1, len(ids) + 1))
+    assert (tmp_path / "frota.pdf").read_bytes().startswith(b"%PDF")
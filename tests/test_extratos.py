@@ -0,0 +1,71 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import exportacao
+import services
+
+
+@pytest.fixture(scope="module")
+def frota(app):
+    with app.test_request_context():
+        return [
+            services.salvar_checklist({
+                "tipo": "Carro", "placa": f"EXT{n:04d}", "condutor": "Zé, \"o motorista\"",
+                "status_1": "OK", "itemname_1": "Vidros", "coment_1": "linha 1\nlinha 2",
+                "status_2": "Desgastado", "itemname_2": "Pneus Dianteiros",
+            }, {})
+            for n in range(3)
+        ]
+
+
+def test_csv_de_veiculos(client, frota):
+    resp = client.get("/api/extratos/veiculos.csv?placa=EXT")
+
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/csv"
+    assert "attachment; filename=veiculos_" in resp.headers["Content-Disposition"]
+    linhas = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    assert [int(l["id"]) for l in linhas] == sorted(frota)
+    assert linhas[0]["condutor"] == 'Zé, "o motorista"'
+    assert linhas[0]["itens_criticos"] == "1"
+
+
+def test_ndjson_de_itens(client, frota):
+    resp = client.get("/api/extratos/itens.ndjson?placa=EXT")
+
+    assert resp.mimetype == "application/x-ndjson"
+    itens = [json.loads(l) for l in resp.get_data(as_text=True).splitlines()]
+    assert len(itens) == 2 * len(frota)
+    assert itens[0]["veiculo_id"] == min(frota)
+    assert itens[0]["comentario"] == "linha 1\nlinha 2"
+
+
+def test_gzip_em_varios_blocos_igual_ao_texto(client, frota, monkeypatch):
+    monkeypatch.setattr(exportacao, "EXTRATO_BLOCO", 64)
+    texto = client.get("/api/extratos/itens.csv?placa=EXT").data
+
+    resp = client.get("/api/extratos/itens.csv?placa=EXT&gzip=1")
+    assert resp.mimetype == "application/gzip"
+    assert resp.headers["Content-Disposition"].endswith(".csv.gz")
+    assert gzip.decompress(resp.data) == texto
+
+    blocos = list(exportacao.gerar_extrato("itens", "csv", {"placa": "EXT"}))
+    assert len(blocos) > 1
+    assert b"".join(blocos) == texto
+
+
+def test_extrato_sem_linhas_tem_so_o_cabecalho(client):
+    resp = client.get("/api/extratos/manutencoes.csv?placa=NENHUMA")
+    linhas = resp.get_data(as_text=True).splitlines()
+    assert len(linhas) == 1
+    assert linhas[0].startswith("veiculo_id,placa,modelo,manutencao_id,nome_peca,")
+    assert client.get("/api/extratos/manutencoes.ndjson?placa=NENHUMA").data == b""
+
+
+def test_extrato_desconhecido(client):
+    assert client.get("/api/extratos/usuarios.csv").status_code == 404
+    assert client.get("/api/extratos/veiculos.xml").status_code == 404
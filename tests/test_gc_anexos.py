@@ -0,0 +1,98 @@
+import os
+import time
+
+import gc_anexos
+from config import ANEXOS_DIR, GC_CARENCIA
+
+
+def _arquivo(nome, idade=0):
+    caminho = os.path.join(ANEXOS_DIR, nome)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, "wb") as fh:
+        fh.write(b"x" * 10)
+    antigo = time.time() - idade
+    os.utime(caminho, (antigo, antigo))
+    return caminho
+
+
+def _executar_ate_o_fim(conn):
+    execucao_id = gc_anexos.iniciar(conn, dry_run=False)
+    while not gc_anexos.executar(conn, execucao_id):
+        pass
+    return gc_anexos.status(conn, execucao_id)
+
+
+def test_remove_so_orfaos_fora_da_carencia(conn):
+    orfao = _arquivo("gc/aa/orfao.jpg", idade=GC_CARENCIA + 60)
+    recente = _arquivo("gc/aa/recente.jpg")
+    usado = _arquivo("gc/aa/usado.jpg", idade=GC_CARENCIA + 60)
+    conn.execute("INSERT INTO veiculos(placa, foto_carro) VALUES ('GC1', 'gc/aa/usado.jpg')")
+    conn.commit()
+
+    st = _executar_ate_o_fim(conn)
+
+    assert st["estado"] == "concluido"
+    assert not os.path.exists(orfao)
+    assert os.path.exists(recente)
+    assert os.path.exists(usado)
+
+
+def test_preserva_arquivo_renovado_depois_da_varredura(conn):
+    # upload repetido: renova o mtime entre o stat do lote e a remoção
+    caminho = _arquivo("gc/bb/repetido.jpg", idade=GC_CARENCIA + 60)
+    lote = [("gc/bb/repetido.jpg", os.stat(caminho))]
+    os.utime(caminho)
+    execucao = gc_anexos._execucao(conn, gc_anexos.iniciar(conn, dry_run=False))
+
+    gc_anexos._processar_lote(conn, execucao, lote)
+
+    assert os.path.exists(caminho)
+
+
+def test_preserva_anexo_com_refs(conn):
+    caminho = _arquivo("gc/cc/registrado.jpg", idade=GC_CARENCIA + 60)
+    conn.execute("INSERT INTO anexos(hash, caminho, tamanho, refs) VALUES ('gc-cc', 'gc/cc/registrado.jpg', 10, 1)")
+    conn.commit()
+    execucao = gc_anexos._execucao(conn, gc_anexos.iniciar(conn, dry_run=False))
+
+    gc_anexos._processar_lote(conn, execucao, [("gc/cc/registrado.jpg", os.stat(caminho))])
+
+    assert os.path.exists(caminho)
+
+
+def test_cli_nao_enfileira_job(conn):
+    antes = conn.execute("SELECT COUNT(*) FROM jobs WHERE tipo = 'gc_anexos'").fetchone()[0]
+    execucao_id = gc_anexos.iniciar(conn, dry_run=True, fila=False)
+
+    assert conn.execute("SELECT COUNT(*) FROM jobs WHERE tipo = 'gc_anexos'").fetchone()[0] == antes
+    assert gc_anexos.executar(conn, execucao_id)
+
+
+def test_lote_concorrente_nao_conta_duas_vezes(conn):
+    # job e linha de comando leram o mesmo cursor: só o primeiro grava o lote
+    caminho = _arquivo("gc/dd/dobrado.jpg", idade=GC_CARENCIA + 60)
+    execucao_id = gc_anexos.iniciar(conn, dry_run=True, fila=False)
+    lido = gc_anexos._execucao(conn, execucao_id)
+    lote = [("gc/dd/dobrado.jpg", os.stat(caminho))]
+
+    assert gc_anexos._processar_lote(conn, lido, lote)
+    assert not gc_anexos._processar_lote(conn, lido, lote)
+
+    st = gc_anexos.status(conn, execucao_id)
+    assert (st["verificados"], st["orfaos"], st["cursor"]) == (1, 1, "gc/dd/dobrado.jpg")
+    # a conclusão com o cursor antigo também é recusada
+    assert not gc_anexos._concluir(conn, lido)
+    assert gc_anexos.executar(conn, execucao_id)
+    assert gc_anexos.status(conn, execucao_id)["estado"] == "concluido"
+
+
+def test_execucao_concluida_nao_recebe_lotes(conn):
+    caminho = _arquivo("gc/ee/tarde.jpg", idade=GC_CARENCIA + 60)
+    execucao_id = gc_anexos.iniciar(conn, dry_run=False, fila=False)
+    lido = gc_anexos._execucao(conn, execucao_id)
+    lote = [("gc/ee/tarde.jpg", os.stat(caminho))]
+    assert gc_anexos.executar(conn, execucao_id)
+    verificados = gc_anexos.status(conn, execucao_id)["verificados"]
+
+    assert not gc_anexos._processar_lote(conn, lido, lote)
+    assert gc_anexos.status(conn, execucao_id)["verificados"] == verificados
@@ -0,0 +1,196 @@
+import csv
+import json
+import os
+
+import pytest
+
+import importacao
+
+
+@pytest.mark.parametrize("valor, tipo, esperado", [
+    ("10.000", int, 10000),
+    ("10000", int, 10000),
+    (10000, int, 10000),
+    (10000.0, int, 10000),
+    ("1.234,50", float, 1234.5),
+    ("1.234", float, 1234.0),
+    ("12.5", float, 12.5),
+])
+def test_numero(valor, tipo, esperado):
+    assert importacao._numero({"c": valor}, "c", tipo) == esperado
+
+
+@pytest.mark.parametrize("valor", ["10.5", "1,5", 10.5, "abc", "-3", True])
+def test_numero_inteiro_invalido_e_rejeitado(valor):
+    with pytest.raises(importacao.RegistroInvalido):
+        importacao._numero({"c": valor}, "c", int)
+
+
+@pytest.mark.parametrize("itens", [3, "Pneus", {"nome_item": "Pneus", "status": "OK"}, True])
+def test_itens_que_nao_sao_lista_rejeitam_o_registro(itens):
+    with pytest.raises(importacao.RegistroInvalido, match="esperado uma lista"):
+        importacao.validar_checklist({"placa": "ABC1D23", "criado_em": "2023-03-01 08:00:00", "itens": itens})
+
+
+def _csv_checklists(caminho, prefixo, n):
+    with open(caminho, "w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh, delimiter=";")
+        w.writerow(["ref", "tipo", "placa", "criado_em", "quilometragem", "nome_item", "status", "comentario"])
+        for i in range(n):
+            w.writerow([i, "Carro", f"{prefixo}{i:03d}", f"0{1 + i % 9}/03/2023 08:00", "1.000", "pneus dianteiros", "Desgastado", ""])
+            w.writerow([i, "Carro", f"{prefixo}{i:03d}", f"0{1 + i % 9}/03/2023 08:00", "1.000", "Vidros", "OK", "trinca"])
+        w.writerow(["x", "Carro", f"{prefixo}BAD", "31/31/2023", "1", "Vidros", "OK", ""])
+
+
+def _importar(conn, tipo, caminho):
+    importacao_id = importacao.iniciar(conn, tipo, str(caminho), fila=False)
+    importacao.executar(conn, importacao_id)
+    return importacao.status(conn, importacao_id)
+
+
+def test_importa_checklists_e_rejeita_linhas_invalidas(conn, tmp_path):
+    arquivo = tmp_path / "hist.csv"
+    _csv_checklists(arquivo, "IMA", 20)
+
+    st = _importar(conn, "checklists", arquivo)
+
+    assert (st["estado"], st["inseridos"], st["rejeitados"]) == ("concluido", 20, 1)
+    assert "31/31/2023" in st["erros"][0]["erro"]
+    linhas = conn.execute("""
+        SELECT v.itens_criticos, i.nome_item FROM veiculos v JOIN itens_checklist i ON i.veiculo_id = v.id
+        WHERE v.placa LIKE 'IMA%' AND i.status = 'Desgastado'
+    """).fetchall()
+    assert len(linhas) == 20
+    assert {tuple(r) for r in linhas} == {(1, "Pneus Dianteiros")}
+    # a marca que desativa os triggers não sobra depois do lote
+    assert conn.execute("SELECT COUNT(*) FROM importando").fetchone()[0] == 0
+
+
+def test_lotes_nao_alteram_o_schema(conn, tmp_path, monkeypatch):
+    arquivo = tmp_path / "hist.csv"
+    _csv_checklists(arquivo, "IMS", 25)
+    monkeypatch.setattr(importacao, "IMPORT_LOTE", 10)
+    versao = conn.execute("PRAGMA schema_version").fetchone()[0]
+
+    st = _importar(conn, "checklists", arquivo)
+
+    assert st["inseridos"] == 25
+    assert conn.execute("PRAGMA schema_version").fetchone()[0] == versao
+    # índice de busca e contador refeitos por lote, como os triggers fariam
+    assert conn.execute("SELECT COUNT(*) FROM busca_fts WHERE busca_fts MATCH 'trinca' AND placa LIKE 'IMS%'").fetchone()[0] == 25
+    assert conn.execute("SELECT SUM(itens_criticos) FROM veiculos WHERE placa LIKE 'IMS%'").fetchone()[0] == 25
+
+
+def test_triggers_continuam_ativos_fora_da_importacao(app, conn):
+    import services
+    with app.test_request_context():
+        veiculo_id = services.salvar_checklist({
+            "tipo": "Carro", "placa": "IMT0001", "status_1": "Desgastado", "itemname_1": "Pneus",
+            "coment_1": "careca",
+        }, {})
+    assert conn.execute("SELECT itens_criticos FROM veiculos WHERE id = ?", (veiculo_id,)).fetchone()[0] == 1
+    assert conn.execute("SELECT comentarios FROM busca_fts WHERE rowid = ?", (veiculo_id,)).fetchone()[0] == "careca"
+
+
+def test_retomada_nao_duplica_registros(conn, tmp_path, monkeypatch):
+    arquivo = tmp_path / "hist.csv"
+    _csv_checklists(arquivo, "IMR", 30)
+    monkeypatch.setattr(importacao, "IMPORT_LOTE", 10)
+    gravar, chamadas = importacao._gravar_lote, []
+
+    def cair_no_segundo_lote(*args, **kwargs):
+        chamadas.append(1)
+        if len(chamadas) == 2:
+            raise RuntimeError("queda simulada")
+        return gravar(*args, **kwargs)
+
+    importacao_id = importacao.iniciar(conn, "checklists", str(arquivo), fila=False)
+    monkeypatch.setattr(importacao, "_gravar_lote", cair_no_segundo_lote)
+    with pytest.raises(RuntimeError):
+        importacao.executar(conn, importacao_id)
+    assert importacao.status(conn, importacao_id)["inseridos"] == 10
+
+    monkeypatch.setattr(importacao, "_gravar_lote", gravar)
+    importacao.retomar(conn, importacao_id, fila=False)
+    importacao.executar(conn, importacao_id)
+
+    st = importacao.status(conn, importacao_id)
+    assert (st["estado"], st["inseridos"], st["rejeitados"]) == ("concluido", 30, 1)
+    assert tuple(conn.execute("SELECT COUNT(*), COUNT(DISTINCT placa) FROM veiculos WHERE placa LIKE 'IMR%'").fetchone()) == (30, 30)
+
+
+def test_manutencoes_com_separador_de_milhar(conn, tmp_path):
+    _csv_checklists(tmp_path / "base.csv", "IMM", 1)
+    _importar(conn, "checklists", tmp_path / "base.csv")
+    arquivo = tmp_path / "manut.ndjson"
+    registros = [
+        {"placa": "IMM000", "nome_peca": "Correia", "data_manutencao": "2023-05-01",
+         "quilometragem_atual": "50.000", "vida_util_km": "10.000", "valor_peca": "1.234,50"},
+        {"placa": "IMM000", "nome_peca": "Filtro", "data_manutencao": "2023-05-01",
+         "quilometragem_atual": "50.000", "vida_util_km": "10.5"},
+        {"placa": "NAOEXISTE", "nome_peca": "x", "data_manutencao": "2023-05-01", "quilometragem_atual": "1"},
+    ]
+    arquivo.write_text("\n".join(json.dumps(r) for r in registros) + "\n", encoding="utf-8")
+
+    st = _importar(conn, "manutencoes", arquivo)
+
+    assert (st["inseridos"], st["rejeitados"]) == (1, 2)
+    row = conn.execute("SELECT km, vida_util_km, valor_peca FROM manutencao WHERE nome_peca = 'Correia'").fetchone()
+    assert tuple(row) == (50000, 10000, 1234.5)
+
+
+def test_ndjson_com_itens_invalidos_rejeita_so_a_linha(conn, tmp_path):
+    arquivo = tmp_path / "hist.ndjson"
+    arquivo.write_text(
+        '{"placa": "IMN001", "criado_em": "2023-03-01 08:00:00", "itens": 3}\n'
+        '{"placa": "IMN002", "criado_em": "2023-03-01 08:00:00", "itens": []}\n', encoding="utf-8")
+
+    st = _importar(conn, "checklists", arquivo)
+
+    assert (st["estado"], st["inseridos"], st["rejeitados"]) == ("concluido", 1, 1)
+    assert st["erros"] == [{"linha": 1, "erro": "itens: esperado uma lista"}]
+
+
+def _arquivo_enviado(conn, importacao_id):
+    from config import IMPORT_DIR
+    nome = conn.execute("SELECT arquivo FROM importacoes WHERE id = ?", (importacao_id,)).fetchone()[0]
+    return os.path.join(IMPORT_DIR, nome)
+
+
+def test_arquivo_e_apagado_ao_concluir(conn, tmp_path):
+    arquivo = tmp_path / "hist.csv"
+    _csv_checklists(arquivo, "IMC", 2)
+    importacao_id = importacao.iniciar(conn, "checklists", str(arquivo), fila=False)
+    enviado = _arquivo_enviado(conn, importacao_id)
+    assert os.path.exists(enviado)
+
+    importacao.executar(conn, importacao_id)
+
+    assert importacao.status(conn, importacao_id)["estado"] == "concluido"
+    assert not os.path.exists(enviado)
+
+
+def test_importacao_parada_expira_apos_a_retencao(conn, tmp_path):
+    arquivo = tmp_path / "hist.csv"
+    _csv_checklists(arquivo, "IME", 2)
+    parada = importacao.iniciar(conn, "checklists", str(arquivo), fila=False)
+    recente = importacao.iniciar(conn, "checklists", str(arquivo), fila=False)
+    conn.execute("""
+        UPDATE importacoes SET estado = 'erro', atualizado_em = datetime('now', '-30 days') WHERE id = ?
+    """, (parada,))
+    conn.execute("UPDATE importacoes SET estado = 'erro', atualizado_em = CURRENT_TIMESTAMP WHERE id = ?", (recente,))
+    conn.commit()
+
+    outra = importacao.iniciar(conn, "checklists", str(arquivo), fila=False)
+
+    assert importacao.status(conn, parada)["estado"] == "expirado"
+    assert not os.path.exists(_arquivo_enviado(conn, parada))
+    importacao.retomar(conn, parada, fila=False)
+    assert importacao.status(conn, parada)["estado"] == "expirado"
+    # dentro da retenção continua retomável
+    assert importacao.status(conn, recente)["estado"] == "erro"
+    assert os.path.exists(_arquivo_enviado(conn, recente))
+    # termina as demais, para não deixar importações em andamento no banco dos testes
+    for importacao_id in (recente, outra):
+        importacao.retomar(conn, importacao_id, fila=False)
+        importacao.executar(conn, importacao_id)
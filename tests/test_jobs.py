@@ -0,0 +1,44 @@
+import time
+
+import jobs
+
+
+@jobs.tarefa("teste_ok")
+def _tarefa_ok(conn, payload):
+    pass
+
+
+def _job(conn, estado, finalizado_em):
+    cur = conn.execute(
+        "INSERT INTO jobs(tipo, payload, estado, finalizado_em) VALUES ('teste_antigo', '{}', ?, ?)",
+        (estado, finalizado_em),
+    )
+    conn.commit()
+    return cur.lastrowid
+
+
+def _existe(conn, job_id):
+    return conn.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+
+def test_jobs_terminados_saem_depois_da_retencao(conn, monkeypatch):
+    agora = time.time()
+    velho = _job(conn, "feito", agora - jobs.JOBS_RETENCAO - 60)
+    velho_erro = _job(conn, "erro", agora - jobs.JOBS_RETENCAO - 60)
+    recente = _job(conn, "feito", agora - 60)
+    monkeypatch.setattr(jobs, "_ultima_limpeza", [0.0])
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    jobs.enfileirar(cur, "teste_ok", {})
+    conn.commit()
+
+    while jobs.processar_um(conn):
+        pass
+
+    assert not _existe(conn, velho)
+    assert not _existe(conn, velho_erro)
+    assert _existe(conn, recente)
+    estado, finalizado_em = conn.execute(
+        "SELECT estado, finalizado_em FROM jobs WHERE tipo = 'teste_ok' ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    assert estado == "feito" and finalizado_em >= agora
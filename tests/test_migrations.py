@@ -0,0 +1,78 @@
+import pytest
+
+import db
+import migrations
+
+
+def _versoes(banco):
+    conn = db._connect()
+    try:
+        return [tuple(r) for r in conn.execute("SELECT version, descricao FROM schema_version ORDER BY version")]
+    finally:
+        conn.close()
+
+
+def _schema(banco):
+    conn = db._connect()
+    try:
+        return conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall()
+    finally:
+        conn.close()
+
+
+def test_aplica_uma_versao_por_migracao(banco, monkeypatch):
+    todas = migrations.MIGRATIONS
+    monkeypatch.setattr(migrations, "MIGRATIONS", todas[:3])
+    migrations.migrate(verbose=False)
+    assert _versoes(banco) == [(v, fn.__name__) for v, fn in todas[:3]]
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", todas)
+    assert migrations.migrate(verbose=False) == migrations.VERSAO_ATUAL
+    assert _versoes(banco) == [(v, fn.__name__) for v, fn in todas]
+
+
+def test_segunda_execucao_nao_altera_nada(banco):
+    migrations.migrate(verbose=False)
+    versoes, schema = _versoes(banco), _schema(banco)
+
+    assert migrations.migrate(verbose=False) == migrations.VERSAO_ATUAL
+    assert _versoes(banco) == versoes
+    assert [tuple(r) for r in _schema(banco)] == [tuple(r) for r in schema]
+
+
+def test_migracao_com_erro_e_desfeita(banco, monkeypatch):
+    migrations.migrate(verbose=False)
+    proxima = migrations.VERSAO_ATUAL + 1
+
+    def m_falha(cur):
+        cur.execute("CREATE TABLE tabela_da_falha (x INTEGER)")
+        cur.execute("INSERT INTO veiculos(placa) VALUES ('FALHA')")
+        raise RuntimeError("falha simulada")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [(proxima, m_falha)])
+    with pytest.raises(RuntimeError):
+        migrations.migrate(verbose=False)
+
+    assert migrations.versao_schema() == migrations.VERSAO_ATUAL
+    nomes = {r[1] for r in _schema(banco)}
+    assert "tabela_da_falha" not in nomes
+    conn = db._connect()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM veiculos WHERE placa = 'FALHA'").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_verificar_schema_recusa_banco_desatualizado(banco, monkeypatch):
+    with pytest.raises(RuntimeError):
+        migrations.verificar_schema()
+
+    todas = migrations.MIGRATIONS
+    monkeypatch.setattr(migrations, "MIGRATIONS", todas[:-1])
+    migrations.migrate(verbose=False)
+    monkeypatch.setattr(migrations, "MIGRATIONS", todas)
+    with pytest.raises(RuntimeError, match="python migrations.py"):
+        migrations.verificar_schema()
+
+    migrations.migrate(verbose=False)
+    assert migrations.verificar_schema() == migrations.VERSAO_ATUAL
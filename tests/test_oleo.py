@@ -0,0 +1,62 @@
+import pytest
+
+import db
+import migrations
+import services
+from config import OLEO_INTERVALO_KM
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("50.000 km", 50000), ("12345", 12345), (7000, 7000), ("sem leitura", None), ("", None), (None, None),
+])
+def test_km_para_int(valor, esperado):
+    assert services.km_para_int(valor) == esperado
+
+
+def test_status_oleo():
+    assert services.status_oleo(None) == {"oleo_diff": None, "oleo_due_in": None, "oleo_alert": False}
+    assert services.status_oleo(OLEO_INTERVALO_KM - 1) == {
+        "oleo_diff": OLEO_INTERVALO_KM - 1, "oleo_due_in": 1, "oleo_alert": False}
+    assert services.status_oleo(OLEO_INTERVALO_KM + 500) == {
+        "oleo_diff": OLEO_INTERVALO_KM + 500, "oleo_due_in": 0, "oleo_alert": True}
+
+
+def test_migracao_preenche_km_a_partir_do_texto(banco, monkeypatch):
+    todas = migrations.MIGRATIONS
+    monkeypatch.setattr(migrations, "MIGRATIONS", [m for m in todas if m[0] < 7])
+    migrations.migrate(verbose=False)
+    conn = db._connect()
+    try:
+        conn.execute("""
+            INSERT INTO veiculos(placa, quilometragem, oleo_km) VALUES ('OLM0001', '58.000 km', '50.000')
+        """)
+        conn.commit()
+
+        monkeypatch.setattr(migrations, "MIGRATIONS", todas)
+        migrations.migrate(verbose=False)
+
+        row = conn.execute("SELECT km, km_oleo, oleo_diff FROM veiculos WHERE placa = 'OLM0001'").fetchone()
+        assert tuple(row) == (58000, 50000, 8000)
+    finally:
+        conn.close()
+
+
+def test_checklist_grava_km_inteiro_e_filtra_oleo_vencido(app, conn):
+    with app.test_request_context():
+        vencido = services.salvar_checklist({
+            "tipo": "Carro", "placa": "OLE0001", "quilometragem": "20.500 km", "oleo_km": "10.000",
+        }, {})
+        em_dia = services.salvar_checklist({
+            "tipo": "Carro", "placa": "OLE0002", "quilometragem": "10.500", "oleo_km": "10.000 km",
+        }, {})
+        sem_troca = services.salvar_checklist({"tipo": "Carro", "placa": "OLE0003", "quilometragem": "900"}, {})
+
+    row = conn.execute("SELECT km, km_oleo, oleo_km, oleo_diff FROM veiculos WHERE id = ?", (vencido,)).fetchone()
+    assert tuple(row) == (20500, 10000, "10000", 10500)
+    with app.app_context():
+        assert services.ids_veiculos(placa="OLE", oleo_alert=True) == [vencido]
+        registros = services.obter_registros([vencido, em_dia, sem_troca], itens=False)
+    assert registros[vencido]["oleo_alert"] is True
+    assert registros[em_dia]["oleo_alert"] is False
+    assert registros[em_dia]["oleo_due_in"] == OLEO_INTERVALO_KM - 500
+    assert registros[sem_troca]["oleo_diff"] is None
@@ -0,0 +1,56 @@
+import io
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage, MultiDict
+
+import services
+
+
+def _foto(cor):
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 30), cor).save(buf, "JPEG")
+    buf.seek(0)
+    return FileStorage(stream=buf, filename="foto.jpg")
+
+
+def test_itens_gravados_em_ordem_com_suas_fotos(app, conn):
+    form = MultiDict({"tipo": "Carro", "placa": "SAL0001", "quilometragem": "1000"})
+    for i, (nome, status) in enumerate([("Farol Esq.", "OK"), ("Pneus Dianteiros", "Desgastado"), ("Vidros", "OK")]):
+        form[f"status_{i}"] = status
+        form[f"itemname_{i}"] = nome
+        form[f"coment_{i}"] = f"comentário {i}"
+    files = {"foto_1": _foto((200, 0, 0)), "foto_carro": _foto((0, 0, 200))}
+    with app.test_request_context():
+        veiculo_id = services.salvar_checklist(form, files)
+
+    itens = [tuple(r) for r in conn.execute("""
+        SELECT nome_item, status, comentario, caminho_foto IS NOT NULL FROM itens_checklist
+        WHERE veiculo_id = ? ORDER BY id
+    """, (veiculo_id,))]
+    assert itens == [
+        ("Farol Esq.", "OK", "comentário 0", 0),
+        ("Pneus Dianteiros", "Desgastado", "comentário 1", 1),
+        ("Vidros", "OK", "comentário 2", 0),
+    ]
+    foto_carro, foto_item = conn.execute("""
+        SELECT v.foto_carro, i.caminho_foto FROM veiculos v JOIN itens_checklist i ON i.veiculo_id = v.id
+        WHERE v.id = ? AND i.caminho_foto IS NOT NULL
+    """, (veiculo_id,)).fetchone()
+    assert foto_carro and foto_item and foto_carro != foto_item
+
+
+def test_fotos_sao_gravadas_antes_de_abrir_a_transacao(app, monkeypatch):
+    gravar, durante = services._save_file_storage, []
+
+    def registrar(file_storage):
+        durante.append(services.get_conn().in_transaction)
+        return gravar(file_storage)
+
+    monkeypatch.setattr(services, "_save_file_storage", registrar)
+    with app.test_request_context():
+        services.salvar_checklist({
+            "tipo": "Carro", "placa": "SAL0002", "status_1": "OK", "itemname_1": "Vidros",
+        }, {"foto_carro": _foto((1, 1, 1)), "foto_1": _foto((2, 2, 2))})
+
+    # foto_carro e uma por item, todas fora da transação de escrita
+    assert durante == [False, False]
@@ -0,0 +1,98 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import app as app_module
+import services
+from cache import variantes
+from config import ANEXOS_DIR
+
+
+@pytest.fixture
+def foto(app, conn):
+    """Caminho relativo (no store) de uma foto de 400x300 salva num checklist."""
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 300), (30, 120, 90)).save(buf, "JPEG")
+    buf.seek(0)
+    with app.test_request_context():
+        veiculo_id = services.salvar_checklist(
+            {"tipo": "Carro", "placa": "UPL0001"}, {"foto_carro": FileStorage(stream=buf, filename="f.jpg")})
+    return conn.execute("SELECT foto_carro FROM veiculos WHERE id = ?", (veiculo_id,)).fetchone()[0]
+
+
+def test_original_com_etag_forte_e_cache_imutavel(client, foto):
+    resp = client.get(f"/uploads/{foto}")
+
+    assert resp.status_code == 200
+    sha256 = foto.rsplit("/", 1)[1].split(".")[0]
+    assert resp.headers["ETag"] == f'"{sha256}"'
+    assert {"public", "immutable", f"max-age={app_module.UPLOADS_MAX_AGE}"} <= {
+        d.strip() for d in resp.headers["Cache-Control"].split(",")}
+    assert Image.open(io.BytesIO(resp.data)).size == (400, 300)
+
+    resp = client.get(f"/uploads/{foto}", headers={"If-None-Match": f'"{sha256}"'})
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+    resp = client.get(f"/uploads/{foto}", headers={"Range": "bytes=0-9"})
+    assert resp.status_code == 206
+    assert len(resp.data) == 10
+
+
+def test_caminhos_fora_do_store_dao_404(client):
+    assert client.get("/uploads/tmp/qualquer").status_code == 404
+    assert client.get("/uploads/../checklist.db").status_code == 404
+    assert client.get("/uploads/nao/existe.jpg").status_code == 404
+
+
+def test_com_accel_o_servidor_web_entrega_os_bytes(client, foto, monkeypatch):
+    monkeypatch.setattr(app_module, "UPLOADS_ACCEL", "nginx")
+
+    resp = client.get(f"/uploads/{foto}")
+    assert resp.status_code == 200
+    assert resp.headers["X-Accel-Redirect"] == app_module.UPLOADS_ACCEL_PREFIX + foto
+    assert resp.data == b""
+
+    resp = client.get(f"/uploads/{foto}", headers={"If-None-Match": resp.headers["ETag"]})
+    assert resp.status_code == 304
+    assert "X-Accel-Redirect" not in resp.headers
+
+
+def test_variante_redimensionada_e_guardada_no_cache(client, foto):
+    original = client.get(f"/uploads/{foto}").headers["ETag"]
+
+    resp = client.get(f"/uploads/{foto}?w=160")
+    assert resp.status_code == 200
+    assert resp.mimetype == "image/jpeg"
+    img = Image.open(io.BytesIO(resp.data))
+    assert (img.format, img.size) == ("JPEG", (160, 120))
+    assert resp.headers["ETag"] not in (original, "")
+    assert "immutable" in resp.headers["Cache-Control"]
+
+    gerados = variantes.stats()["generated"]
+    repetido = client.get(f"/uploads/{foto}?w=160", headers={"If-None-Match": resp.headers["ETag"]})
+    assert repetido.status_code == 304
+    assert client.get(f"/uploads/{foto}?w=160").data == resp.data
+    assert variantes.stats()["generated"] == gerados
+
+    webp = client.get(f"/uploads/{foto}?w=160&fmt=webp")
+    assert webp.status_code == 200
+    assert Image.open(io.BytesIO(webp.data)).format == "WEBP"
+    assert webp.headers["ETag"] != resp.headers["ETag"]
+
+
+def test_variante_com_parametros_invalidos(client, foto):
+    assert client.get(f"/uploads/{foto}?w=161").status_code == 400
+    assert client.get(f"/uploads/{foto}?w=160&fmt=gif").status_code == 400
+    assert client.get(f"/uploads/{foto}?fmt=png").status_code == 400
+
+
+def test_variante_de_arquivo_que_nao_e_imagem(client):
+    caminho = os.path.join(ANEXOS_DIR, "legado_nao_imagem.jpg")
+    with open(caminho, "wb") as fh:
+        fh.write(b"nao sou uma imagem")
+
+    assert client.get("/uploads/legado_nao_imagem.jpg?w=160").status_code == 415
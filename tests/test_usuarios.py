@@ -0,0 +1,38 @@
+from cache import usuarios
+from models import User
+
+
+def test_user_loader_usa_o_cache_e_as_escritas_invalidam(app, usuario):
+    with app.app_context():
+        usuarios.invalidar(usuario.id)
+        misses = usuarios.misses
+
+        primeiro = User.get_cached(str(usuario.id))
+        segundo = User.get_cached(usuario.id)
+        assert usuarios.misses == misses + 1
+        assert primeiro is not segundo  # cada requisição recebe sua própria instância
+
+        segundo.update_profile(email="novo@example.com")
+        assert User.get_cached(usuario.id).email == "novo@example.com"
+
+        segundo.set_reset_token("tok", "2099-01-01 00:00:00")
+        assert User.get_cached(usuario.id).reset_token == "tok"
+
+        segundo.set_password("senha")
+        recarregado = User.get_cached(usuario.id)
+        assert recarregado.reset_token is None
+        assert recarregado.check_password("senha")
+
+
+def test_user_loader_com_id_invalido(app):
+    with app.app_context():
+        assert User.get_cached("abc") is None
+        assert User.get_cached(999999) is None
+
+
+def test_user_loader_devolve_o_mesmo_que_user_get(app, usuario):
+    with app.app_context():
+        usuarios.invalidar(usuario.id)
+        assert vars(User.get_cached(usuario.id)) == vars(User.get(usuario.id))
+        # também quando vem do cache
+        assert vars(User.get_cached(usuario.id)) == vars(User.get(usuario.id))